@@ -1,12 +1,17 @@
 # app.py - Progetto Business Plan Pro - versione 1.3 - 2025-06-21
+# MODIFICA 2026-10-17: tolti gli import inutilizzati (pandas, AuthManager): la pagina iniziale
+# carica solo streamlit e i moduli del database (misura: benchmark_avvio.py)
 import streamlit as st
-import sqlite3
-import pandas as pd
+import database
+import migrations
 import sidebar_filtri 
-from auth import AuthManager, get_current_database
+from auth import get_current_database
 
 st.set_page_config(page_title="Business Plan Pro", layout="wide")
 
+# Aggiorna lo schema di tutti i database utente (una sola volta per processo: i pool restano in cache)
+migrations.migra_tutti()
+
 # Controllo autenticazione
 if 'authenticated' in st.session_state and st.session_state.authenticated:
     
@@ -68,7 +73,7 @@ if 'authenticated' in st.session_state and st.session_state.authenticated:
     # Mostra statistiche database utente
     with st.expander("📊 I tuoi dati"):
         try:
-            conn = sqlite3.connect(get_current_database())
+            conn = database.connetti(get_current_database())
             
             # Conta record nelle tabelle principali
             cursor = conn.cursor()
@@ -1,9 +1,10 @@
 # auth.py - Sistema di autenticazione con database separati per utente
+# MODIFICA 2026-10-17: connessioni dal pool condiviso (database.py)
 import streamlit as st
 import hashlib
 import sqlite3
+import database
 import os
-import shutil
 from datetime import datetime
 
 class AuthManager:
@@ -13,7 +14,7 @@ class AuthManager:
     
     def init_users_database(self):
         """Inizializza il database degli utenti"""
-        conn = sqlite3.connect(self.users_db)
+        conn = database.connetti(self.users_db)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -37,7 +38,7 @@ class AuthManager:
     
     def get_user_db_name(self, username):
         """Restituisce il nome del database per un utente"""
-        return f"business_plan_{username}.db"
+        return database.database_utente(username)
     
     def create_user_database(self, username):
         """Crea database personale per un nuovo utente"""
@@ -46,12 +47,12 @@ class AuthManager:
         if os.path.exists(user_db):
             return user_db
         
-        # Copia il database principale come template
+        # Copia il database principale come template (backup SQLite: coerente anche in modalità WAL)
         if os.path.exists("business_plan_pro.db"):
-            shutil.copy2("business_plan_pro.db", user_db)
+            database.copia_database("business_plan_pro.db", user_db)
             
             # Svuota le tabelle dati ma mantieni struttura e configurazioni
-            conn = sqlite3.connect(user_db)
+            conn = database.connetti(user_db)
             cursor = conn.cursor()
             
             # Svuota solo le tabelle con dati utente
@@ -64,6 +65,7 @@ class AuthManager:
             
             conn.commit()
             conn.close()
+            # Lo schema (chiavi e indici) è quello del template, già migrato all'apertura del suo pool
             
             print(f"Database creato per utente: {username}")
         else:
@@ -74,7 +76,7 @@ class AuthManager:
     def register_user(self, username, email, password):
         """Registra un nuovo utente e crea il suo database"""
         try:
-            conn = sqlite3.connect(self.users_db)
+            conn = database.connetti(self.users_db)
             cursor = conn.cursor()
             
             password_hash = self.hash_password(password)
@@ -98,7 +100,7 @@ class AuthManager:
     
     def authenticate_user(self, username, password):
         """Autentica un utente"""
-        conn = sqlite3.connect(self.users_db)
+        conn = database.connetti(self.users_db)
         cursor = conn.cursor()
         
         password_hash = self.hash_password(password)
@@ -220,10 +222,7 @@ def register_form():
 
 def get_current_database():
     """Restituisce il database dell'utente corrente"""
-    username = st.session_state.get('username')
-    if username:
-        return f"business_plan_{username}.db"
-    return "business_plan_pro.db"
+    return database.database_utente(st.session_state.get('username'))
 
 def main_auth():
     """Gestisce autenticazione principale"""
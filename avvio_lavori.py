@@ -0,0 +1,50 @@
+# avvio_lavori.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Processo ospite del pool di lavori (worker_pool), avviato dal server Streamlit con
+# "python -m avvio_lavori <processi>" al primo lavoro inviato.
+# I processi 'spawn' rieseguono il modulo __main__ del processo che li avvia: nel server è la
+# pagina Streamlit in esecuzione, qui è questo modulo, che fuori da main() non esegue nulla.
+# L'ospite crea una sola volta il contesto 'spawn', il dizionario condiviso e il pool di
+# processi (PoolLavori) ed espone il registro dei lavori al server tramite un BaseManager su
+# localhost, protetto da una chiave casuale ricevuta sullo standard input.
+# Protocollo di avvio: il server scrive la chiave (esadecimale) su stdin, l'ospite risponde con
+# "host:porta" su stdout; poi stdout è rediretto su stderr (i messaggi dei lavori finiscono
+# nella console del server) e la chiusura di stdin segnala che il server è terminato.
+
+import os
+import sys
+import threading
+
+import worker_pool
+
+
+def _attendi_chiusura_server(pool: worker_pool.PoolLavori) -> None:
+    """
+    Resta in lettura su stdin: a fine file (server terminato) annulla i lavori, attende che i
+    processi di calcolo si fermino (al prossimo progresso()) ed esce
+    """
+    sys.stdin.read()
+    for id_lavoro in pool.lavori():
+        pool.annulla(id_lavoro)
+    pool.chiudi()
+    os._exit(0)
+
+
+def main() -> None:
+    processi = int(sys.argv[1]) if len(sys.argv) > 1 else worker_pool.PROCESSI_MAX
+    chiave = bytes.fromhex(sys.stdin.readline().strip())
+
+    pool = worker_pool.PoolLavori(processi)
+    pool.avvia()  # contesto 'spawn', Manager e processi creati una volta, all'avvio dell'ospite
+    worker_pool.GestorePool.register('pool', callable=lambda: pool, exposed=worker_pool.METODI_POOL)
+    server = worker_pool.GestorePool(address=('127.0.0.1', 0), authkey=chiave).get_server()
+
+    host, porta = server.address
+    print(f"{host}:{porta}", flush=True)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    threading.Thread(target=_attendi_chiusura_server, args=(pool,), daemon=True).start()
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
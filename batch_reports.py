@@ -0,0 +1,264 @@
+# batch_reports.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Esportazione in blocco dei report di tutti i clienti di un database, senza Streamlit
+# (per esempio di notte, alla chiusura dell'esercizio).
+# Per ogni cliente vengono calcolati Conto Economico, Stato Patrimoniale e Flussi
+# (financial_model.calculate_all_reports, stesse strutture delle pagine 4-6) e, con
+# --business-plan, il Business Plan con le assumption predefinite: medie storiche del
+# cliente, o valori di default dove lo storico non basta (come nello step 2 della pagina 8
+# senza modifiche). I file Excel, PDF e CSV sono scritti in una sottocartella per cliente;
+# riepilogo.csv elenca per cliente esito, anni, file prodotti ed eventuali errori.
+# I clienti sono elaborati in parallelo da un pool di processi (uno per core: lo script è
+# il modulo principale, non una pagina); se il pool non è disponibile si procede un cliente alla volta.
+# I CSV usano il punto e virgola e la virgola decimale, con importi arrotondati ai centesimi
+# (apertura diretta in Excel italiano).
+#
+# Uso: python batch_reports.py [--database business_plan_pro.db | --utente nome] [--output cartella]
+#          [--clienti A B ...] [--anni 2023 2024 ...] [--formati xlsx pdf csv]
+#          [--business-plan] [--durata 10] [--processi N]
+# Esce con codice 1 se l'esportazione di almeno un cliente non è riuscita.
+
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+import database
+import export_service
+import financial_model
+from compute_context import ContestoCalcolo
+from metadati_filtri import metadati_filtri
+
+FORMATI = ('xlsx', 'pdf', 'csv')
+DURATA_DEFAULT = 10
+
+# (nome file, chiave in calculate_all_reports, titolo, struttura, quota della prima colonna nel PDF)
+REPORT_STORICI = (
+    ('conto_economico', 'ce_export', "Report Conto Economico Riclassificato", financial_model.report_structure_ce, 0.5),
+    ('stato_patrimoniale', 'sp_export', "Report Stato Patrimoniale Riclassificato", financial_model.report_structure_sp, 0.4),
+    ('flussi_finanziari', 'ff_export', "Report Flussi Finanziari", financial_model.report_structure_ff, 0.5),
+)
+
+# (nome file, metodo di BusinessPlanProjections, titolo)
+REPORT_BUSINESS_PLAN = (
+    ('business_plan_conto_economico', 'get_report_ce_proiezioni', "Business Plan - Conto Economico"),
+    ('business_plan_stato_patrimoniale', 'get_report_sp_proiezioni', "Business Plan - Stato Patrimoniale"),
+    ('business_plan_flussi', 'get_report_full_cf_proiezioni', "Business Plan - Flussi di Cassa"),
+)
+
+COLONNE_RIEPILOGO = ('cliente', 'esito', 'anni', 'file', 'secondi', 'errore')
+
+
+def nome_cartella(cliente: str) -> str:
+    """Nome di cartella valido su Windows, macOS e Linux per il nome del cliente"""
+    nome = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', str(cliente)).strip().rstrip('.')
+    return nome or '_'
+
+
+def formatta_valore_bp(valore) -> str:
+    """Importi del Business Plan come nella pagina 8; intestazioni e testi invariati"""
+    return financial_model.format_number(valore) if pd.api.types.is_number(valore) else str(valore)
+
+
+def scrivi_report(cartella: str, nome: str, df: pd.DataFrame, formati: Sequence[str], titolo: str,
+                  intestazione: str, opzioni_pdf: Dict) -> List[str]:
+    """Scrive il report nei formati richiesti; restituisce i percorsi dei file creati"""
+    if df is None or df.empty:
+        return []
+    colonne_numeriche = [c for c in df.columns if c != 'Voce']
+    scritti = []
+    for formato in formati:
+        percorso = os.path.join(cartella, f"{nome}.{formato}")
+        if formato == 'xlsx':
+            contenuto = export_service.excel_tabella(df, titolo[:31], colonne_numeriche=colonne_numeriche)
+        elif formato == 'pdf':
+            contenuto = export_service.report_pdf(df, titolo, intestazione, **opzioni_pdf)
+        else:
+            # le righe di intestazione del Business Plan ('') rendono le colonne di tipo object, a cui
+            # decimal=',' non si applica: valori convertiti in numeri (celle vuote per le intestazioni)
+            # e arrotondati ai centesimi; + 0.0 evita "-0,00"
+            valori = df.copy()
+            valori[colonne_numeriche] = valori[colonne_numeriche].apply(pd.to_numeric, errors='coerce').round(2) + 0.0
+            valori.to_csv(percorso, index=False, sep=';', decimal=',', float_format='%.2f', encoding='utf-8-sig')
+            scritti.append(percorso)
+            continue
+        with open(percorso, 'wb') as f:
+            f.write(contenuto)
+        scritti.append(percorso)
+    return scritti
+
+
+def proiezioni_predefinite(contesto: ContestoCalcolo, anni_storici: List[int], durata: int = DURATA_DEFAULT):
+    """
+    BusinessPlanProjections dall'ultimo anno storico con le assumption predefinite: per ogni
+    anno del piano la media storica del cliente, altrimenti il valore di default
+    """
+    from business_plan_assumptions import ASSUMPTION_DEFINITIONS, BusinessPlanAssumptions, genera_anni_business_plan
+    from business_plan_projections import BusinessPlanProjections
+
+    assumptions = BusinessPlanAssumptions(contesto.cliente, contesto)
+    dati_storici = assumptions.carica_dati_storici(anni_storici)
+    medie = assumptions.calcola_medie_storiche(anni_storici)
+    anno_base = max(anni_storici)
+    anni_bp = genera_anni_business_plan(anno_base, durata)
+    assumptions.imposta_assumptions_manuali({
+        a['id']: {anno: float(medie.get(a['id'], a['default_value'])) for anno in anni_bp[1:]}
+        for a in ASSUMPTION_DEFINITIONS
+    })
+    bp_projections = BusinessPlanProjections(contesto.cliente, anno_base, durata, assumptions=assumptions,
+                                             metodo_pfn='analitico', contesto=contesto)
+    bp_projections.inizializza_con_dati_storici(dati_storici)
+    bp_projections.calcola_proiezioni(motore='numpy')
+    return bp_projections
+
+
+def esporta_cliente(contesto: ContestoCalcolo, anni: List[int], cartella_output: str, formati: Sequence[str],
+                    durata: Optional[int] = None) -> Dict:
+    """
+    Calcola ed esporta i report di un cliente (eseguita nei processi del pool).
+    durata=None: solo i report storici. Restituisce la riga del riepilogo.
+    """
+    inizio = time.perf_counter()
+    cliente = contesto.cliente
+    esito = {'cliente': cliente, 'esito': 'ok', 'anni': ' '.join(map(str, anni)), 'file': 0, 'secondi': 0.0, 'errore': ''}
+    try:
+        cartella = os.path.join(cartella_output, nome_cartella(cliente))
+        os.makedirs(cartella, exist_ok=True)
+
+        with database.connessione(contesto.database) as conn:
+            df_full_data = financial_model.carica_totali_id_ri(conn, anni, cliente)
+        reports = financial_model.calculate_all_reports(
+            df_full_data, anni,
+            financial_model.report_structure_ce, financial_model.report_structure_sp, financial_model.report_structure_ff)
+        if 'error' in reports:
+            raise ValueError(reports['error'])
+
+        intestazione = f"<b>Filtri applicati:</b> Cliente: {cliente} | Anno: {', '.join(map(str, anni))}"
+        file_scritti = []
+        for nome, chiave, titolo, struttura, quota_prima in REPORT_STORICI:
+            file_scritti += scrivi_report(cartella, nome, reports[chiave], formati, titolo, intestazione,
+                                          dict(struttura=struttura, formatta=financial_model.format_number,
+                                               quota_prima=quota_prima))
+
+        if durata:
+            from reportlab.lib.pagesizes import A4, landscape
+            bp_projections = proiezioni_predefinite(contesto, anni, durata)
+            anni_bp = bp_projections.anni_bp
+            intestazione_bp = f"{cliente} | Periodo: {anni_bp[0]}-{anni_bp[-1]} | Assumption: medie storiche"
+            opzioni_pdf = dict(formatta=formatta_valore_bp, colonne_testo=['Voce'], quota_prima=0.4, stile='griglia',
+                               pagesize=landscape(A4),
+                               margini=dict(topMargin=20, bottomMargin=20, leftMargin=25, rightMargin=25))
+            for nome, metodo, titolo in REPORT_BUSINESS_PLAN:
+                file_scritti += scrivi_report(cartella, nome, getattr(bp_projections, metodo)(), formati, titolo,
+                                              intestazione_bp, opzioni_pdf)
+
+        esito['file'] = len(file_scritti)
+    except Exception as e:
+        esito.update({'esito': 'errore', 'errore': f"{type(e).__name__}: {e}"})
+    esito['secondi'] = round(time.perf_counter() - inizio, 2)
+    return esito
+
+
+def clienti_da_esportare(percorso_db: str, clienti: Optional[Sequence[str]] = None,
+                         anni: Optional[Sequence[int]] = None) -> Dict[str, List[int]]:
+    """Cliente -> anni (crescenti) da esportare; anni vuoto se il cliente non ha dati per gli anni richiesti"""
+    metadati = metadati_filtri(percorso_db)
+    selezionati = list(clienti) if clienti else metadati.clienti
+    risultato = {}
+    for cliente in selezionati:
+        disponibili = sorted(int(a) for a in metadati.anni(cliente))
+        risultato[cliente] = [a for a in disponibili if not anni or a in anni]
+    return risultato
+
+
+def esegui(contesti_anni: Dict[ContestoCalcolo, List[int]], cartella_output: str, formati: Sequence[str],
+           durata: Optional[int] = None, n_processi: Optional[int] = None) -> List[Dict]:
+    """Esporta tutti i clienti; n_processi=None usa tutti i core, 1 elabora nel processo corrente"""
+    lavori = [(contesto, anni) for contesto, anni in contesti_anni.items() if anni]
+    esiti = []
+
+    def registra(esito: Dict) -> None:
+        esiti.append(esito)
+        dettaglio = f"{esito['file']} file" if esito['esito'] == 'ok' else esito['errore']
+        print(f"[{len(esiti)}/{len(contesti_anni)}] {esito['cliente']}: {esito['esito']}"
+              f"{f' - {dettaglio}' if dettaglio else ''} ({esito['secondi']:.1f} s)", flush=True)
+
+    for contesto, anni in contesti_anni.items():
+        if not anni:
+            registra({'cliente': contesto.cliente, 'esito': 'nessun dato', 'anni': '', 'file': 0, 'secondi': 0.0, 'errore': ''})
+    n_processi = min(n_processi or os.cpu_count() or 1, len(lavori))
+    completati = set()
+    if n_processi > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=n_processi) as pool:
+                futures = {pool.submit(esporta_cliente, contesto, anni, cartella_output, formati, durata): contesto
+                           for contesto, anni in lavori}
+                for future in as_completed(futures):
+                    registra(future.result())
+                    completati.add(futures[future])
+        except (OSError, RuntimeError) as e:
+            print(f"⚠️ Pool di processi non disponibile, elaborazione in linea: {e}")
+    for contesto, anni in lavori:
+        if contesto not in completati:
+            registra(esporta_cliente(contesto, anni, cartella_output, formati, durata))
+    return esiti
+
+
+def scrivi_riepilogo(cartella_output: str, esiti: List[Dict]) -> str:
+    percorso = os.path.join(cartella_output, 'riepilogo.csv')
+    with open(percorso, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=COLONNE_RIEPILOGO, delimiter=';')
+        writer.writeheader()
+        writer.writerows(sorted(esiti, key=lambda e: str(e['cliente'])))
+    return percorso
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Report CE, SP, flussi (e Business Plan) per tutti i clienti di un database")
+    sorgente = parser.add_mutually_exclusive_group()
+    sorgente.add_argument('--database', default=None, help=f"database da esportare (predefinito: {database.DATABASE_PREDEFINITO})")
+    sorgente.add_argument('--utente', default=None, help="usa il database personale dell'utente")
+    parser.add_argument('--output', default=None, help="cartella dei file (predefinita: report_AAAAMMGG_HHMM)")
+    parser.add_argument('--clienti', nargs='+', default=None, help="clienti da esportare (predefinito: tutti)")
+    parser.add_argument('--anni', nargs='+', type=int, default=None, help="anni da esportare (predefinito: tutti quelli del cliente)")
+    parser.add_argument('--formati', nargs='+', choices=FORMATI, default=list(FORMATI))
+    parser.add_argument('--business-plan', action='store_true', help="aggiunge il Business Plan con le assumption predefinite")
+    parser.add_argument('--durata', type=int, default=DURATA_DEFAULT, help="anni di proiezione del Business Plan")
+    parser.add_argument('--processi', type=int, default=None, help="processi in parallelo (predefinito: uno per core)")
+    args = parser.parse_args(argv)
+
+    contesto = ContestoCalcolo.per_utente(args.utente) if args.utente else ContestoCalcolo(database=args.database or database.DATABASE_PREDEFINITO)
+    if not os.path.exists(contesto.database):
+        print(f"Database non trovato: {contesto.database}")
+        return 1
+    cartella_output = args.output or f"report_{datetime.now().strftime('%Y%m%d_%H%M')}"
+    os.makedirs(cartella_output, exist_ok=True)
+
+    clienti = clienti_da_esportare(contesto.database, args.clienti, args.anni)
+    if not clienti:
+        print(f"Nessun cliente nel database {contesto.database}")
+        return 1
+    print(f"Database: {contesto.database} - {len(clienti)} clienti - formati: {', '.join(args.formati)}"
+          f"{f' - Business Plan a {args.durata} anni' if args.business_plan else ''} - output: {cartella_output}")
+
+    inizio = time.perf_counter()
+    esiti = esegui({contesto.con_cliente(cliente): anni for cliente, anni in clienti.items()}, cartella_output,
+                   args.formati, args.durata if args.business_plan else None, args.processi)
+    riepilogo = scrivi_riepilogo(cartella_output, esiti)
+
+    errori = [e['cliente'] for e in esiti if e['esito'] == 'errore']
+    print(f"\n{sum(e['file'] for e in esiti)} file in {time.perf_counter() - inizio:.1f} s - riepilogo: {riepilogo}")
+    if errori:
+        print(f"Esportazione non riuscita per: {', '.join(map(str, errori))}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
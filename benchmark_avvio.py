@@ -0,0 +1,131 @@
+# benchmark_avvio.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Tempo di avvio dell'app e delle pagine misurato con python -X importtime.
+# Per ogni script (app.py e pages/*.py) vengono importati, in un processo Python nuovo,
+# i moduli che lo script carica all'apertura: gli import di primo livello, compresi quelli
+# in try/if, esclusi quelli dentro le funzioni (caricati solo quando la funzione viene usata).
+# I moduli comuni a tutte le pagine (streamlit, pandas, numpy) sono importati per primi: il
+# tempo cumulato di ciascun modulo della pagina è allora il suo costo aggiuntivo, e la loro
+# somma (mediana di più ripetizioni) è confrontata con l'obiettivo.
+# Lo stesso grafo di import vale per l'eseguibile PyInstaller (app.spec): meno moduli caricati
+# all'avvio significano meno moduli da estrarre e inizializzare anche nella versione congelata.
+#
+# Uso: python benchmark_avvio.py [--ripetizioni 5] [--obiettivo-ms 150] [--dettaglio 5] [script ...]
+# Esce con codice 1 se uno script supera l'obiettivo.
+
+import argparse
+import ast
+import glob
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+CARTELLA = os.path.dirname(os.path.abspath(__file__))
+
+# Costo aggiuntivo massimo (ms) rispetto alla base comune, per app.py e ogni pagina
+OBIETTIVO_MS = 150
+
+BASE = ['streamlit', 'pandas', 'numpy']
+
+_RIGA_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| *(\S+)')
+
+
+def moduli_avvio(percorso: str) -> List[str]:
+    """Moduli importati al caricamento dello script (import di primo livello, anche in try/if/with)"""
+    with open(percorso, encoding='utf-8') as f:
+        albero = ast.parse(f.read(), filename=percorso)
+
+    moduli = []
+
+    def visita(nodi):
+        for nodo in nodi:
+            if isinstance(nodo, ast.Import):
+                moduli.extend(alias.name for alias in nodo.names)
+            elif isinstance(nodo, ast.ImportFrom) and nodo.module and not nodo.level:
+                moduli.append(nodo.module)
+            elif isinstance(nodo, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            else:
+                for campo in ('body', 'orelse', 'finalbody'):
+                    visita(getattr(nodo, campo, []))
+                for gestore in getattr(nodo, 'handlers', []):
+                    visita(gestore.body)
+
+    visita(albero.body)
+    return list(dict.fromkeys(moduli))
+
+
+def _importa(moduli: List[str]) -> Tuple[float, Dict[str, float]]:
+    """Un processo nuovo con -X importtime: (totale ms, ms cumulati di ciascun modulo richiesto)"""
+    # import diretti (non importlib.import_module, che -X importtime non riporta per il modulo richiesto)
+    codice = "".join(f"try:\n    import {m}\nexcept ImportError:\n    pass\n" for m in moduli)
+    esito = subprocess.run([sys.executable, '-X', 'importtime', '-c', codice],
+                           cwd=CARTELLA, capture_output=True, text=True)
+    totale = 0
+    richiesti = set(moduli)
+    pacchetti = {}
+    for riga in esito.stderr.splitlines():
+        trovata = _RIGA_IMPORTTIME.match(riga)
+        if not trovata:
+            continue
+        proprio, cumulato, nome = trovata.groups()
+        totale += int(proprio)
+        # Tempo cumulato del modulo richiesto: comprende solo le dipendenze non ancora caricate
+        if nome in richiesti:
+            pacchetti[nome] = int(cumulato) / 1000
+    return totale / 1000, pacchetti
+
+
+def misura(moduli: List[str], ripetizioni: int) -> Tuple[float, Dict[str, float]]:
+    """
+    Mediane su più processi: tempo totale degli import dello script (nel suo ordine) e
+    costo aggiuntivo di ciascun modulo non comune (importato dopo la base comune)
+    """
+    totali = [_importa(moduli)[0] for _ in range(ripetizioni)]
+    dopo_base = list(dict.fromkeys(BASE + list(moduli)))
+    prove = [_importa(dopo_base)[1] for _ in range(ripetizioni)]
+    pacchetti = {}
+    for nome in set().union(*prove) - set(BASE):
+        pacchetti[nome] = statistics.median(p.get(nome, 0.0) for p in prove)
+    return statistics.median(totali), pacchetti
+
+
+def script_predefiniti() -> List[str]:
+    return [os.path.join(CARTELLA, 'app.py')] + sorted(glob.glob(os.path.join(CARTELLA, 'pages', '*.py')))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tempo di import all'avvio di app.py e delle pagine")
+    parser.add_argument('script', nargs='*', help="script da misurare (predefinito: app.py e pages/*.py)")
+    parser.add_argument('--ripetizioni', type=int, default=5)
+    parser.add_argument('--obiettivo-ms', type=float, default=OBIETTIVO_MS,
+                        help="costo aggiuntivo massimo rispetto alla base comune (ms)")
+    parser.add_argument('--dettaglio', type=int, default=5, help="moduli più lenti mostrati per script")
+    args = parser.parse_args(argv)
+
+    base = statistics.median(_importa(BASE)[0] for _ in range(args.ripetizioni))
+    print(f"Base (import {', '.join(BASE)}): {base:.0f} ms - obiettivo aggiuntivo: {args.obiettivo_ms:.0f} ms\n")
+
+    fuori_obiettivo = []
+    for percorso in args.script or script_predefiniti():
+        nome = os.path.relpath(percorso, CARTELLA)
+        totale, pacchetti = misura(moduli_avvio(percorso), args.ripetizioni)
+        aggiuntivo = sum(pacchetti.values())
+        esito = "OK" if aggiuntivo <= args.obiettivo_ms else "OLTRE OBIETTIVO"
+        if esito != "OK":
+            fuori_obiettivo.append(nome)
+        print(f"{nome:45s} {totale:8.0f} ms  (+{aggiuntivo:.0f} ms)  {esito}")
+        piu_lenti = sorted(((ms, m) for m, ms in pacchetti.items()), reverse=True)
+        for ms, modulo in piu_lenti[:args.dettaglio]:
+            print(f"    {modulo:41s} {ms:8.0f} ms")
+
+    if fuori_obiettivo:
+        print(f"\nOltre l'obiettivo: {', '.join(fuori_obiettivo)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
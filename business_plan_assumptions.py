@@ -1,22 +1,25 @@
 # business_plan_assumptions.py - VERSIONE DEFINITIVA E CORRETTA - basata su originale
 # Corretti tutti gli errori di sintassi precedenti.
+# MODIFICA 2026-10-17: dati storici letti da righe_agg (financial_model.carica_totali_id_ri)
+# MODIFICA 2026-10-17: niente streamlit né session_state all'import (modulo usato anche dai processi
+# di montecarlo): il database dell'utente viene letto al momento della query
+# MODIFICA 2026-10-17: formule storiche compilate una volta (AST validato, niente eval per anno)
+# e valutate su tutti gli anni insieme (FormulaStorica, medie_storiche)
+# MODIFICA 2026-10-17: dati storici e anni letti dal cursore (financial_model.carica_totali_per_anno),
+# aggregati in SQLite con anni interi, senza pivot in pandas
+# MODIFICA 2026-10-17: database e cliente da un ContestoCalcolo passato esplicitamente (compute_context):
+# il modulo non dipende più dalla sessione Streamlit
+
+import ast
+import re
 
 import pandas as pd
 import numpy as np
-import sqlite3
-import streamlit as st
+import database
+import financial_model
+from compute_context import ContestoCalcolo
 from typing import Dict, List, Tuple, Optional
 
-# Nome del database
-def get_database_name():
-    """Restituisce il database dell'utente corrente"""
-    username = st.session_state.get('username')
-    if username:
-        return f"business_plan_{username}.db"
-    return "business_plan_pro.db"
-
-DATABASE_NAME = get_database_name()
-
 # --- DEFINIZIONE DELLE ASSUMPTION ---
 ASSUMPTION_DEFINITIONS = [
     {
@@ -256,6 +259,121 @@ ASSUMPTION_DEFINITIONS = [
     }
 ]
 
+# Indice per id, evita scansioni lineari di ASSUMPTION_DEFINITIONS
+ASSUMPTION_BY_ID = {a['id']: a for a in ASSUMPTION_DEFINITIONS}
+
+
+# --- FORMULE STORICHE COMPILATE ---
+_NOME_FORMULA = re.compile(r'^(RI\d+)(?:_(current|previous))?$')
+_NODI_AMMESSI = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Add, ast.Sub, ast.Mult, ast.Div,
+                 ast.UAdd, ast.USub, ast.Constant, ast.Name, ast.Load)
+
+
+class FormulaStorica:
+    """
+    Una formula_storica compilata una sola volta. Sono ammessi solo numeri, codici RI,
+    + - * / e parentesi: ogni altro costrutto solleva ValueError alla compilazione.
+    I codici 'RIxx_current' / 'RIxx_previous' indicano il valore dell'anno e dell'anno
+    precedente (0 se l'anno precedente non è tra i dati storici).
+    La formula viene valutata una volta su colonne NumPy con tutti gli anni.
+    """
+
+    def __init__(self, formula: str, scala: float = 1.0):
+        albero = ast.parse(formula, mode='eval')
+        self.riferimenti = {}  # nome nella formula -> (codice RI, sfasamento in anni)
+        for nodo in ast.walk(albero):
+            if not isinstance(nodo, _NODI_AMMESSI):
+                raise ValueError(f"Formula storica non ammessa ({type(nodo).__name__}): {formula}")
+            if isinstance(nodo, ast.Constant) and (isinstance(nodo.value, bool) or not isinstance(nodo.value, (int, float))):
+                raise ValueError(f"Costante non numerica nella formula storica: {formula}")
+            if isinstance(nodo, ast.Name):
+                trovato = _NOME_FORMULA.match(nodo.id)
+                if not trovato:
+                    raise ValueError(f"Riferimento sconosciuto '{nodo.id}' nella formula storica: {formula}")
+                self.riferimenti[nodo.id] = (trovato.group(1), 1 if trovato.group(2) == 'previous' else 0)
+        self.formula = formula
+        self.scala = scala
+        self._codice = compile(albero, f'<formula_storica {formula}>', 'eval')
+
+    def valuta(self, dati_storici: Dict, anni: List[int], colonne_calcolate: Optional[Dict] = None) -> np.ndarray:
+        """
+        Valori della formula per gli anni indicati (float; inf/nan dove il denominatore è zero).
+        colonne_calcolate: cache (codice, sfasamento) -> colonna condivisa tra più formule.
+        """
+        if colonne_calcolate is None:
+            colonne_calcolate = {}
+        colonne = {}
+        for nome, chiave in self.riferimenti.items():
+            colonna = colonne_calcolate.get(chiave)
+            if colonna is None:
+                codice, sfasamento = chiave
+                colonna = colonne_calcolate[chiave] = np.array(
+                    [float(dati_storici.get(anno - sfasamento, {}).get(codice, 0.0)) for anno in anni], dtype=np.float64)
+            colonne[nome] = colonna
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            risultato = np.broadcast_to(eval(self._codice, {'__builtins__': {}}, colonne), (len(anni),))
+            return risultato * self.scala if self.scala != 1.0 else np.array(risultato, dtype=np.float64)
+
+
+_FORMULE_COMPILATE = {}
+
+
+def compila_formula_storica(formula: str) -> FormulaStorica:
+    """
+    FormulaStorica dalla cache (compilata alla prima richiesta). Scala 100 se la prima
+    assumption con questa formula è di tipo 'percentuale'.
+    """
+    compilata = _FORMULE_COMPILATE.get(formula)
+    if compilata is None:
+        assumption = next((a for a in ASSUMPTION_DEFINITIONS if a['formula_storica'] == formula), None)
+        scala = 100.0 if assumption and assumption['tipo'] == 'percentuale' else 1.0
+        compilata = _FORMULE_COMPILATE[formula] = FormulaStorica(formula, scala)
+    return compilata
+
+
+def valori_storici(dati_storici: Dict, anni_storici: List[int]) -> Dict[int, np.ndarray]:
+    """
+    Valori anno per anno di tutte le formule storiche, in un passaggio per formula.
+    Solo gli anni presenti in dati_storici; i valori non finiti (divisioni per zero) sono esclusi.
+    """
+    anni = [anno for anno in anni_storici if anno in dati_storici]
+    colonne_calcolate = {}
+    valori = {}
+    for assumption in ASSUMPTION_DEFINITIONS:
+        formula = assumption['formula_storica']
+        if not formula or formula == 'None':
+            continue
+        try:
+            risultato = compila_formula_storica(formula).valuta(dati_storici, anni, colonne_calcolate)
+            valori[assumption['id']] = risultato[np.isfinite(risultato)]
+        except Exception as e:
+            print(f"Errore nella formula {formula}: {e}")
+    return valori
+
+
+def medie_storiche(dati_storici: Dict, anni_storici: List[int]) -> Dict[int, float]:
+    """
+    Media storica di ogni assumption (default se la formula manca o non ha valori).
+    Per 'percentuale_incremento' la media delle crescite % tra valori consecutivi.
+    dati_storici: {anno: {ID_RI: importo}}; per finestre mobili basta passare anni diversi.
+    """
+    valori = valori_storici(dati_storici, anni_storici)
+    medie = {}
+    for assumption in ASSUMPTION_DEFINITIONS:
+        ass_id = assumption['id']
+        valori_anni = valori.get(ass_id)
+        if valori_anni is None or not len(valori_anni):
+            medie[ass_id] = assumption['default_value']
+        elif assumption['tipo'] == 'percentuale_incremento':
+            # Per i ricavi, calcola la crescita media
+            precedenti, successivi = valori_anni[:-1], valori_anni[1:]
+            validi = precedenti != 0
+            crescite = ((successivi[validi] / precedenti[validi]) - 1) * 100
+            medie[ass_id] = round(np.mean(crescite), 2) if len(crescite) else assumption['default_value']
+        else:
+            medie[ass_id] = round(np.mean(valori_anni), 2)
+    return medie
+
 # --- MAPPATURA VOCI RI ---
 RI_CODES = {
     'RI01': 'Ricavi dalle vendite e prestazioni',
@@ -297,137 +415,49 @@ RI_CODES = {
 class BusinessPlanAssumptions:
     """Classe per gestire le assumption del Business Plan"""
     
-    def __init__(self, cliente: str):
+    def __init__(self, cliente: str, contesto: Optional[ContestoCalcolo] = None):
+        """contesto: utente e database del calcolo (senza contesto, il database predefinito)"""
+        self.contesto = (contesto or ContestoCalcolo()).con_cliente(cliente)
         self.cliente = cliente
         self.dati_storici = {}
         self.medie_storiche = {}
         self.assumptions = {}
+        self._tabella = None
     
     def carica_dati_storici(self, anni_storici: List[int]) -> Dict:
-        """Carica i dati storici dal database per il calcolo delle medie"""
+        """Carica i dati storici dal database per il calcolo delle medie: {anno: {ID_RI: importo}}"""
         
-        conn = None
         try:
-            conn = sqlite3.connect(DATABASE_NAME)
-            
-            # Query per caricare tutti i dati storici
-            query = """
-            SELECT 
-                r.anno, r.importo, c.ID_RI
-            FROM righe r
-            JOIN conti c ON r.Id_co = c.id_co
-            WHERE r.anno IN ({}) AND r.cliente = ?
-            ORDER BY r.anno, c.ID_RI
-            """.format(','.join(['?' for _ in anni_storici]))
+            # Totali per (anno, ID_RI) sommati in SQLite (righe_agg), già nella forma anno -> ID_RI
+            with database.connessione(self.contesto.database) as conn:
+                totali = financial_model.carica_totali_per_anno(conn, anni_storici, self.cliente)
             
-            params = [str(anno) for anno in anni_storici] + [self.cliente]
-            df = pd.read_sql_query(query, conn, params=params)
-            
-            # Pivot per avere anni come colonne e ID_RI come righe
-            pivot_df = df.pivot_table(
-                index='ID_RI',
-                columns='anno', 
-                values='importo',
-                aggfunc='sum'
-            ).fillna(0)
-            
-            self.dati_storici = pivot_df.to_dict()
+            # Stessi ID_RI in ogni anno caricato (0 dove l'anno non ha righe per quel codice)
+            codici = sorted(set().union(*totali.values())) if totali else []
+            self.dati_storici = {anno: {codice: valori.get(codice, 0) for codice in codici}
+                                 for anno, valori in totali.items()}
             return self.dati_storici
             
         except Exception as e:
             print(f"Errore nel caricamento dati storici: {e}")
             return {}
-        finally:
-            if conn:
-                conn.close()
     
     def calcola_medie_storiche(self, anni_storici: List[int]) -> Dict:
-        """Calcola le medie storiche per tutte le assumption"""
+        """Calcola le medie storiche per tutte le assumption (formule compilate, tutti gli anni insieme)"""
         
         if not self.dati_storici:
             self.carica_dati_storici(anni_storici)
         
-        medie = {}
-        
-        for assumption in ASSUMPTION_DEFINITIONS:
-            ass_id = assumption['id']
-            formula = assumption['formula_storica']
-            
-            try:
-                if formula and formula != 'None':
-                    valori_anni = []
-                    
-                    for anno in anni_storici:
-                        if anno in self.dati_storici:
-                            valore_calcolato = self._calcola_formula_storica(formula, anno)
-                            if valore_calcolato is not None and not np.isnan(valore_calcolato):
-                                valori_anni.append(valore_calcolato)
-                    
-                    if valori_anni:
-                        if assumption['tipo'] == 'percentuale_incremento':
-                            # Per i ricavi, calcola la crescita media
-                            crescite = []
-                            for i in range(1, len(valori_anni)):
-                                if valori_anni[i-1] != 0:
-                                    crescita = ((valori_anni[i] / valori_anni[i-1]) - 1) * 100
-                                    crescite.append(crescita)
-                            media = np.mean(crescite) if crescite else assumption['default_value']
-                        else:
-                            media = np.mean(valori_anni)
-                        
-                        medie[ass_id] = round(media, 2)
-                    else:
-                        medie[ass_id] = assumption['default_value']
-                else:
-                    medie[ass_id] = assumption['default_value']
-                    
-            except Exception as e:
-                print(f"Errore nel calcolo assumption {ass_id}: {e}")
-                medie[ass_id] = assumption['default_value']
-        
-        self.medie_storiche = medie
-        return medie
+        self.medie_storiche = medie_storiche(self.dati_storici, anni_storici)
+        self.invalida_tabella()
+        return self.medie_storiche
     
     def _calcola_formula_storica(self, formula: str, anno: int) -> Optional[float]:
-        """Calcola il valore di una formula per un anno specifico"""
+        """Calcola il valore di una formula per un anno specifico (None se non calcolabile)"""
         
         try:
-            # Sostituisce i codici RI con i valori effettivi
-            formula_eval = formula
-            
-            # Gestione formule speciali
-            if 'RI33_current' in formula and 'RI33_previous' in formula:
-                # Formula per tasso bancario
-                ri33_current = self._get_valore_ri('RI33', anno)
-                ri33_previous = self._get_valore_ri('RI33', anno - 1)
-                ri13 = self._get_valore_ri('RI13', anno)
-                
-                if ri33_current is not None and ri33_previous is not None and ri13 is not None:
-                    media_debiti = (ri33_current + ri33_previous) / 2
-                    if media_debiti != 0:
-                        return (ri13 / media_debiti) * 100
-                return None
-            else:
-                # Sostituisce tutti i codici RI
-                import re
-                codici_ri = re.findall(r'RI\d+', formula)
-                
-                for codice in set(codici_ri):
-                    valore = self._get_valore_ri(codice, anno)
-                    if valore is None:
-                        return None
-                    formula_eval = formula_eval.replace(codice, str(valore))
-                
-                # Valuta la formula
-                result = eval(formula_eval)
-                
-                # Converti in percentuale se necessario
-                assumption = next((a for a in ASSUMPTION_DEFINITIONS if a['formula_storica'] == formula), None)
-                if assumption and assumption['tipo'] in ['percentuale'] and result is not None:
-                    result = result * 100
-                
-                return result
-                
+            valore = float(compila_formula_storica(formula).valuta(self.dati_storici, [anno])[0])
+            return valore if np.isfinite(valore) else None
         except Exception as e:
             print(f"Errore nella formula {formula} per anno {anno}: {e}")
             return None
@@ -445,56 +475,74 @@ class BusinessPlanAssumptions:
     def imposta_assumptions_manuali(self, assumptions_dict: Dict[int, Dict[int, float]]):
         """Imposta le assumption manuali per gli anni del BP"""
         self.assumptions = assumptions_dict
-    
+        self.invalida_tabella()
+
+    def invalida_tabella(self) -> None:
+        """Scarta la tabella compilata: verrà ricostruita al prossimo accesso"""
+        self._tabella = None
+
+    def compila(self) -> np.ndarray:
+        """
+        Congela assumption manuali, medie storiche e default in una tabella densa
+        (assumption_id × anno_index - 1). Precedenza: manuale, media storica, default.
+        """
+        if getattr(self, '_tabella', None) is not None:
+            return self._tabella
+        anni_bp = sorted(next(iter(self.assumptions.values())).keys()) if self.assumptions else []
+        ids = [k for k in list(ASSUMPTION_BY_ID) + list(self.assumptions) + list(self.medie_storiche)
+               if isinstance(k, (int, np.integer)) and k >= 0]
+        n_righe = max(ids) + 1 if ids else 0
+
+        tabella = np.zeros((n_righe, len(anni_bp)), dtype=np.float64)
+        for ass_id in range(n_righe):
+            if ass_id in self.medie_storiche:
+                tabella[ass_id, :] = self.medie_storiche[ass_id]
+            elif ass_id in ASSUMPTION_BY_ID:
+                tabella[ass_id, :] = ASSUMPTION_BY_ID[ass_id]['default_value']
+            manuali = self.assumptions.get(ass_id, {})
+            for j, anno_bp in enumerate(anni_bp):
+                if anno_bp in manuali:
+                    tabella[ass_id, j] = manuali[anno_bp]
+        self._tabella = tabella
+        return tabella
+
     def get_assumption_value(self, assumption_id: int, anno_index: int) -> float:
         """
         Ottiene il valore di un'assumption per un dato indice (1=primo anno dopo base).
-        Converte l'indice in anno effettivo se necessario.
+        Legge dalla tabella compilata; la tabella viene ricostruita dopo ogni modifica.
         """
         try:
-            anni_disponibili = list(sorted(next(iter(self.assumptions.values())).keys()))
-            if 0 <= anno_index - 1 < len(anni_disponibili):
-                anno_bp = anni_disponibili[anno_index - 1]
-            else:
+            tabella = self.compila()
+            if not 0 <= anno_index - 1 < tabella.shape[1]:
                 return 0.0
-            if assumption_id in self.assumptions and anno_bp in self.assumptions[assumption_id]:
-                return self.assumptions[assumption_id][anno_bp]
-            if assumption_id in self.medie_storiche:
-                return self.medie_storiche[assumption_id]
-            assumption = next((a for a in ASSUMPTION_DEFINITIONS if a['id'] == assumption_id), None)
-            return assumption['default_value'] if assumption else 0.0
+            if 0 <= assumption_id < tabella.shape[0]:
+                return float(tabella[assumption_id, anno_index - 1])
+            return 0.0
         except Exception as e:
             print(f"❌ Errore get_assumption_value({assumption_id}, {anno_index}): {e}")
             return 0.0
-def get_anni_disponibili(cliente: str) -> List[int]:
-    """Ottiene la lista degli anni disponibili per un cliente"""
+def get_anni_disponibili(cliente: str, contesto: Optional[ContestoCalcolo] = None) -> List[int]:
+    """Ottiene la lista degli anni disponibili per un cliente nel database del contesto"""
     
-    conn = None
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        
-        query = """
-        SELECT DISTINCT anno 
-        FROM righe 
-        WHERE cliente = ? 
-        ORDER BY anno DESC
-        """
-        
-        df = pd.read_sql_query(query, conn, params=[cliente])
-        return [int(anno) for anno in df['anno'].tolist()]
+        with database.connessione((contesto or ContestoCalcolo()).database) as conn:
+            query = """
+            SELECT DISTINCT anno 
+            FROM righe 
+            WHERE cliente = ? 
+            ORDER BY anno DESC
+            """
+            return [int(anno) for (anno,) in conn.execute(query, (str(cliente),)) if anno is not None]
         
     except Exception as e:
         print(f"Errore nel recupero anni: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
 
-def determina_anno_base(cliente: str) -> Optional[int]:
+def determina_anno_base(cliente: str, contesto: Optional[ContestoCalcolo] = None) -> Optional[int]:
     """Determina l'anno più recente (N0) per un cliente"""
     
-    anni = get_anni_disponibili(cliente)
+    anni = get_anni_disponibili(cliente, contesto)
     return max(anni) if anni else None
 
 
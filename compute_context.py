@@ -0,0 +1,32 @@
+# compute_context.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Contesto di una richiesta di calcolo: utente, percorso del database e cliente.
+# Il nucleo di calcolo (financial_model, business_plan_assumptions, business_plan_projections,
+# projection_engine, montecarlo) riceve il contesto come parametro e non importa streamlit:
+# si può usare da thread in background, pool di processi e script batch. Solo le pagine
+# costruiscono il contesto dalla sessione Streamlit (da_sessione).
+
+from typing import NamedTuple, Optional
+
+import database
+
+
+class ContestoCalcolo(NamedTuple):
+    """Utente, database e cliente di un calcolo; immutabile e serializzabile (pickle) per i processi"""
+
+    utente: Optional[str] = None
+    database: str = database.DATABASE_PREDEFINITO
+    cliente: Optional[str] = None
+
+    @classmethod
+    def per_utente(cls, utente: Optional[str], cliente: Optional[str] = None) -> 'ContestoCalcolo':
+        """Contesto con il database personale dell'utente (predefinito se utente è None)"""
+        return cls(utente, database.database_utente(utente), cliente)
+
+    def con_cliente(self, cliente: Optional[str]) -> 'ContestoCalcolo':
+        return self._replace(cliente=cliente)
+
+
+def da_sessione(cliente: Optional[str] = None) -> ContestoCalcolo:
+    """Contesto della sessione Streamlit corrente (da chiamare nelle pagine, a ogni esecuzione)"""
+    import streamlit as st
+    return ContestoCalcolo.per_utente(st.session_state.get('username'), cliente)
@@ -0,0 +1,133 @@
+# consulta_righe.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Lettura paginata dei record di righe (con i dati del conto) per le pagine di consultazione.
+# Filtri, ordinamento e paginazione sono eseguiti da SQLite (LIMIT/OFFSET): la pagina
+# carica solo le righe visibili, mentre conteggio e subtotale arrivano da un'unica
+# query aggregata. L'esportazione completa è una lettura separata, su richiesta.
+# Per la pagina di modifica: ricerca per ID, cliente, anno o conto con paginazione keyset.
+
+import sqlite3
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+import database
+import metadati_filtri
+
+# Colonne ordinabili: etichetta -> espressione SQL (nomi fissi, mai presi dall'utente)
+ORDINAMENTI = {
+    'ID': 'r.ID',
+    'Cliente': 'r.cliente',
+    'Anno': 'r.anno',
+    'Importo': 'r.importo',
+    'Conto': 'c.Conto',
+    'Sezione': 'c.Sezione',
+}
+RIGHE_PER_PAGINA = (25, 50, 100, 200)
+
+_SELECT_RIGHE = """
+    SELECT r.ID, r.cliente, r.anno, r.importo, c.Conto, c.Sezione, c.Parte
+    FROM righe r
+    JOIN conti c ON r.Id_co = c.id_co
+"""
+
+
+def filtro_righe(cliente: str = 'Tutti', anni: Optional[List] = None, sezione: str = 'Tutte') -> Tuple[str, list]:
+    """Clausola WHERE e parametri per i filtri della sidebar ('Tutti' / 'Tutte' / lista vuota = nessun filtro)"""
+    condizioni, params = ['1=1'], []
+    if cliente != 'Tutti':
+        condizioni.append("r.cliente = ?")
+        params.append(cliente)
+    if anni:
+        condizioni.append(f"r.anno IN ({','.join('?' for _ in anni)})")
+        params.extend(int(anno) for anno in anni)
+    if sezione != 'Tutte':
+        condizioni.append("c.Sezione = ?")
+        params.append(sezione)
+    return "WHERE " + " AND ".join(condizioni), params
+
+
+def conta_righe(percorso_db: str, filtro: Tuple[str, list]) -> Tuple[int, int]:
+    """(numero di record, subtotale importi) dei record filtrati; importi troncati a intero come nei report"""
+    where, params = filtro
+    with database.connessione(percorso_db) as conn:
+        n, totale = conn.execute(f"""
+            SELECT COUNT(*), SUM(COALESCE(CAST(r.importo AS INTEGER), 0))
+            FROM righe r JOIN conti c ON r.Id_co = c.id_co
+            {where}""", params).fetchone()
+    return n, totale or 0
+
+
+def pagina_righe(percorso_db: str, filtro: Tuple[str, list], pagina: int = 1, righe_per_pagina: int = 50,
+                 ordina_per: str = 'ID', discendente: bool = False) -> pd.DataFrame:
+    """Record di una pagina (numerata da 1) nell'ordine richiesto; a parità di valore ordina per ID"""
+    if ordina_per not in ORDINAMENTI:
+        raise ValueError(f"Ordinamento non valido: {ordina_per}. Valori ammessi: {', '.join(ORDINAMENTI)}")
+    where, params = filtro
+    direzione = "DESC" if discendente else "ASC"
+    ordine = f"{ORDINAMENTI[ordina_per]} {direzione}" + (f", r.ID {direzione}" if ordina_per != 'ID' else "")
+    with database.connessione(percorso_db) as conn:
+        return pd.read_sql_query(f"{_SELECT_RIGHE} {where} ORDER BY {ordine} LIMIT ? OFFSET ?", conn,
+                                 params=params + [int(righe_per_pagina), (max(1, int(pagina)) - 1) * int(righe_per_pagina)])
+
+
+def tutte_le_righe(percorso_db: str, filtro: Tuple[str, list]) -> pd.DataFrame:
+    """Tutti i record filtrati (per l'esportazione), ordinati per ID"""
+    where, params = filtro
+    with database.connessione(percorso_db) as conn:
+        return pd.read_sql_query(f"{_SELECT_RIGHE} {where} ORDER BY r.ID", conn, params=params)
+
+
+def _condizione_termine(conn, termine: str, clienti: List[str]) -> Tuple[str, list]:
+    """
+    Condizione SQL per un termine di ricerca, solo su colonne indicizzate di righe:
+    numero -> ID o anno; testo -> clienti che lo contengono (elenco in memoria) o conti
+    il cui nome / codice lo contiene (tabella conti, piccola) tramite Id_co.
+    """
+    alternative, params = [], []
+    if termine.isdigit():
+        alternative.append("r.ID = ? OR r.anno = ?")
+        params.extend([int(termine), int(termine)])
+    termine_minuscolo = termine.lower()
+    clienti_trovati = [c for c in clienti if termine_minuscolo in str(c).lower()]
+    if clienti_trovati:
+        alternative.append(f"r.cliente IN ({','.join('?' for _ in clienti_trovati)})")
+        params.extend(clienti_trovati)
+    conti_trovati = [riga[0] for riga in conn.execute(
+        "SELECT id_co FROM conti WHERE Conto LIKE ? OR id_co LIKE ?", (f"%{termine}%", f"%{termine}%"))]
+    if conti_trovati:
+        alternative.append(f"r.Id_co IN ({','.join('?' for _ in conti_trovati)})")
+        params.extend(conti_trovati)
+    if not alternative:
+        return "0", []
+    return "(" + " OR ".join(alternative) + ")", params
+
+
+def cerca_righe(percorso_db: str, testo: str = "", dopo_id: Optional[int] = None, limite: int = 50) -> pd.DataFrame:
+    """
+    Ricerca di record per ID, cliente, anno o conto (tutti i termini devono corrispondere),
+    con paginazione keyset: restituisce al massimo limite record con ID > dopo_id, ordinati per ID.
+    """
+    clienti = metadati_filtri.metadati_filtri(percorso_db).clienti
+    with database.connessione(percorso_db) as conn:
+        condizioni, params = [], []
+        for termine in testo.split():
+            condizione, params_termine = _condizione_termine(conn, termine, clienti)
+            condizioni.append(condizione)
+            params.extend(params_termine)
+        if dopo_id is not None:
+            condizioni.append("r.ID > ?")
+            params.append(int(dopo_id))
+        where = ("WHERE " + " AND ".join(condizioni)) if condizioni else ""
+        return pd.read_sql_query(f"""
+            SELECT r.ID, r.cliente, r.anno, r.importo, r.Id_co, c.Conto
+            FROM righe r LEFT JOIN conti c ON r.Id_co = c.id_co
+            {where} ORDER BY r.ID LIMIT ?""", conn, params=params + [int(limite)])
+
+
+def leggi_riga(percorso_db: str, id_riga: int) -> Optional[dict]:
+    """Un record di righe per ID (None se non esiste)"""
+    with database.connessione(percorso_db) as conn:
+        cursore = conn.cursor()
+        cursore.row_factory = sqlite3.Row  # solo su questo cursore: la connessione torna al pool invariata
+        riga = cursore.execute("SELECT ID, cliente, anno, importo, Id_co FROM righe WHERE ID = ?", (int(id_riga),)).fetchone()
+    return dict(riga) if riga is not None else None
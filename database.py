@@ -0,0 +1,199 @@
+# database.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Accesso centralizzato ai database SQLite (business_plan_<utente>.db, users.db).
+# Per ogni file viene mantenuto un pool di connessioni già configurate (WAL,
+# synchronous=NORMAL, cache e mmap) condiviso tra le sessioni Streamlit: le pagine
+# chiedono una connessione con connetti() e la restituiscono con conn.close().
+# Una connessione restituita con una transazione aperta viene riportata indietro
+# (rollback) prima di tornare nel pool. Alla prima apertura di un database dati
+# vengono applicate le migrazioni di schema (migrations.py).
+# MODIFICA 2026-10-17: versione_dati() (PRAGMA data_version) per invalidare le cache dei report.
+
+import itertools
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Tuple
+
+import migrations
+
+DATABASE_PREDEFINITO = "business_plan_pro.db"
+CONNESSIONI_INATTIVE_MAX = 4
+BUSY_TIMEOUT_MS = 5000
+
+PRAGMA_CONNESSIONE = (
+    "PRAGMA journal_mode=WAL",        # lettori concorrenti mentre un'altra sessione scrive
+    "PRAGMA synchronous=NORMAL",      # sicuro con WAL, evita un fsync per ogni commit
+    "PRAGMA cache_size=-32000",       # 32 MB di page cache per connessione
+    "PRAGMA mmap_size=268435456",     # 256 MB letti via memory map
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+)
+
+
+def database_utente(username=None) -> str:
+    """Nome del database personale di un utente (database predefinito se non autenticato)"""
+    return f"business_plan_{username}.db" if username else DATABASE_PREDEFINITO
+
+
+class ConnessionePool(sqlite3.Connection):
+    """Connessione SQLite appartenente a un pool: close() la restituisce al pool invece di chiuderla"""
+
+    pool = None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.rilascia(self)
+        else:
+            super().close()
+
+    def chiudi_definitivamente(self):
+        self.pool = None
+        super().close()
+
+
+class PoolConnessioni:
+    """Pool di connessioni verso un singolo file SQLite, sicuro tra thread"""
+
+    def __init__(self, percorso: str, inattive_max: int = CONNESSIONI_INATTIVE_MAX):
+        self.percorso = percorso
+        self.inattive_max = inattive_max
+        self._inattive = queue.LifoQueue()
+
+    def _apri(self) -> ConnessionePool:
+        conn = sqlite3.connect(self.percorso, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               factory=ConnessionePool)
+        for pragma in PRAGMA_CONNESSIONE:
+            try:
+                conn.execute(pragma)
+            except sqlite3.DatabaseError as e:
+                # Es. file in sola lettura: la connessione resta utilizzabile con i valori predefiniti
+                print(f"⚠️ {pragma} non applicato su {self.percorso}: {e}")
+        conn.pool = self
+        return conn
+
+    def acquisisci(self) -> ConnessionePool:
+        """Restituisce una connessione inattiva o ne apre una nuova (non blocca mai)"""
+        try:
+            return self._inattive.get_nowait()
+        except queue.Empty:
+            return self._apri()
+
+    def rilascia(self, conn: ConnessionePool) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.ProgrammingError:
+            return  # connessione già chiusa
+        if self._inattive.qsize() < self.inattive_max:
+            self._inattive.put(conn)
+        else:
+            conn.chiudi_definitivamente()
+
+    def chiudi(self) -> None:
+        while True:
+            try:
+                self._inattive.get_nowait().chiudi_definitivamente()
+            except queue.Empty:
+                return
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def pool(percorso: str) -> PoolConnessioni:
+    """Pool condiviso per il file indicato (uno per percorso assoluto); alla creazione aggiorna lo schema"""
+    chiave = os.path.abspath(percorso)
+    with _POOLS_LOCK:
+        if chiave not in _POOLS:
+            nuovo_pool = PoolConnessioni(percorso)
+            if migrations.richiede_migrazioni(percorso):
+                conn = nuovo_pool.acquisisci()
+                try:
+                    migrations.applica_migrazioni(conn)
+                except (sqlite3.DatabaseError, ValueError) as e:
+                    # Il database resta utilizzabile con lo schema precedente
+                    print(f"⚠️ Migrazione schema non applicata su {percorso}: {e}")
+                finally:
+                    conn.close()
+            _POOLS[chiave] = nuovo_pool
+        return _POOLS[chiave]
+
+
+def connetti(percorso: str = DATABASE_PREDEFINITO) -> ConnessionePool:
+    """Sostituto di sqlite3.connect: connessione dal pool, da restituire con conn.close()"""
+    return pool(percorso).acquisisci()
+
+
+@contextmanager
+def connessione(percorso: str = DATABASE_PREDEFINITO):
+    """with connessione(db) as conn: ... la connessione torna al pool all'uscita"""
+    conn = connetti(percorso)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transazione(percorso: str = DATABASE_PREDEFINITO):
+    """Come connessione(), con commit all'uscita e rollback in caso di errore"""
+    with connessione(percorso) as conn:
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+# Connessioni sentinella (mai usate per scrivere): PRAGMA data_version cambia quando un'altra
+# connessione, anche di un altro processo, ha fatto commit sul database
+_SENTINELLE = {}
+_SENTINELLE_LOCK = threading.Lock()
+_GENERAZIONI_SENTINELLA = itertools.count(1)
+
+
+def versione_dati(percorso: str = DATABASE_PREDEFINITO) -> Tuple[int, int]:
+    """
+    Versione dei dati del database: cambia dopo ogni commit (pagine, importazione CSV, altri processi).
+    Serve come parte della chiave delle cache; il valore ha senso solo per confronto nello stesso processo.
+    (generazione della sentinella, data_version): data_version riparte quando la sentinella viene riaperta.
+    """
+    chiave = os.path.abspath(percorso)
+    pool(percorso)  # schema aggiornato prima di aprire la sentinella
+    with _SENTINELLE_LOCK:
+        sentinella = _SENTINELLE.get(chiave)
+        if sentinella is None:
+            sentinella = (next(_GENERAZIONI_SENTINELLA),
+                          sqlite3.connect(percorso, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False))
+            _SENTINELLE[chiave] = sentinella
+        generazione, conn = sentinella
+        return generazione, conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def chiudi_pool(percorso: str = None) -> None:
+    """Chiude le connessioni inattive di un database (o di tutti), es. prima di copiarne o eliminarne il file"""
+    with _POOLS_LOCK:
+        chiavi = [os.path.abspath(percorso)] if percorso else list(_POOLS)
+        pools = [_POOLS.pop(chiave) for chiave in chiavi if chiave in _POOLS]
+    with _SENTINELLE_LOCK:
+        sentinelle = [_SENTINELLE.pop(chiave) for chiave in (chiavi if percorso else list(_SENTINELLE))
+                      if chiave in _SENTINELLE]
+    for p in pools:
+        p.chiudi()
+    for _, conn in sentinelle:
+        conn.close()
+
+
+def copia_database(origine: str, destinazione: str) -> None:
+    """Copia coerente di un database (anche in modalità WAL) tramite l'API di backup di SQLite"""
+    with connessione(origine) as conn_origine:
+        conn_destinazione = sqlite3.connect(destinazione)
+        try:
+            conn_origine.backup(conn_destinazione)
+        finally:
+            conn_destinazione.close()
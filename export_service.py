@@ -0,0 +1,223 @@
+# export_service.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# File da scaricare (Excel, PDF, testo ASCII) generati solo su richiesta.
+# Le pagine passano a st.download_button una funzione (su_richiesta) invece del file:
+# Streamlit la esegue solo quando l'utente clicca. Il risultato è memorizzato con
+# un'impronta (SHA-256) del contenuto dei dati: lo stesso report scaricato di nuovo,
+# anche da un'altra sessione, non viene rigenerato. Eliminazione LRU per memoria.
+# MODIFICA 2026-10-17: librerie di export (reportlab, tabulate) importate solo alla prima generazione
+# MODIFICA 2026-10-17: export grandi (da RIGHE_MIN_POOL righe) generati nel pool di processi (worker_pool),
+#                     così il rendering reportlab/xlsxwriter non blocca le altre sessioni; la cache resta qui
+
+import hashlib
+import importlib.util
+import io
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict
+
+import pandas as pd
+
+import worker_pool
+
+MEMORIA_MAX_MB = 128
+# Righe di dati da cui il file è generato nel pool di processi (sotto, il trasferimento costa più del rendering)
+RIGHE_MIN_POOL = 1000
+
+MIME = {
+    'xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    'pdf': "application/pdf",
+    'txt': "text/plain",
+    'csv': "text/csv",
+}
+
+
+def _aggiorna_impronta(h, valore) -> None:
+    """Aggiunge un valore all'impronta: DataFrame per contenuto, colonne e tipi; il resto via repr/pickle"""
+    if isinstance(valore, pd.DataFrame):
+        h.update(b'DF')
+        h.update(repr((list(valore.columns), [str(t) for t in valore.dtypes], valore.shape)).encode())
+        try:
+            h.update(pd.util.hash_pandas_object(valore, index=True).values.tobytes())
+        except TypeError:  # celle non hashabili (liste, dict): si ricade sulla serializzazione
+            h.update(pickle.dumps(valore))
+    elif isinstance(valore, (list, tuple)):
+        h.update(b'L%d' % len(valore))
+        for elemento in valore:
+            _aggiorna_impronta(h, elemento)
+    elif isinstance(valore, dict):
+        h.update(b'D%d' % len(valore))
+        for chiave in sorted(valore, key=repr):
+            _aggiorna_impronta(h, chiave)
+            _aggiorna_impronta(h, valore[chiave])
+    else:
+        h.update(repr(valore).encode())
+    h.update(b'|')
+
+
+def impronta(*parti) -> str:
+    """Impronta SHA-256 del contenuto di DataFrame, stringhe, numeri, liste e dizionari"""
+    h = hashlib.sha256()
+    for parte in parti:
+        _aggiorna_impronta(h, parte)
+    return h.hexdigest()
+
+
+def _in_byte(risultato) -> bytes:
+    """bytes dal risultato di un generatore (bytes, str o file-like come io.BytesIO)"""
+    if isinstance(risultato, bytes):
+        return risultato
+    if isinstance(risultato, str):
+        return risultato.encode('utf-8')
+    if hasattr(risultato, 'getvalue'):
+        return _in_byte(risultato.getvalue())
+    return _in_byte(risultato.read())
+
+
+class CacheFile:
+    """Cache LRU dei file generati, sicura tra thread, con limite di memoria"""
+
+    def __init__(self, memoria_max_mb: float = MEMORIA_MAX_MB):
+        self.memoria_max = int(memoria_max_mb * 1024 * 1024)
+        self._file = OrderedDict()  # chiave -> bytes
+        self._memoria = 0
+        self._lock = threading.Lock()
+        self.generati = 0
+        self.riusati = 0
+
+    def ottieni(self, chiave, genera: Callable[[], bytes]) -> bytes:
+        with self._lock:
+            if chiave in self._file:
+                self._file.move_to_end(chiave)
+                self.riusati += 1
+                return self._file[chiave]
+        contenuto = genera()  # fuori dal lock: altri download non restano bloccati
+        with self._lock:
+            self.generati += 1
+            if chiave not in self._file and len(contenuto) <= self.memoria_max:
+                self._file[chiave] = contenuto
+                self._memoria += len(contenuto)
+                while self._memoria > self.memoria_max:
+                    self._memoria -= len(self._file.popitem(last=False)[1])
+        return contenuto
+
+    def svuota(self) -> None:
+        with self._lock:
+            self._file.clear()
+            self._memoria = 0
+
+    def statistiche(self) -> Dict[str, int]:
+        with self._lock:
+            return {'file': len(self._file), 'memoria': self._memoria,
+                    'generati': self.generati, 'riusati': self.riusati}
+
+
+_CACHE = CacheFile()
+
+
+def genera_file(genera: Callable, *dati, **opzioni) -> bytes:
+    """
+    File prodotto da genera(*dati, **opzioni), dalla cache se lo stesso generatore ha già
+    prodotto un file dagli stessi dati. genera deve essere una funzione con nome (non lambda)
+    e restituire bytes, str o un buffer.
+    """
+    # anche il file sorgente: le funzioni delle pagine hanno tutte __module__ == '__main__'
+    codice = getattr(genera, '__code__', None)
+    chiave = (genera.__module__, genera.__qualname__, codice.co_filename if codice else None, impronta(dati, opzioni))
+    return _CACHE.ottieni(chiave, lambda: _in_byte(_genera(genera, dati, opzioni)))
+
+
+def _righe(valore) -> int:
+    """Righe dei DataFrame contenuti in un argomento (anche dentro liste, tuple e dizionari)"""
+    if isinstance(valore, pd.DataFrame):
+        return len(valore)
+    if isinstance(valore, (list, tuple)):
+        return sum(_righe(v) for v in valore)
+    if isinstance(valore, dict):
+        return sum(_righe(v) for v in valore.values())
+    return 0
+
+
+def _importabile(funzione) -> bool:
+    """True se la funzione è definita a livello di modulo fuori dalle pagine (il pool la ritrova per nome)"""
+    return (getattr(funzione, '__module__', '__main__') != '__main__'
+            and '<' not in getattr(funzione, '__qualname__', '<lambda>'))
+
+
+def _genera(genera: Callable, dati: tuple, opzioni: dict):
+    """
+    Esegue il generatore: nel pool di processi se i dati superano RIGHE_MIN_POOL righe e
+    generatore e argomenti sono serializzabili (funzioni definite nei moduli, non nelle pagine
+    né lambda, come le formule delle strutture dei report); altrimenti nel processo corrente.
+    """
+    if (_righe((dati, opzioni)) >= RIGHE_MIN_POOL and _importabile(genera)
+            and all(_importabile(v) for v in opzioni.values() if callable(v)) and worker_pool.in_processi()):
+        try:
+            id_lavoro = worker_pool.invia(genera, *dati, descrizione=f"Export {genera.__qualname__}", **opzioni)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            pass  # non serializzabile: si genera qui
+        else:
+            return worker_pool.risultato(id_lavoro)
+    return genera(*dati, **opzioni)
+
+
+def su_richiesta(genera: Callable, *dati, **opzioni) -> Callable[[], bytes]:
+    """Funzione senza argomenti per st.download_button(data=...): il file viene generato solo al click"""
+    return lambda: genera_file(genera, *dati, **opzioni)
+
+
+def statistiche() -> Dict[str, int]:
+    return _CACHE.statistiche()
+
+
+def svuota_cache() -> None:
+    _CACHE.svuota()
+
+
+def disponibile(modulo: str) -> bool:
+    """True se il modulo è installato, senza importarlo (per mostrare o no un pulsante di export)"""
+    try:
+        return importlib.util.find_spec(modulo) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+# --- Generatori comuni alle pagine ---
+
+def report_pdf(*args, **kwargs) -> bytes:
+    """pdf_renderer.report_pdf: reportlab viene caricato al primo PDF, non all'apertura della pagina"""
+    import pdf_renderer
+    return pdf_renderer.report_pdf(*args, **kwargs)
+
+
+def formatta_importo(valore) -> str:
+    """Importo intero con il punto delle migliaia (1.234.567); testi invariati"""
+    try:
+        return f"{int(valore):,}".replace(",", ".")
+    except (ValueError, TypeError):
+        return str(valore)
+
+
+def excel_tabella(df: pd.DataFrame, nome_foglio: str, colonne_numeriche=(), formato_numeri: str = '#,##0') -> bytes:
+    """File Excel con un foglio; le colonne indicate ricevono il formato numerico"""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+        df.to_excel(writer, index=False, sheet_name=nome_foglio)
+        formato = writer.book.add_format({'num_format': formato_numeri})
+        worksheet = writer.sheets[nome_foglio]
+        colonne = [str(c) for c in df.columns]
+        for colonna in colonne_numeriche:
+            if str(colonna) in colonne:
+                indice = colonne.index(str(colonna))
+                worksheet.set_column(indice, indice, None, formato)
+    return buffer.getvalue()
+
+
+def testo_ascii(df: pd.DataFrame, **opzioni) -> bytes:
+    """Report in tabella ASCII (ascii_table_generator); se non disponibile o in errore, testo semplice"""
+    try:
+        from ascii_table_generator import create_downloadable_ascii_report
+        _, buffer = create_downloadable_ascii_report(df=df, **opzioni)
+        return _in_byte(buffer)
+    except Exception:
+        return df.to_string(index=False).encode('utf-8')
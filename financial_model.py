@@ -1,6 +1,18 @@
-# financial_model.py - Progetto Business Plan Pro - versione 1.9 - 2025-06-25
+# financial_model.py - Progetto Business Plan Pro - versione 2.0 - 2026-10-17
 # DEFINITIVO: Contiene la struttura originale e stabile per i flussi di cassa.
+# MODIFICA: Le strutture dei report vengono compilate una sola volta in un grafo delle
+#           dipendenze (ordine topologico, cicli e riferimenti mancanti rilevati) e le
+#           formule sono valutate su colonne NumPy per tutti gli anni insieme.
+#           Report numerici separati dalla formattazione (ReportCalcolati formatta solo su richiesta).
+#           Lettura dei dati già aggregati per (anno, ID_RI) da righe_agg (carica_totali_id_ri).
+#           Indice delle voci per nome (indice_struttura) condiviso dai motori PDF e HTML.
+#           Totali per (anno, ID_RI) anche come dizionario letto dal cursore (carica_totali_per_anno),
+#           con la stessa query e gli stessi parametri tipizzati di carica_totali_id_ri.
 
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 import pandas as pd
 
 def format_number(x, pdf_format=False):
@@ -90,16 +102,200 @@ report_structure_ff = [
     {'Voce': 'Variazione', 'Tipo': 'Calcolo', 'Formula_Refs': ['PFN FINE PERIODO', 'PFN INIZIO PERIODO'], 'Formula': lambda d: d.get('PFN FINE PERIODO', 0) - d.get('PFN INIZIO PERIODO', 0), 'Grassetto': True, 'Maiuscolo': True, 'Ordine': 250},
 ]
 
+class StrutturaCompilata:
+    """
+    Una o più strutture di report compilate in un grafo delle dipendenze.
+    Le voci 'Calcolo' sono ordinate topologicamente (a parità, per 'Ordine') e valutate
+    su colonne NumPy: ogni formula viene chiamata una volta per tutti gli anni/periodi.
+    """
+
+    def __init__(self, structures: Tuple[List[Dict], ...], esterni: Tuple[str, ...] = ()):
+        items = [item for structure in structures for item in structure]
+        self.dettagli = sorted({item['ID_RI'] for item in items if item['Tipo'] == 'Dettaglio' and 'ID_RI' in item})
+        calcoli = sorted((item for item in items if item['Tipo'] == 'Calcolo'), key=lambda x: x.get('Ordine', 0))
+
+        produttori = {}
+        for posizione, item in enumerate(calcoli):
+            produttori.setdefault(item['Voce'], []).append(posizione)
+        noti = set(self.dettagli) | set(produttori) | set(esterni)
+
+        dipendenze = [set() for _ in calcoli]
+        self.riferimenti_mancanti = {}
+        for posizione, item in enumerate(calcoli):
+            for ref in item.get('Formula_Refs', []):
+                dipendenze[posizione].update(p for p in produttori.get(ref, []) if p != posizione)
+                if ref not in noti and not _riferimento_periodo_noto(ref, esterni):
+                    self.riferimenti_mancanti.setdefault(item['Voce'], []).append(ref)
+
+        # Kahn con coda a priorità sulla posizione: rispetta 'Ordine' dove il grafo lo consente
+        dipendenti = [[] for _ in calcoli]
+        gradi = [len(d) for d in dipendenze]
+        for posizione, deps in enumerate(dipendenze):
+            for dep in deps:
+                dipendenti[dep].append(posizione)
+        pronti = [p for p, g in enumerate(gradi) if g == 0]
+        heapq.heapify(pronti)
+        ordine = []
+        while pronti:
+            posizione = heapq.heappop(pronti)
+            ordine.append(posizione)
+            for successiva in dipendenti[posizione]:
+                gradi[successiva] -= 1
+                if gradi[successiva] == 0:
+                    heapq.heappush(pronti, successiva)
+        if len(ordine) < len(calcoli):
+            ciclo = [calcoli[p]['Voce'] for p, g in enumerate(gradi) if g > 0]
+            raise ValueError(f"Riferimento circolare tra le voci calcolate: {', '.join(ciclo)}")
+
+        self.calcoli = [(calcoli[p]['Voce'], tuple(calcoli[p].get('Formula_Refs', [])), calcoli[p]['Formula'])
+                        for p in ordine]
+        for voce, refs in self.riferimenti_mancanti.items():
+            print(f"⚠️ Struttura report: '{voce}' usa riferimenti non definiti (valgono 0): {', '.join(refs)}")
+
+    def valuta(self, valori: Dict[str, np.ndarray], n: int, solo_riferimenti: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Valuta le voci calcolate su colonne di lunghezza n e le aggiunge a valori.
+        solo_riferimenti=True passa a ogni formula solo i suoi Formula_Refs (come CE/SP),
+        False passa l'intero dizionario dei valori (come i flussi finanziari).
+        """
+        zero = np.zeros(n, dtype=np.int64)
+        for voce, refs, formula in self.calcoli:
+            ingressi = {ref: valori.get(ref, zero) for ref in refs} if solo_riferimenti else valori
+            valori[voce] = _valuta_formula(formula, ingressi, n)
+        return valori
+
+
+def _riferimento_periodo_noto(ref: str, esterni: Tuple[str, ...]) -> bool:
+    """I riferimenti 'voce_current' / 'voce_previous' sono noti se la voce base è tra gli esterni"""
+    for suffisso in ('_current', '_previous'):
+        if ref.endswith(suffisso) and ref[:-len(suffisso)] in esterni:
+            return True
+    return False
+
+
+def _valuta_formula(formula, ingressi: Dict[str, np.ndarray], n: int) -> np.ndarray:
+    """
+    Chiama la formula una volta sulle colonne. Se la formula non è vettorizzabile
+    (condizioni, divisioni per zero, ...) ricade sul calcolo anno per anno con 0 in caso di errore.
+    """
+    try:
+        with np.errstate(all='raise'):
+            risultato = np.asarray(formula(ingressi))
+        if risultato.ndim <= 1 and risultato.size in (1, n) and risultato.dtype.kind in 'biuf':
+            return np.broadcast_to(risultato, (n,)).copy() if risultato.shape != (n,) else risultato
+    except Exception:
+        pass
+    risultato = []
+    for i in range(n):
+        try:
+            risultato.append(formula({k: (v[i] if isinstance(v, np.ndarray) else v) for k, v in ingressi.items()}))
+        except Exception:
+            risultato.append(0)
+    return np.array(risultato)
+
+
+_CACHE_STRUTTURE = {}
+
+
+def compila_strutture(*structures: List[Dict], esterni: Tuple[str, ...] = ()) -> StrutturaCompilata:
+    """Compila (una volta sola per combinazione di strutture) il grafo delle formule"""
+    chiave = (tuple(id(s) for s in structures), tuple(len(s) for s in structures), tuple(esterni))
+    in_cache = _CACHE_STRUTTURE.get(chiave)
+    if in_cache is not None and all(a is b for a, b in zip(in_cache[0], structures)):
+        return in_cache[1]
+    compilata = StrutturaCompilata(structures, esterni)
+    _CACHE_STRUTTURE[chiave] = (structures, compilata)
+    return compilata
+
+
+_INDICI_STRUTTURA = {}  # id(struttura) -> (struttura, indice)
+
+
+def indice_struttura(structure: List[Dict]) -> Dict[str, Dict]:
+    """
+    Indice Voce (in maiuscolo) -> voce della struttura, calcolato una volta per struttura.
+    A parità di nome vale la prima voce, come nella ricerca lineare con next(...) dei report.
+    """
+    in_cache = _INDICI_STRUTTURA.get(id(structure))
+    if in_cache is not None and in_cache[0] is structure:
+        return in_cache[1]
+    indice = {}
+    for item in structure:
+        indice.setdefault(str(item['Voce']).upper(), item)
+    _INDICI_STRUTTURA[id(structure)] = (structure, indice)
+    return indice
+
+
+def nomi_voci(*structures: List[Dict]) -> Tuple[str, ...]:
+    """Nomi disponibili come valori: ID_RI dei dettagli e voci calcolate"""
+    nomi = {item['ID_RI'] for s in structures for item in s if item['Tipo'] == 'Dettaglio' and 'ID_RI' in item}
+    nomi |= {item['Voce'] for s in structures for item in s if item['Tipo'] == 'Calcolo'}
+    return tuple(sorted(nomi))
+
+
+def _query_totali(conn, years_to_display, cliente: Optional[str] = None) -> Tuple[str, list]:
+    """
+    Query di aggregazione per (anno, ID_RI) e parametri: anni come interi (righe.anno è INTEGER,
+    anche quando arrivano come stringhe dai filtri) così gli indici su anno vengono usati.
+    """
+    anni = [int(y) for y in years_to_display]
+    segnaposto = ','.join('?' for _ in anni)
+    filtro_cliente = cliente not in (None, 'Tutti')
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'righe_agg'").fetchone():
+        query = f"""
+            SELECT a.anno, a.ID_RI, SUM(a.totale) AS importo
+            FROM righe_agg a JOIN ricla rl ON a.ID_RI = rl.ID_RI
+            WHERE a.anno IN ({segnaposto}){' AND a.cliente = ?' if filtro_cliente else ''}
+            GROUP BY a.anno, a.ID_RI ORDER BY a.anno, a.ID_RI"""
+    else:
+        # Database non ancora migrato: stessa aggregazione calcolata sulle righe
+        query = f"""
+            SELECT r.anno, c.ID_RI, SUM(COALESCE(CAST(r.importo AS INTEGER), 0)) AS importo
+            FROM righe r JOIN conti c ON r.Id_co = c.id_co JOIN ricla rl ON c.ID_RI = rl.ID_RI
+            WHERE r.anno IN ({segnaposto}){' AND r.cliente = ?' if filtro_cliente else ''}
+            GROUP BY r.anno, c.ID_RI ORDER BY r.anno, c.ID_RI"""
+    return query, anni + ([str(cliente)] if filtro_cliente else [])
+
+
+def carica_totali_id_ri(conn, years_to_display, cliente: Optional[str] = None) -> pd.DataFrame:
+    """
+    Dati per i report già aggregati per (anno, ID_RI), colonne 'anno', 'ID_RI', 'importo'.
+    Legge righe_agg (mantenuta da trigger, vedi migrations.py): poche decine di righe per
+    cliente/anno invece dell'intero bilancio di verifica. cliente None o 'Tutti' somma tutti i clienti.
+    Il risultato si passa direttamente a calculate_all_reports / calculate_reports_numeric.
+    """
+    query, parametri = _query_totali(conn, years_to_display, cliente)
+    return pd.read_sql_query(query, conn, params=parametri)
+
+
+def carica_totali_per_anno(conn, years_to_display, cliente: Optional[str] = None) -> Dict[int, Dict[str, int]]:
+    """
+    Stessi totali di carica_totali_id_ri già nella forma {anno: {ID_RI: totale}}, letti dal
+    cursore senza DataFrame né pivot. Solo gli anni con dati; ID_RI senza righe assenti.
+    """
+    query, parametri = _query_totali(conn, years_to_display, cliente)
+    totali = {}
+    for anno, id_ri, importo in conn.execute(query, parametri):
+        totali.setdefault(int(anno), {})[id_ri] = 0 if importo is None else importo
+    return totali
+
+
 def calculate_all_reports(df_full_data, years_to_display, report_structure_ce, report_structure_sp, report_structure_ff):
     """
     Calcola tutti i valori per i report CE, SP e Flussi Finanziari per gli anni specificati.
-    Restituisce un dizionario con i DataFrame finali per CE, SP e Flussi.
+    Restituisce un dizionario con i DataFrame finali per CE, SP e Flussi: le chiavi '*_export'
+    sono numeriche, 'ce'/'sp'/'ff' sono le versioni formattate, generate solo se richieste.
     """
     if df_full_data.empty:
         return {'ce': pd.DataFrame(), 'sp': pd.DataFrame(), 'ff': pd.DataFrame(), 
                 'ce_export': pd.DataFrame(), 'sp_export': pd.DataFrame(), 
                 'ff_export': pd.DataFrame(), 'error': "Nessun dato per il calcolo dei report."}
+    numerici = _calcola_report_numerici(df_full_data, years_to_display, report_structure_ce, report_structure_sp, report_structure_ff)
+    return ReportCalcolati(ce_export=numerici['ce'], sp_export=numerici['sp'], ff_export=numerici['ff'])
 
+
+def _calcola_valori_anni(df_full_data, years_to_display, report_structure_ce, report_structure_sp, report_structure_ff):
+    """Passi 1-2: colonne per anno di tutte le voci di dettaglio e calcolate di CE e SP"""
     df_full_data['importo'] = pd.to_numeric(df_full_data['importo'], errors='coerce').fillna(0).astype(int)
     
     df_pivot_by_id_ri_year = df_full_data.pivot_table(
@@ -109,159 +305,142 @@ def calculate_all_reports(df_full_data, years_to_display, report_structure_ce, r
         aggfunc='sum'       
     ).fillna(0).astype(int) 
 
-    id_ri_to_ricla_name = df_full_data[['ID_RI', 'Ricla']].drop_duplicates().set_index('ID_RI')['Ricla'].to_dict()
+    # Passo 1: Popolare i valori di dettaglio (RIxx) come colonne per tutti gli anni
+    compilata_ce_sp = compila_strutture(report_structure_ce, report_structure_sp)
+    all_id_ris = set(compilata_ce_sp.dettagli) | {
+        item['ID_RI'] for item in report_structure_ff if item['Tipo'] == 'Dettaglio' and 'ID_RI' in item}
+    n_anni = len(years_to_display)
+    colonne_anni = [year if year in df_pivot_by_id_ri_year.columns else None for year in years_to_display]
+    valori = {}
+    for id_ri_val in all_id_ris:
+        if id_ri_val in df_pivot_by_id_ri_year.index:
+            riga = df_pivot_by_id_ri_year.loc[id_ri_val]
+            valori[id_ri_val] = np.array([riga[year] if year is not None else 0 for year in colonne_anni], dtype=np.int64)
+        else:
+            valori[id_ri_val] = np.zeros(n_anni, dtype=np.int64)
 
-    all_calculated_values_by_year = {year: {} for year in years_to_display}
+    # Passo 2: Risolvere le formule di CE e SP in ordine topologico (tutti gli anni insieme)
+    return compilata_ce_sp.valuta(valori, n_anni)
 
-    # Passo 1: Popolare i valori di dettaglio (RIxx) per tutti gli anni e report
-    all_id_ris = set()
-    for structure in [report_structure_ce, report_structure_sp, report_structure_ff]: 
-        for item in structure:
-            if item['Tipo'] == 'Dettaglio' and 'ID_RI' in item: 
-                all_id_ris.add(item['ID_RI'])
-    
-    for year in years_to_display:
-        for id_ri_val in all_id_ris:
-            if year in df_pivot_by_id_ri_year.columns and id_ri_val in df_pivot_by_id_ri_year.index:
-                value = df_pivot_by_id_ri_year.loc[id_ri_val, year]
-                all_calculated_values_by_year[year][id_ri_val] = value
-            else:
-                all_calculated_values_by_year[year][id_ri_val] = 0
-
-    # Passo 2: Risolvere le formule di CE e SP in ordine (per tutti gli anni)
-    for structure in [report_structure_ce, report_structure_sp]:
-        for item in sorted(structure, key=lambda x: x['Ordine']):
-            if item['Tipo'] == 'Calcolo':
-                voce_calcolata_name = item['Voce']
-                for year in years_to_display:
-                    try:
-                        formula_input_dict = {}
-                        for ref in item['Formula_Refs']:
-                            val_ref = all_calculated_values_by_year[year].get(ref, 0)
-                            formula_input_dict[ref] = val_ref
-                            
-                        calculated_value = item['Formula'](formula_input_dict)
-                        all_calculated_values_by_year[year][voce_calcolata_name] = calculated_value
-                    except KeyError as ke:
-                        all_calculated_values_by_year[year][voce_calcolata_name] = 0
-                    except Exception as e:
-                        all_calculated_values_by_year[year][voce_calcolata_name] = 0
-
-    # Passo 3: Risolvere le formule dei Flussi Finanziari
-    current_year_val = years_to_display[-1] if years_to_display else None
-    previous_year_val = years_to_display[0] if len(years_to_display) > 1 else (current_year_val - 1 if current_year_val else None)
 
+def _calcola_flussi(valori, indici_correnti, indici_precedenti, report_structure_ce, report_structure_sp, report_structure_ff):
+    """
+    Passo 3: flussi finanziari per più periodi insieme. Il periodo k confronta la colonna
+    indici_correnti[k] (suffisso _current) con indici_precedenti[k] (_previous, 0 se l'indice è -1).
+    """
+    indici_correnti = np.asarray(indici_correnti, dtype=np.int64)
+    indici_precedenti = np.asarray(indici_precedenti, dtype=np.int64)
+    precedente_presente = indici_precedenti >= 0
+    indici_precedenti = np.where(precedente_presente, indici_precedenti, 0)
     all_flows_input_values = {}
-    
+    for voce_or_id_ri, colonna in valori.items():
+        all_flows_input_values[f"{voce_or_id_ri}_current"] = colonna[indici_correnti]
+        all_flows_input_values[f"{voce_or_id_ri}_previous"] = np.where(precedente_presente, colonna[indici_precedenti], 0)
+
+    compilata_ff = compila_strutture(report_structure_ff, esterni=nomi_voci(report_structure_ce, report_structure_sp))
+    compilata_ff.valuta(all_flows_input_values, len(indici_correnti), solo_riferimenti=False)
+    return {voce: all_flows_input_values[voce] for voce, _, _ in compilata_ff.calcoli}
+
+
+def _righe_report(structure, colonne, salta_invisibili=False):
+    """DataFrame numerico di un report: colonne = [(nome colonna, {voce: valore})]"""
+    righe = []
+    for item in structure:
+        if salta_invisibili and item.get('Visibile', True) == False: continue
+        row = {'Voce': item['Voce'].upper() if item.get('Maiuscolo', False) else item['Voce']}
+        for nome_colonna, valori_colonna in colonne:
+            row[nome_colonna] = "" if item['Tipo'] == 'Intestazione' else valori_colonna.get(item.get('ID_RI', item['Voce']), 0)
+        righe.append(row)
+    return pd.DataFrame(righe)
+
+
+def _calcola_report_numerici(df_full_data, years_to_display, report_structure_ce, report_structure_sp, report_structure_ff):
+    """Calcolo comune: restituisce i DataFrame numerici {'ce', 'sp', 'ff'}"""
+    valori = _calcola_valori_anni(df_full_data, years_to_display, report_structure_ce, report_structure_sp, report_structure_ff)
+    colonne_anni = [(str(year), {voce: colonna[i] for voce, colonna in valori.items()})
+                    for i, year in enumerate(years_to_display)]
+
+    # Flussi: anno corrente = ultimo anno, precedente = primo anno (0 se c'è un solo anno)
+    current_year_val = years_to_display[-1] if years_to_display else None
+    n_anni = len(years_to_display)
     if current_year_val is not None:
-        # Aggiungi tutti i valori dell'anno corrente con suffisso _current
-        for voce_or_id_ri, value in all_calculated_values_by_year[current_year_val].items():
-            all_flows_input_values[f"{voce_or_id_ri}_current"] = value
-        
-        # Aggiungi tutti i valori dell'anno precedente con suffisso _previous
-        if previous_year_val is not None and previous_year_val in all_calculated_values_by_year:
-            for voce_or_id_ri, value in all_calculated_values_by_year[previous_year_val].items():
-                all_flows_input_values[f"{voce_or_id_ri}_previous"] = value
-        else: 
-            # Se non ci sono dati per l'anno precedente, imposta tutti i valori _previous a 0
-            for voce_or_id_ri in all_calculated_values_by_year[current_year_val].keys():
-                all_flows_input_values[f"{voce_or_id_ri}_previous"] = 0
-
-    calculated_flow_values = {}
-    for item in sorted(report_structure_ff, key=lambda x: x['Ordine']):
-        if item['Tipo'] == 'Calcolo':
-            voce_name = item['Voce']
-            try:
-                calculated_value = item['Formula'](all_flows_input_values)
-                calculated_flow_values[voce_name] = calculated_value
-                all_flows_input_values[voce_name] = calculated_value
-            except KeyError as ke:
-                calculated_flow_values[voce_name] = 0
-                all_flows_input_values[voce_name] = 0
-            except Exception as e:
-                calculated_flow_values[voce_name] = 0
-                all_flows_input_values[voce_name] = 0
-
-    # Costruzione DataFrame Finali
-    final_reports = {} 
-    
-    # Costruzione CE
-    report_data_ce_display = []
-    for item in report_structure_ce:
-        row = {'Voce': item['Voce']}
-        if item.get('Maiuscolo', False): row['Voce'] = row['Voce'].upper()
-        
-        for year in years_to_display:
-            val = all_calculated_values_by_year[year].get(item.get('ID_RI', item['Voce']), 0) 
-            if item['Tipo'] == 'Intestazione': val = ""
-            row[str(year)] = format_number(val) if val != 0 else ("0" if item['Tipo'] != 'Intestazione' else "")
-        report_data_ce_display.append(row)
-    final_reports['ce'] = pd.DataFrame(report_data_ce_display)
-
-    # Costruzione SP
-    report_data_sp_display = []
-    for item in report_structure_sp:
-        if item.get('Visibile', True) == False: continue
-        row = {'Voce': item['Voce']}
-        if item.get('Maiuscolo', False): row['Voce'] = row['Voce'].upper()
-        for year in years_to_display:
-            val = all_calculated_values_by_year[year].get(item.get('ID_RI', item['Voce']), 0) 
-            if item['Tipo'] == 'Intestazione': val = ""
-            row[str(year)] = format_number(val) if val != 0 else ("0" if item['Tipo'] != 'Intestazione' else "")
-        report_data_sp_display.append(row)
-    final_reports['sp'] = pd.DataFrame(report_data_sp_display)
-
-    # Costruzione Flussi Finanziari
-    report_data_ff_display = []
-    for item in report_structure_ff:
-        row = {'Voce': item['Voce']}
-        if item.get('Maiuscolo', False): row['Voce'] = row['Voce'].upper()
-        
-        val = calculated_flow_values.get(item['Voce'], 0)
-        if item['Tipo'] == 'Intestazione': val = ""
-        row[str(current_year_val)] = format_number(val) if val != 0 else ("0" if item['Tipo'] != 'Intestazione' else "")
-        
-        report_data_ff_display.append(row)
-    final_reports['ff'] = pd.DataFrame(report_data_ff_display)
-
-    # DataFrame per Export (numerici, non formattati come stringhe)
-    # Costruzione CE Export
-    export_rows_ce = []
-    for item in report_structure_ce:
-        row_values = {'Voce': item['Voce']}
-        if item.get('Maiuscolo', False): row_values['Voce'] = row_values['Voce'].upper()
-        for year in years_to_display:
-            val = all_calculated_values_by_year[year].get(item.get('ID_RI', item['Voce']), 0)
-            if item['Tipo'] == 'Intestazione': val = ""
-            row_values[str(year)] = val
-        export_rows_ce.append(row_values)
-    final_reports['ce_export'] = pd.DataFrame(export_rows_ce)
-
-    # Costruzione SP Export
-    export_rows_sp = []
-    for item in report_structure_sp:
-        if item.get('Visibile', True) == False: continue
-        row_values = {'Voce': item['Voce']}
-        if item.get('Maiuscolo', False): row_values['Voce'] = row_values['Voce'].upper()
-        for year in years_to_display:
-            val = all_calculated_values_by_year[year].get(item.get('ID_RI', item['Voce']), 0)
-            if item['Tipo'] == 'Intestazione': val = ""
-            row_values[str(year)] = val
-        export_rows_sp.append(row_values)
-    final_reports['sp_export'] = pd.DataFrame(export_rows_sp)
-    
-    # Costruzione Flussi Finanziari Export
-    export_rows_ff = []
-    for item in report_structure_ff:
-        row_values = {'Voce': item['Voce']}
-        if item.get('Maiuscolo', False): row_values['Voce'] = row_values['Voce'].upper()
-        val = calculated_flow_values.get(item['Voce'], 0)
-        if item['Tipo'] == 'Intestazione': val = ""
-        row_values[str(current_year_val)] = val 
-        export_rows_ff.append(row_values)
-    final_reports['ff_export'] = pd.DataFrame(export_rows_ff)
-
-    return final_reports
+        flussi = _calcola_flussi(valori, [n_anni - 1], [0 if n_anni > 1 else -1],
+                                 report_structure_ce, report_structure_sp, report_structure_ff)
+    else:
+        flussi = _calcola_flussi({}, [0], [-1], report_structure_ce, report_structure_sp, report_structure_ff)
+    calculated_flow_values = {voce: colonna[0] for voce, colonna in flussi.items()}
+
+    # Costruzione DataFrame numerici (un solo DataFrame per report; la formattazione è differita)
+    return {
+        'ce': _righe_report(report_structure_ce, colonne_anni),
+        'sp': _righe_report(report_structure_sp, colonne_anni, salta_invisibili=True),
+        'ff': _righe_report(report_structure_ff, [(str(current_year_val), calculated_flow_values)]),
+    }
+
+
+def calculate_flows_all_pairs(df_full_data, years_list, report_structure_ce, report_structure_sp, report_structure_ff):
+    """
+    Flussi finanziari per tutte le coppie (anno_da, anno_a) con anno_da < anno_a nell'ordine di years_list.
+    I valori di CE/SP vengono calcolati una volta per anno; ogni coppia è una colonna dello stesso calcolo.
+    Restituisce (DataFrame numerico con colonne 'Voce' + 'anno_da→anno_a', lista delle coppie).
+    """
+    coppie = [(years_list[i], years_list[j]) for i in range(len(years_list)) for j in range(i + 1, len(years_list))]
+    if df_full_data.empty or not coppie:
+        return pd.DataFrame(), coppie
+    valori = _calcola_valori_anni(df_full_data, list(years_list), report_structure_ce, report_structure_sp, report_structure_ff)
+    indici_precedenti = [i for i in range(len(years_list)) for j in range(i + 1, len(years_list))]
+    indici_correnti = [j for i in range(len(years_list)) for j in range(i + 1, len(years_list))]
+    flussi = _calcola_flussi(valori, indici_correnti, indici_precedenti,
+                             report_structure_ce, report_structure_sp, report_structure_ff)
+    colonne = [(f"{anno_da}→{anno_a}", {voce: colonna[k] for voce, colonna in flussi.items()})
+               for k, (anno_da, anno_a) in enumerate(coppie)]
+    return _righe_report(report_structure_ff, colonne), coppie
+
+
+def format_report_frame(df_numeric: pd.DataFrame) -> pd.DataFrame:
+    """Versione di visualizzazione di un report numerico: importi formattati con format_number"""
+    df_display = df_numeric.copy()
+    for col in df_display.columns:
+        if col != 'Voce':
+            df_display[col] = df_display[col].map(format_number)
+    return df_display
+
+
+class ReportCalcolati(dict):
+    """
+    Risultato di calculate_all_reports. 'ce_export', 'sp_export', 'ff_export' sono i DataFrame
+    numerici; 'ce', 'sp', 'ff' (stringhe formattate) vengono costruiti solo al primo accesso.
+    Con condiviso=True (valori nella cache di report_cache, letti da più sessioni) i formattati
+    sono ricostruiti a ogni accesso e non vengono memorizzati: il valore non cambia dopo
+    l'inserimento in cache e la sua dimensione resta quella misurata.
+    """
+    _FORMATTATI = {'ce': 'ce_export', 'sp': 'sp_export', 'ff': 'ff_export'}
+    condiviso = False
+
+    def __missing__(self, key):
+        if key not in self._FORMATTATI:
+            raise KeyError(key)
+        df_display = format_report_frame(dict.__getitem__(self, self._FORMATTATI[key]))
+        if not self.condiviso:
+            self[key] = df_display
+        return df_display
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._FORMATTATI
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+def calculate_reports_numeric(df_full_data, years_to_display, report_structure_ce, report_structure_sp, report_structure_ff):
+    """
+    Come calculate_all_reports, ma restituisce solo i DataFrame numerici {'ce', 'sp', 'ff'}
+    (colonne 'Voce' + anni come stringa, intestazioni vuote). Nessuna formattazione.
+    """
+    if df_full_data.empty:
+        return {'ce': pd.DataFrame(), 'sp': pd.DataFrame(), 'ff': pd.DataFrame(),
+                'error': "Nessun dato per il calcolo dei report."}
+    return _calcola_report_numerici(df_full_data, years_to_display, report_structure_ce, report_structure_sp, report_structure_ff)
 
 def format_number_html(x, add_euro=False):
     """
@@ -0,0 +1,210 @@
+# html_renderer.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Tabelle HTML dei report (pagine 4, 5, 6 e 8) costruite in modo vettoriale:
+# importi formattati per colonna intera, grassetto e maiuscolo delle voci da una mappa
+# precalcolata per struttura, markup prodotto con un solo join. L'HTML è memorizzato
+# con l'impronta dei dati: le riesecuzioni di Streamlit dovute ad altri widget
+# riusano la stessa stringa senza ricostruirla.
+
+import html as html_lib
+import threading
+from collections import OrderedDict
+from typing import FrozenSet, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import financial_model
+from export_service import impronta
+
+VOCI_CACHE_MAX = 64
+
+_CSS_REPORT = """
+<style>
+    .custom-table {
+        width: 100%;
+        border-collapse: collapse;
+        font-family: Arial, sans-serif;
+        margin: 1em 0;
+    }
+    .custom-table th, .custom-table td {
+        border: 1px solid #e0e0e0;
+        padding: 8px 12px;
+        text-align: left;
+    }
+    .custom-table th {
+        background-color: #f0f0f0;
+        font-weight: bold;
+    }
+    .custom-table td.numeric {
+        text-align: right;
+    }
+    .custom-table tr.bold-row td {
+        font-weight: bold;
+    }
+    /* Stile per le voci in maiuscolo (se Maiuscolo è True per la Voce) */
+    .custom-table td.uppercase-text {
+        text-transform: uppercase;
+    }
+</style>
+"""
+
+_CSS_FLUSSI = """
+<style>
+    .multi-table {
+        width: 100%;
+        border-collapse: collapse;
+        font-family: Arial, sans-serif;
+        margin: 1em 0;
+        font-size: 0.9em;
+    }
+    .multi-table th, .multi-table td {
+        border: 1px solid #e0e0e0;
+        padding: 6px 10px;
+        text-align: left;
+    }
+    .multi-table th {
+        background-color: #f8f9fa;
+        font-weight: bold;
+        color: #2c3e50;
+    }
+    .multi-table td.numeric {
+        text-align: right;
+        font-family: inherit;
+    }
+    .multi-table tr.bold-row td {
+        font-weight: bold;
+        background-color: #f0f8ff;
+    }
+    .multi-table td.uppercase-text {
+        text-transform: uppercase;
+    }
+    .multi-table th.year-header {
+        background-color: #e3f2fd;
+        color: #1565c0;
+    }
+</style>
+"""
+
+_CSS_BP = """
+<style>
+    .custom-table-bp { width: 100%; border-collapse: collapse; font-family: Arial, sans-serif; margin: 1em 0; }
+    .custom-table-bp th, .custom-table-bp td { border: 1px solid #e0e0e0; padding: 8px 12px; text-align: left; }
+    .custom-table-bp th { background-color: #f0f0f0; font-weight: bold; position: sticky; top: 0; z-index: 1;}
+    .custom-table-bp td.numeric { text-align: right; }
+</style>
+"""
+
+# stile -> (css, classe della tabella, classe delle intestazioni numeriche)
+STILI = {
+    'report': (_CSS_REPORT, 'custom-table', 'numeric'),
+    'flussi': (_CSS_FLUSSI, 'multi-table', 'numeric year-header'),
+    'bp': (_CSS_BP, 'custom-table-bp', 'numeric'),
+}
+
+_SEPARATORE_MIGLIAIA = r'\B(?=(\d{3})+(?!\d))'
+
+
+def formatta_colonna(serie: pd.Series, solo_numeri: bool = False) -> pd.Series:
+    """
+    financial_model.format_number applicato a un'intera colonna: punto delle migliaia,
+    negativi tra parentesi, decimali troncati. Le colonne numeriche sono formattate in
+    blocco; quelle miste valore per valore. solo_numeri lascia invariati i valori non numerici.
+    """
+    if pd.api.types.is_bool_dtype(serie) or not pd.api.types.is_numeric_dtype(serie):
+        if solo_numeri:
+            return serie.map(lambda x: financial_model.format_number(x) if pd.api.types.is_number(x) else x)
+        return serie.map(financial_model.format_number)
+    if pd.api.types.is_integer_dtype(serie) and not serie.hasnans:
+        interi = serie.to_numpy(dtype=np.int64)
+        finiti = np.ones(len(serie), dtype=bool)
+    else:
+        valori = serie.to_numpy(dtype=float, na_value=np.nan)
+        finiti = np.isfinite(valori)
+        interi = np.trunc(np.where(finiti, valori, 0)).astype(np.int64)
+    testo = pd.Series(np.abs(interi).astype(str), index=serie.index, dtype=object)
+    testo = testo.str.replace(_SEPARATORE_MIGLIAIA, '.', regex=True)
+    testo = testo.where(interi >= 0, '(' + testo + ')')
+    if not finiti.all():
+        testo[~finiti] = [str(v) for v in serie[~finiti]]  # nan / inf come in format_number
+    return testo
+
+
+_STILI_STRUTTURA = {}  # id(struttura) -> (struttura, voci in grassetto, voci in maiuscolo)
+
+
+def stili_struttura(struttura: Sequence[dict]) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """
+    (voci in grassetto, voci in maiuscolo in forma maiuscola), calcolati una volta per struttura.
+    Grassetto per nome esatto; maiuscolo per nome senza distinzione di maiuscole, con la
+    prima voce della struttura a parità di nome (come nelle tabelle originali).
+    """
+    in_cache = _STILI_STRUTTURA.get(id(struttura))
+    if in_cache is not None and in_cache[0] is struttura:
+        return in_cache[1], in_cache[2]
+    grassetto = frozenset(item['Voce'] for item in struttura if item.get('Grassetto', False))
+    maiuscolo = frozenset(voce for voce, item in financial_model.indice_struttura(struttura).items()
+                          if item.get('Maiuscolo', False))
+    _STILI_STRUTTURA[id(struttura)] = (struttura, grassetto, maiuscolo)
+    return grassetto, maiuscolo
+
+
+def _costruisci(df: pd.DataFrame, struttura, stile: str, titolo: Optional[str], solo_numeri: bool) -> str:
+    css, classe, classe_numerica = STILI[stile]
+    colonne_valori = [c for c in df.columns if c != 'Voce']
+    voci = df['Voce'].astype(str)
+
+    if struttura is not None:
+        grassetto, maiuscolo = stili_struttura(struttura)
+        classi_riga = np.where(voci.isin(grassetto), " class='bold-row'", "")
+        classi_voce = np.where(voci.str.upper().isin(maiuscolo), " class='uppercase-text'", "")
+    else:
+        classi_riga = np.full(len(df), "", dtype=object)
+        classi_voce = np.full(len(df), "", dtype=object)
+
+    # Celle di ogni riga: concatenazione per colonne intere, poi un solo join
+    righe = pd.Series("<tr", index=df.index, dtype=object) + classi_riga + "><td" + classi_voce + ">" \
+        + voci.map(html_lib.escape) + "</td>"
+    for colonna in colonne_valori:
+        righe = righe + "<td class='numeric'>" + formatta_colonna(df[colonna], solo_numeri).astype(str) + "</td>"
+    righe = righe + "</tr>"
+
+    intestazione = "<th>Voce</th>" + "".join(f"<th class='{classe_numerica}'>{c}</th>" for c in colonne_valori)
+    tabella = f"<table class=\"{classe}\"><thead><tr>{intestazione}</tr></thead><tbody>{''.join(righe.tolist())}</tbody></table>"
+    if stile == 'bp':
+        return f"{css}<div style=\"max-height: 600px; overflow-y: auto; border: 1px solid #e0e0e0;\"><h3>{titolo or ''}</h3>{tabella}</div>"
+    return css + tabella
+
+
+class _CacheHtml:
+    """Cache LRU delle tabelle HTML, sicura tra thread"""
+
+    def __init__(self, voci_max: int = VOCI_CACHE_MAX):
+        self.voci_max = voci_max
+        self._voci = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ottieni(self, chiave, costruisci) -> str:
+        with self._lock:
+            if chiave in self._voci:
+                self._voci.move_to_end(chiave)
+                return self._voci[chiave]
+        valore = costruisci()
+        with self._lock:
+            self._voci[chiave] = valore
+            while len(self._voci) > self.voci_max:
+                self._voci.popitem(last=False)
+        return valore
+
+
+_CACHE = _CacheHtml()
+
+
+def tabella_html(df: pd.DataFrame, struttura: Optional[Sequence[dict]] = None, stile: str = 'report',
+                 titolo: Optional[str] = None, solo_numeri: bool = False) -> str:
+    """
+    HTML (stile e tabella) di un report con colonna 'Voce' e colonne di importi.
+    struttura: voci della struttura del report per grassetto e maiuscolo (None = nessuno).
+    stile: 'report' (pagine 4 e 5), 'flussi' (pagina 6), 'bp' (pagina 8, con titolo e scorrimento).
+    """
+    chiave = (impronta(df), id(struttura) if struttura is not None else None, stile, titolo, solo_numeri)
+    return _CACHE.ottieni(chiave, lambda: _costruisci(df, struttura, stile, titolo, solo_numeri))
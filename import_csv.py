@@ -0,0 +1,131 @@
+# import_csv.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Importazione massiva di bilanci da CSV nella tabella righe.
+# Il file viene letto a blocchi (nessun limite pratico di dimensione), ogni blocco è
+# validato in modo vettoriale (codice conto esistente in conti.id_co, anno e importo
+# numerici) e caricato con executemany in una tabella temporanea. Lo spostamento in
+# righe avviene con poche istruzioni SQL nella stessa transazione: o si importa tutto
+# o non si scrive nulla.
+
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+import database
+
+COLONNE_RICHIESTE = ('cliente', 'anno', 'codice', 'importo')
+DIMENSIONE_BLOCCO = 50_000
+ANNO_MIN, ANNO_MAX = 1900, 2100
+
+# aggiungi:    le righe del file vengono aggiunte a quelle esistenti
+# sostituisci: per ogni (cliente, anno) presente nel file le righe esistenti vengono eliminate
+# upsert:      per ogni (cliente, anno, codice) presente nel file le righe esistenti vengono sostituite,
+#              gli altri conti dello stesso cliente/anno restano invariati
+MODALITA_IMPORT = {
+    'aggiungi': "Aggiungi alle righe esistenti",
+    'sostituisci': "Sostituisci interi bilanci (cliente, anno)",
+    'upsert': "Aggiorna i conti presenti nel file (cliente, anno, codice)",
+}
+
+
+def leggi_csv_a_blocchi(file, dimensione_blocco: int = DIMENSIONE_BLOCCO) -> Iterator[pd.DataFrame]:
+    """Legge il CSV a blocchi, solo le colonne richieste (nomi case-insensitive)"""
+    lettore = pd.read_csv(file, chunksize=dimensione_blocco, dtype=str, keep_default_na=False,
+                          usecols=lambda colonna: colonna.strip().lower() in COLONNE_RICHIESTE)
+    for blocco in lettore:
+        blocco.columns = blocco.columns.str.strip().str.lower()
+        mancanti = [c for c in COLONNE_RICHIESTE if c not in blocco.columns]
+        if mancanti:
+            raise ValueError(f"Il file deve contenere almeno le colonne: {', '.join(COLONNE_RICHIESTE)} "
+                             f"(mancanti: {', '.join(mancanti)})")
+        yield blocco[list(COLONNE_RICHIESTE)]
+
+
+def valida_blocco(blocco: pd.DataFrame, codici_validi: pd.Index):
+    """
+    Valida un blocco in modo vettoriale.
+    Restituisce (righe valide pronte per il database, righe scartate con colonna 'motivo').
+    """
+    cliente = blocco['cliente'].str.strip()
+    codice = blocco['codice'].str.strip()
+    anno = pd.to_numeric(blocco['anno'].str.strip(), errors='coerce')
+    importo = pd.to_numeric(blocco['importo'].str.strip(), errors='coerce')
+
+    motivo = pd.Series('', index=blocco.index)
+    motivo = motivo.mask(importo.isna(), 'importo non numerico')
+    motivo = motivo.mask(~codice.isin(codici_validi), 'codice conto inesistente')
+    motivo = motivo.mask(anno.isna() | (anno % 1 != 0) | ~anno.between(ANNO_MIN, ANNO_MAX), 'anno non valido')
+    motivo = motivo.mask(cliente == '', 'cliente mancante')
+    valide = motivo == ''
+
+    righe_valide = pd.DataFrame({
+        'cliente': cliente[valide],
+        'anno': anno[valide].astype(np.int64),
+        'Id_co': codice[valide],
+        'importo': np.round(importo[valide]).astype(np.int64),  # righe.importo è INTEGER
+    })
+    scartate = blocco[~valide].assign(motivo=motivo[~valide])
+    return righe_valide, scartate
+
+
+def importa_csv(file, percorso_db: str, modalita: str = 'aggiungi', ignora_scarti: bool = False,
+                dimensione_blocco: int = DIMENSIONE_BLOCCO) -> Dict:
+    """
+    Importa il CSV in righe in un'unica transazione.
+    Se ci sono righe non valide e ignora_scarti=False non viene scritto nulla.
+    Restituisce {'lette', 'importate', 'eliminate', 'scartate' (DataFrame), 'coppie' (cliente, anno), 'eseguita'}.
+    """
+    if modalita not in MODALITA_IMPORT:
+        raise ValueError(f"Modalità non valida: {modalita}. Valori ammessi: {', '.join(MODALITA_IMPORT)}")
+
+    esito = {'lette': 0, 'importate': 0, 'eliminate': 0, 'scartate': pd.DataFrame(), 'coppie': [], 'eseguita': False}
+    scarti = []
+    with database.connessione(percorso_db) as conn:
+        codici_validi = pd.Index([r[0] for r in conn.execute("SELECT id_co FROM conti")])
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DROP TABLE IF EXISTS temp.import_righe")
+            conn.execute("CREATE TEMP TABLE import_righe (cliente TEXT, anno INTEGER, Id_co TEXT, importo INTEGER)")
+            for blocco in leggi_csv_a_blocchi(file, dimensione_blocco):
+                esito['lette'] += len(blocco)
+                righe_valide, scartate = valida_blocco(blocco, codici_validi)
+                if not scartate.empty:
+                    scarti.append(scartate)
+                # .tolist() converte in tipi Python nativi, accettati da sqlite3
+                conn.executemany("INSERT INTO import_righe (cliente, anno, Id_co, importo) VALUES (?, ?, ?, ?)",
+                                 zip(*(righe_valide[c].tolist() for c in righe_valide.columns)))
+
+            esito['scartate'] = pd.concat(scarti) if scarti else pd.DataFrame()
+            if scarti and not ignora_scarti:
+                conn.rollback()
+                return esito
+
+            esito['coppie'] = conn.execute(
+                "SELECT DISTINCT cliente, anno FROM import_righe ORDER BY cliente, anno").fetchall()
+            if modalita == 'sostituisci':
+                esito['eliminate'] = conn.execute("""
+                    DELETE FROM righe WHERE (cliente, anno) IN (SELECT DISTINCT cliente, anno FROM import_righe)
+                """).rowcount
+            elif modalita == 'upsert':
+                esito['eliminate'] = conn.execute("""
+                    DELETE FROM righe WHERE (cliente, anno, Id_co) IN (SELECT DISTINCT cliente, anno, Id_co FROM import_righe)
+                """).rowcount
+            esito['importate'] = conn.execute("""
+                INSERT INTO righe (cliente, anno, Id_co, importo)
+                SELECT cliente, anno, Id_co, importo FROM import_righe ORDER BY rowid
+            """).rowcount
+            conn.execute("DROP TABLE temp.import_righe")
+            conn.commit()
+            esito['eseguita'] = True
+        except BaseException:
+            conn.rollback()
+            raise
+    return esito
+
+
+def anteprima_csv(file, righe: int = 100) -> Optional[pd.DataFrame]:
+    """Prime righe del file per la visualizzazione; riporta il file all'inizio"""
+    anteprima = next(leggi_csv_a_blocchi(file, righe), None)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return anteprima
@@ -1,9 +1,9 @@
 # manutenzione.py - Versione 1.0 - 2025-06-12 17:55
-import sqlite3
+import database
 
-def aggiorna_cliente(nuovo_cliente):
+def aggiorna_cliente(nuovo_cliente, database_name=database.DATABASE_PREDEFINITO):
     # Connessione al database SQLite
-    conn = sqlite3.connect(get_database_name())
+    conn = database.connetti(database_name)
     cursor = conn.cursor()
 
     try:
@@ -18,5 +18,6 @@ def aggiorna_cliente(nuovo_cliente):
 
 # Esegui direttamente se lo script è lanciato da terminale
 if __name__ == "__main__":
+    database_name = input(f"Database da aggiornare [{database.DATABASE_PREDEFINITO}]: ") or database.DATABASE_PREDEFINITO
     nuovo_cliente = input("Inserisci il nuovo nome cliente: ")
-    aggiorna_cliente(nuovo_cliente)
+    aggiorna_cliente(nuovo_cliente, database_name)
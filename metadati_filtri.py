@@ -0,0 +1,67 @@
+# metadati_filtri.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Valori disponibili per i filtri della sidebar (clienti, anni e sezioni per cliente).
+# Una sola query raggruppata per (cliente, anno, sezione) sostituisce le tre DISTINCT
+# eseguite a ogni interazione; il risultato resta in memoria per database e viene
+# ricaricato solo quando cambia la versione dei dati (database.versione_dati).
+
+import os
+import threading
+from typing import List, Tuple
+
+import database
+
+TUTTI = 'Tutti'
+
+
+class MetadatiFiltri:
+    """Clienti, anni (decrescenti) e sezioni per cliente; la chiave 'Tutti' riunisce tutti i clienti"""
+
+    def __init__(self, righe: List[Tuple]):
+        anni = {TUTTI: set()}
+        sezioni = {TUTTI: set()}
+        for cliente, anno, sezione in righe:
+            if cliente is None:
+                continue
+            anni.setdefault(cliente, set())
+            sezioni.setdefault(cliente, set())
+            if anno is not None:
+                anni[cliente].add(anno)
+                anni[TUTTI].add(anno)
+            if sezione is not None:
+                sezioni[cliente].add(sezione)
+                sezioni[TUTTI].add(sezione)
+        self.clienti = sorted(c for c in anni if c != TUTTI)
+        self._anni = {cliente: [str(a) for a in sorted(valori, reverse=True)] for cliente, valori in anni.items()}
+        self._sezioni = {cliente: sorted(valori) for cliente, valori in sezioni.items()}
+
+    def anni(self, cliente: str = TUTTI) -> List[str]:
+        """Anni disponibili per il cliente, dal più recente, come stringhe (formato della sidebar)"""
+        return list(self._anni.get(cliente, []))
+
+    def sezioni(self, cliente: str = TUTTI) -> List[str]:
+        return list(self._sezioni.get(cliente, []))
+
+
+_QUERY_METADATI = """
+    SELECT r.cliente, r.anno, c.Sezione
+    FROM righe r LEFT JOIN conti c ON c.id_co = r.Id_co
+    GROUP BY r.cliente, r.anno, c.Sezione
+"""
+
+_CACHE = {}  # database -> (versione dati, MetadatiFiltri)
+_CACHE_LOCK = threading.Lock()
+
+
+def metadati_filtri(percorso_db: str) -> MetadatiFiltri:
+    """Metadati dei filtri per il database, dalla memoria se i dati non sono cambiati"""
+    chiave = os.path.abspath(percorso_db)
+    versione = database.versione_dati(percorso_db)
+    with _CACHE_LOCK:
+        in_cache = _CACHE.get(chiave)
+    if in_cache is not None and in_cache[0] == versione:
+        return in_cache[1]
+    with database.connessione(percorso_db) as conn:
+        metadati = MetadatiFiltri(conn.execute(_QUERY_METADATI).fetchall())
+    with _CACHE_LOCK:
+        _CACHE[chiave] = (versione, metadati)
+    return metadati
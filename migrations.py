@@ -0,0 +1,181 @@
+# migrations.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Migrazioni di schema versionate per i database business_plan_*.db.
+# La versione applicata è salvata in PRAGMA user_version; ogni migrazione gira in una
+# transazione (BEGIN IMMEDIATE) e aggiorna user_version solo se va a buon fine.
+# Le migrazioni vengono applicate all'apertura del pool di connessioni (database.py)
+# e quindi a ogni database utente esistente o creato da AuthManager.
+# MODIFICA 2026-10-17: migrazione 3, tabella righe_agg (totali per cliente, anno, ID_RI) mantenuta da trigger.
+
+import glob
+import sqlite3
+from typing import Callable, List, Tuple
+
+PREFISSO_DATABASE = "business_plan_"
+
+
+def _tabella_esiste(conn: sqlite3.Connection, nome: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (nome,)).fetchone() is not None
+
+
+def _colonne(conn: sqlite3.Connection, tabella: str) -> List[str]:
+    return [riga[1] for riga in conn.execute(f'PRAGMA table_info("{tabella}")')]
+
+
+def _verifica_chiave_unica(conn: sqlite3.Connection, tabella: str, colonna: str) -> None:
+    """Interrompe la migrazione se la futura chiave primaria ha valori nulli o duplicati"""
+    duplicati = conn.execute(
+        f'SELECT "{colonna}", COUNT(*) FROM "{tabella}" GROUP BY "{colonna}" '
+        f'HAVING COUNT(*) > 1 OR "{colonna}" IS NULL').fetchall()
+    if duplicati:
+        elenco = ', '.join(f"{valore!r} ({n})" for valore, n in duplicati[:10])
+        raise ValueError(f"Impossibile creare la chiave primaria {tabella}.{colonna}: valori nulli o duplicati {elenco}")
+
+
+def _migrazione_1_chiavi_primarie(conn: sqlite3.Connection) -> None:
+    """conti e ricla: chiave primaria su id_co / ID_RI, rimozione della colonna vuota 'Unnamed: 6'"""
+    if _tabella_esiste(conn, 'conti'):
+        _verifica_chiave_unica(conn, 'conti', 'id_co')
+        colonne_extra = [c for c in _colonne(conn, 'conti') if c not in ('id_co', 'Ord', 'Conto', 'Parte', 'Sezione', 'ID_RI')]
+        # Le colonne spurie create da pandas vengono tenute solo se contengono dati
+        colonne_extra = [c for c in colonne_extra if conn.execute(
+            f'SELECT 1 FROM conti WHERE TRIM(COALESCE("{c}", \'\')) <> \'\' LIMIT 1').fetchone()]
+        definizione_extra = ''.join(f', "{c}" TEXT' for c in colonne_extra)
+        elenco_colonne = ', '.join(f'"{c}"' for c in ['id_co', 'Ord', 'Conto', 'Parte', 'Sezione', 'ID_RI'] + colonne_extra)
+        conn.execute(f"""
+            CREATE TABLE conti_nuova (
+                id_co TEXT PRIMARY KEY NOT NULL, Ord INTEGER, Conto TEXT, Parte TEXT, Sezione TEXT, ID_RI TEXT{definizione_extra}
+            ) WITHOUT ROWID""")
+        conn.execute(f"INSERT INTO conti_nuova ({elenco_colonne}) SELECT {elenco_colonne} FROM conti")
+        conn.execute("DROP TABLE conti")
+        conn.execute("ALTER TABLE conti_nuova RENAME TO conti")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conti_id_ri ON conti (ID_RI)")
+
+    if _tabella_esiste(conn, 'ricla'):
+        _verifica_chiave_unica(conn, 'ricla', 'ID_RI')
+        conn.execute("CREATE TABLE ricla_nuova (ID_RI TEXT PRIMARY KEY NOT NULL, Ricla TEXT) WITHOUT ROWID")
+        conn.execute("INSERT INTO ricla_nuova (ID_RI, Ricla) SELECT ID_RI, Ricla FROM ricla")
+        conn.execute("DROP TABLE ricla")
+        conn.execute("ALTER TABLE ricla_nuova RENAME TO ricla")
+
+
+def _migrazione_2_indici_righe(conn: sqlite3.Connection) -> None:
+    """righe: indici per i filtri cliente/anno e per la join sui conti"""
+    if not _tabella_esiste(conn, 'righe'):
+        return
+    # Copre le query dei report (filtro cliente + anno, lettura di Id_co e importo) senza accedere alla tabella
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_righe_cliente_anno ON righe (cliente, anno, Id_co, importo)")
+    # Report con 'Tutti' i clienti: filtro solo per anno
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_righe_anno ON righe (anno, Id_co, importo)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_righe_id_co ON righe (Id_co)")
+
+
+# Importo come lo legge financial_model (troncato a intero, NULL = 0)
+_IMPORTO_OLD = "COALESCE(CAST(OLD.importo AS INTEGER), 0)"
+_IMPORTO_NEW = "COALESCE(CAST(NEW.importo AS INTEGER), 0)"
+
+# Aggiunge / toglie una riga di righe al suo totale (cliente, anno, ID_RI); i totali senza righe vengono eliminati
+_AGGIUNGI_NEW = f"""
+    INSERT INTO righe_agg (cliente, anno, ID_RI, totale, n_righe)
+    SELECT NEW.cliente, NEW.anno, c.ID_RI, {_IMPORTO_NEW}, 1 FROM conti c
+    WHERE c.id_co = NEW.Id_co AND c.ID_RI IS NOT NULL AND NEW.cliente IS NOT NULL AND NEW.anno IS NOT NULL
+    ON CONFLICT (cliente, anno, ID_RI) DO UPDATE SET totale = totale + excluded.totale, n_righe = n_righe + 1;"""
+_TOGLI_OLD = f"""
+    UPDATE righe_agg SET totale = totale - {_IMPORTO_OLD}, n_righe = n_righe - 1
+    WHERE cliente = OLD.cliente AND anno = OLD.anno AND ID_RI = (SELECT ID_RI FROM conti WHERE id_co = OLD.Id_co);
+    DELETE FROM righe_agg
+    WHERE cliente = OLD.cliente AND anno = OLD.anno AND ID_RI = (SELECT ID_RI FROM conti WHERE id_co = OLD.Id_co)
+      AND n_righe <= 0;"""
+
+
+def _ricalcola_id_ri(*id_ri: str) -> str:
+    """Istruzioni che ricostruiscono da righe i totali dei codici ID_RI indicati (modifiche al piano dei conti)"""
+    elenco = ', '.join(id_ri)
+    return f"""
+    DELETE FROM righe_agg WHERE ID_RI IN ({elenco});
+    INSERT INTO righe_agg (cliente, anno, ID_RI, totale, n_righe)
+    SELECT r.cliente, r.anno, c.ID_RI, SUM(COALESCE(CAST(r.importo AS INTEGER), 0)), COUNT(*)
+    FROM conti c JOIN righe r ON r.Id_co = c.id_co
+    WHERE c.ID_RI IN ({elenco}) AND r.cliente IS NOT NULL AND r.anno IS NOT NULL
+    GROUP BY r.cliente, r.anno, c.ID_RI;"""
+
+
+def _migrazione_3_righe_agg(conn: sqlite3.Connection) -> None:
+    """righe_agg: totali per (cliente, anno, ID_RI) mantenuti da trigger su righe e conti"""
+    if not (_tabella_esiste(conn, 'righe') and _tabella_esiste(conn, 'conti')):
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS righe_agg (
+            cliente TEXT NOT NULL, anno INTEGER NOT NULL, ID_RI TEXT NOT NULL,
+            totale INTEGER NOT NULL, n_righe INTEGER NOT NULL,
+            PRIMARY KEY (cliente, anno, ID_RI)
+        ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_righe_agg_anno ON righe_agg (anno, ID_RI, totale)")
+    conn.execute("DELETE FROM righe_agg")
+    conn.execute("""
+        INSERT INTO righe_agg (cliente, anno, ID_RI, totale, n_righe)
+        SELECT r.cliente, r.anno, c.ID_RI, SUM(COALESCE(CAST(r.importo AS INTEGER), 0)), COUNT(*)
+        FROM righe r JOIN conti c ON r.Id_co = c.id_co
+        WHERE c.ID_RI IS NOT NULL AND r.cliente IS NOT NULL AND r.anno IS NOT NULL
+        GROUP BY r.cliente, r.anno, c.ID_RI""")
+
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_righe_agg_insert AFTER INSERT ON righe BEGIN {_AGGIUNGI_NEW} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_righe_agg_delete AFTER DELETE ON righe BEGIN {_TOGLI_OLD} END")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_righe_agg_update
+        AFTER UPDATE OF cliente, anno, Id_co, importo ON righe BEGIN {_TOGLI_OLD} {_AGGIUNGI_NEW} END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_conti_agg_update
+        AFTER UPDATE OF id_co, ID_RI ON conti BEGIN {_ricalcola_id_ri('OLD.ID_RI', 'NEW.ID_RI')} END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_conti_agg_insert
+        AFTER INSERT ON conti BEGIN {_ricalcola_id_ri('NEW.ID_RI')} END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_conti_agg_delete
+        AFTER DELETE ON conti BEGIN {_ricalcola_id_ri('OLD.ID_RI')} END""")
+
+
+# (versione, descrizione, funzione): aggiungere sempre in coda con versione crescente
+MIGRAZIONI: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "Chiavi primarie su conti e ricla", _migrazione_1_chiavi_primarie),
+    (2, "Indici su righe (cliente, anno) e Id_co", _migrazione_2_indici_righe),
+    (3, "Totali aggregati righe_agg mantenuti da trigger", _migrazione_3_righe_agg),
+]
+VERSIONE_CORRENTE = MIGRAZIONI[-1][0]
+
+
+def versione_schema(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def applica_migrazioni(conn: sqlite3.Connection) -> int:
+    """Applica le migrazioni mancanti e restituisce la versione finale dello schema"""
+    versione = versione_schema(conn)
+    for numero, descrizione, migrazione in MIGRAZIONI:
+        if numero <= versione:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Un'altra connessione potrebbe averla applicata nel frattempo
+            if versione_schema(conn) >= numero:
+                conn.rollback()
+                versione = versione_schema(conn)
+                continue
+            migrazione(conn)
+            conn.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        versione = numero
+        print(f"🛠️ Migrazione {numero} applicata: {descrizione}")
+    if versione_schema(conn) == VERSIONE_CORRENTE:
+        conn.execute("PRAGMA optimize")
+    return versione
+
+
+def richiede_migrazioni(percorso: str) -> bool:
+    """Solo i database dei dati (business_plan_*.db) seguono queste migrazioni, non users.db"""
+    return PREFISSO_DATABASE in percorso.replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def migra_tutti(cartella: str = ".") -> None:
+    """Aggiorna lo schema di tutti i database business_plan_*.db presenti nella cartella"""
+    import database  # import locale: database importa questo modulo
+    for percorso in sorted(glob.glob(f"{cartella}/{PREFISSO_DATABASE}*.db")):
+        database.pool(percorso)
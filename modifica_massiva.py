@@ -0,0 +1,105 @@
+# modifica_massiva.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Modifica a griglia di un intero bilancio (cliente, anno) della tabella righe.
+# La griglia modificata viene confrontata con quella caricata: solo le righe nuove,
+# cambiate o tolte diventano INSERT / UPDATE / DELETE, eseguite con executemany in
+# un'unica transazione. Gli UPDATE e i DELETE controllano anche i valori originali:
+# se nel frattempo un record è stato cambiato altrove la transazione viene annullata.
+
+from typing import Dict
+
+import pandas as pd
+
+import database
+
+COLONNE_GRIGLIA = ('ID', 'Id_co', 'importo')
+
+
+class ConflittoModifica(Exception):
+    """Record modificati o eliminati da un'altra sessione dopo il caricamento della griglia"""
+
+
+def carica_bilancio(percorso_db: str, cliente: str, anno: int) -> pd.DataFrame:
+    """Record del bilancio (ID, Id_co, importo) ordinati per conto, pronti per la griglia"""
+    with database.connessione(percorso_db) as conn:
+        return pd.read_sql_query(
+            "SELECT ID, Id_co, importo FROM righe WHERE cliente = ? AND anno = ? ORDER BY Id_co, ID",
+            conn, params=(cliente, int(anno)))
+
+
+def calcola_differenze(originale: pd.DataFrame, modificato: pd.DataFrame, codici_validi) -> Dict[str, pd.DataFrame]:
+    """
+    Confronto vettoriale tra la griglia caricata e quella modificata.
+    Restituisce i DataFrame inserimenti (Id_co, importo), aggiornamenti (ID, Id_co, importo
+    con i valori originali in Id_co_orig / importo_orig), eliminazioni (ID, Id_co, importo)
+    e scarti (righe non valide, con il motivo).
+    """
+    modificato = modificato.reindex(columns=list(COLONNE_GRIGLIA)).copy()
+    modificato['Id_co'] = modificato['Id_co'].astype('string').str.strip()
+    modificato['importo'] = pd.to_numeric(modificato['importo'], errors='coerce')
+    # Righe aggiunte e poi lasciate completamente vuote nella griglia: ignorate
+    modificato = modificato[~(modificato['ID'].isna() & modificato['Id_co'].isna() & modificato['importo'].isna())]
+
+    motivo = pd.Series('', index=modificato.index, dtype=object)
+    motivo[~modificato['Id_co'].isin(pd.Index(codici_validi))] = 'codice conto inesistente'
+    motivo[modificato['importo'].isna()] = 'importo non numerico'
+    motivo[modificato['importo'].notna() & (modificato['importo'] % 1 != 0)] = 'importo non intero'
+    validi = motivo == ''
+    scarti = modificato[~validi].assign(motivo=motivo[~validi])
+    modificato = modificato[validi].astype({'importo': 'int64'})
+
+    nuovi = modificato['ID'].isna()
+    inserimenti = modificato.loc[nuovi, ['Id_co', 'importo']]
+
+    esistenti = modificato[~nuovi].astype({'ID': 'int64'})
+    confronto = originale.merge(esistenti, on='ID', how='left', suffixes=('_orig', ''), indicator=True)
+    eliminazioni = confronto.loc[confronto['_merge'] == 'left_only', ['ID', 'Id_co_orig', 'importo_orig']] \
+        .rename(columns={'Id_co_orig': 'Id_co', 'importo_orig': 'importo'})
+    presenti = confronto[confronto['_merge'] == 'both']
+    cambiati = (presenti['Id_co'] != presenti['Id_co_orig']) | (presenti['importo'] != presenti['importo_orig'])
+    aggiornamenti = presenti.loc[cambiati, ['ID', 'Id_co', 'importo', 'Id_co_orig', 'importo_orig']]
+
+    return {
+        'inserimenti': inserimenti.reset_index(drop=True),
+        'aggiornamenti': aggiornamenti.reset_index(drop=True),
+        'eliminazioni': eliminazioni.reset_index(drop=True),
+        'scarti': scarti.reset_index(drop=True),
+    }
+
+
+def _parametri(df: pd.DataFrame, colonne) -> list:
+    """Tuple di tipi Python nativi per executemany (sqlite3 non accetta numpy.int64)"""
+    return list(zip(*(df[c].astype(object).where(df[c].notna(), None).tolist() for c in colonne))) if len(df) else []
+
+
+def applica_differenze(percorso_db: str, cliente: str, anno: int, differenze: Dict[str, pd.DataFrame]) -> Dict[str, int]:
+    """
+    Applica inserimenti, aggiornamenti ed eliminazioni in un'unica transazione.
+    Solleva ConflittoModifica (senza scrivere nulla) se un record da aggiornare o eliminare
+    non ha più i valori caricati nella griglia.
+    """
+    anno = int(anno)
+    inserimenti = [(cliente, anno, id_co, importo)
+                   for id_co, importo in _parametri(differenze['inserimenti'], ('Id_co', 'importo'))]
+    aggiornamenti = [(id_co, importo, id_riga, cliente, anno, id_co_orig, importo_orig)
+                     for id_riga, id_co, importo, id_co_orig, importo_orig in
+                     _parametri(differenze['aggiornamenti'], ('ID', 'Id_co', 'importo', 'Id_co_orig', 'importo_orig'))]
+    eliminazioni = [(id_riga, cliente, anno, id_co, importo)
+                    for id_riga, id_co, importo in _parametri(differenze['eliminazioni'], ('ID', 'Id_co', 'importo'))]
+
+    with database.transazione(percorso_db) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # rowcount di executemany = righe toccate dalle istruzioni (esclusi i trigger di righe_agg)
+        if aggiornamenti and conn.executemany("""
+                UPDATE righe SET Id_co = ?, importo = ?
+                WHERE ID = ? AND cliente = ? AND anno = ? AND Id_co IS ? AND importo IS ?""",
+                aggiornamenti).rowcount != len(aggiornamenti):
+            raise ConflittoModifica("Alcuni record sono stati modificati da un'altra sessione: ricaricare il bilancio.")
+        if eliminazioni and conn.executemany("""
+                DELETE FROM righe
+                WHERE ID = ? AND cliente = ? AND anno = ? AND Id_co IS ? AND importo IS ?""",
+                eliminazioni).rowcount != len(eliminazioni):
+            raise ConflittoModifica("Alcuni record sono stati modificati da un'altra sessione: ricaricare il bilancio.")
+        if inserimenti:
+            conn.executemany("INSERT INTO righe (cliente, anno, Id_co, importo) VALUES (?, ?, ?, ?)", inserimenti)
+
+    return {'inseriti': len(inserimenti), 'aggiornati': len(aggiornamenti), 'eliminati': len(eliminazioni)}
@@ -0,0 +1,170 @@
+# montecarlo.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Simulazione Monte Carlo del Business Plan.
+# Ogni assumption può avere una distribuzione (normale, triangolare, uniforme) attorno
+# al suo valore: si generano N scenari, si proiettano a lotti con projection_engine
+# (stesse formule di BusinessPlanProjections._calcola_anno_proiezione) e si conservano
+# solo gli indicatori di sintesi, così la memoria resta limitata anche con 100k scenari.
+# I lotti sono inviati al pool di processi condiviso (worker_pool: processi avviati
+# dall'ospite avvio_lavori, non dalla pagina; thread nell'eseguibile PyInstaller); il
+# risultato dipende solo dal seme, non da come i lotti sono distribuiti.
+
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from business_plan_assumptions import ASSUMPTION_DEFINITIONS
+import projection_engine
+from projection_engine import IDX_RI, N_RI
+import worker_pool
+
+DISTRIBUZIONI = ('normale', 'triangolare', 'uniforme')
+INDICATORI = ('EBITDA', 'RISULTATO NETTO', 'PFN', 'LIQUIDITA')
+PERCENTILI_DEFAULT = (5, 25, 50, 75, 95)
+MEMORIA_LOTTO_MB = 64
+# Lotti inviati al pool e non ancora ritirati: limita la memoria dei risultati in attesa
+LOTTI_IN_CODA_MAX = 2 * worker_pool.PROCESSI_MAX
+
+# Assumption perturbate che non possono diventare negative (percentuali di incidenza, giorni, indici)
+_TIPI_NON_NEGATIVI = ('percentuale', 'giorni', 'indice')
+_NON_NEGATIVE = np.array([a['tipo'] in _TIPI_NON_NEGATIVI for a in ASSUMPTION_DEFINITIONS])
+
+
+def calcola_indicatori(proiezioni: np.ndarray) -> np.ndarray:
+    """
+    Estrae gli indicatori di sintesi da una proiezione (..., anni, N_RI).
+    Restituisce (..., len(INDICATORI), anni). EBITDA e PFN seguono le formule dei report.
+    """
+    v = lambda codice: proiezioni[..., IDX_RI[codice]]
+    valore_produzione = v('RI01') + v('RI02') + v('RI03') + v('RI04')
+    costi_produzione = v('RI05') + v('RI06') + v('RI07') + v('RI08') - v('RI09')
+    ebitda = valore_produzione - costi_produzione - v('RI10')
+    return np.stack([ebitda, v('RI18'), v('RI33') - v('RI31'), v('RI31')], axis=-2)
+
+
+def campiona_matrici(matrice: np.ndarray, distribuzioni: Dict[int, Dict], n_scenari: int,
+                     rng: np.random.Generator, shock_per_anno: bool = False) -> np.ndarray:
+    """
+    Genera n_scenari matrici di assumption (n, 26, durata) perturbando la matrice centrale.
+    distribuzioni: {assumption_id: {'tipo': 'normale'|'triangolare'|'uniforme', 'ampiezza': x}}
+      - normale: deviazione standard pari ad ampiezza
+      - triangolare / uniforme: intervallo [valore - ampiezza, valore + ampiezza] (moda = valore)
+    L'ampiezza è espressa nell'unità dell'assumption (punti %, giorni, euro).
+    Con shock_per_anno=False lo stesso scostamento vale per tutti gli anni dello scenario.
+    """
+    durata = matrice.shape[-1]
+    campioni = np.broadcast_to(matrice, (n_scenari,) + matrice.shape).copy()
+    colonne = durata if shock_per_anno else 1
+    for ass_id, spec in sorted(distribuzioni.items()):
+        tipo, ampiezza = spec.get('tipo', 'normale'), float(spec.get('ampiezza', 0))
+        if ampiezza <= 0:
+            continue
+        forma = (n_scenari, colonne)
+        if tipo == 'normale':
+            scostamento = rng.normal(0.0, ampiezza, forma)
+        elif tipo == 'triangolare':
+            scostamento = rng.triangular(-ampiezza, 0.0, ampiezza, forma)
+        elif tipo == 'uniforme':
+            scostamento = rng.uniform(-ampiezza, ampiezza, forma)
+        else:
+            raise ValueError(f"Distribuzione non valida: {tipo}. Valori ammessi: {', '.join(DISTRIBUZIONI)}")
+        campioni[:, ass_id, :] += scostamento
+        if ass_id < len(_NON_NEGATIVE) and _NON_NEGATIVE[ass_id]:
+            np.maximum(campioni[:, ass_id, :], 0.0, out=campioni[:, ass_id, :])
+    return campioni
+
+
+def dimensione_lotto(durata: int, memoria_mb: float = MEMORIA_LOTTO_MB) -> int:
+    """Numero di scenari per lotto tale che proiezione e temporanei restino entro memoria_mb"""
+    # proiezione (durata+1 × N_RI) + matrice assumption + circa 4 copie di lavoro per voce
+    byte_scenario = 8 * ((durata + 1) * N_RI + len(ASSUMPTION_DEFINITIONS) * durata + 4 * N_RI * 8)
+    return max(1, int(memoria_mb * 1024 * 1024 // byte_scenario))
+
+
+def _simula_lotto(riga_base: np.ndarray, matrice: np.ndarray, distribuzioni: Dict[int, Dict], n_scenari: int,
+                  seme: np.random.SeedSequence, shock_per_anno: bool, metodo: str) -> np.ndarray:
+    """Simula un lotto di scenari e restituisce solo gli indicatori (n, len(INDICATORI), anni)"""
+    rng = np.random.default_rng(seme)
+    campioni = campiona_matrici(matrice, distribuzioni, n_scenari, rng, shock_per_anno)
+    proiezioni = projection_engine.calcola_proiezioni_array(riga_base, campioni, metodo=metodo)
+    return calcola_indicatori(proiezioni)
+
+
+class RisultatoMonteCarlo:
+    """Indicatori simulati per scenario e anno, con percentili e probabilità di downside"""
+
+    def __init__(self, anni: List[int], valori: np.ndarray):
+        self.anni = list(anni)
+        self.valori = valori  # (n_scenari, len(INDICATORI), anni)
+
+    @property
+    def n_scenari(self) -> int:
+        return self.valori.shape[0]
+
+    def _serie(self, indicatore: str) -> np.ndarray:
+        if indicatore not in INDICATORI:
+            raise ValueError(f"Indicatore non valido: {indicatore}. Valori ammessi: {', '.join(INDICATORI)}")
+        return self.valori[:, INDICATORI.index(indicatore), :]
+
+    def percentili(self, indicatore: str, percentili: Sequence[float] = PERCENTILI_DEFAULT) -> pd.DataFrame:
+        """Bande percentili per anno: righe P5, P25, ..., colonne anni"""
+        bande = np.percentile(self._serie(indicatore), percentili, axis=0)
+        return pd.DataFrame(bande, index=[f"P{p:g}" for p in percentili], columns=self.anni)
+
+    def probabilita(self, indicatore: str, soglia: float, sotto: bool = True) -> pd.Series:
+        """Probabilità per anno che l'indicatore sia sotto (o sopra) la soglia"""
+        serie = self._serie(indicatore)
+        esito = serie < soglia if sotto else serie > soglia
+        return pd.Series(esito.mean(axis=0), index=self.anni)
+
+    def riepilogo_downside(self) -> pd.DataFrame:
+        """Probabilità di downside principali per gli anni di piano (anno base escluso)"""
+        pfn_base = self._serie('PFN')[0, 0]
+        riepilogo = pd.DataFrame({
+            'EBITDA negativo': self.probabilita('EBITDA', 0.0),
+            'Perdita d\'esercizio': self.probabilita('RISULTATO NETTO', 0.0),
+            'PFN oltre anno base': self.probabilita('PFN', pfn_base, sotto=False),
+        })
+        return riepilogo.iloc[1:]
+
+
+def simula(riga_base: np.ndarray, matrice: np.ndarray, distribuzioni: Dict[int, Dict], anni: List[int],
+           n_scenari: int = 10000, seme: Optional[int] = None, shock_per_anno: bool = False,
+           in_pool: bool = True, memoria_lotto_mb: float = MEMORIA_LOTTO_MB,
+           metodo: str = 'analitico') -> RisultatoMonteCarlo:
+    """
+    Esegue la simulazione a lotti. Con in_pool=True i lotti sono calcolati nel pool condiviso
+    (worker_pool), con in_pool=False nel processo corrente.
+    """
+    riga_base = np.asarray(riga_base, dtype=np.float64)
+    matrice = np.asarray(matrice, dtype=np.float64)
+    lotto = dimensione_lotto(matrice.shape[-1], memoria_lotto_mb)
+    dimensioni = [min(lotto, n_scenari - inizio) for inizio in range(0, n_scenari, lotto)]
+    semi = np.random.SeedSequence(seme).spawn(len(dimensioni))
+    argomenti = [(riga_base, matrice, distribuzioni, n, s, shock_per_anno, metodo) for n, s in zip(dimensioni, semi)]
+
+    if in_pool and len(argomenti) > 1:
+        risultati, inviati = [], deque()
+        try:
+            for i, args in enumerate(argomenti):
+                inviati.append(worker_pool.invia(_simula_lotto, *args,
+                                                 descrizione=f"Monte Carlo, lotto {i + 1}/{len(argomenti)}"))
+                if len(inviati) >= LOTTI_IN_CODA_MAX:
+                    risultati.append(worker_pool.risultato(inviati.popleft()))
+            while inviati:
+                risultati.append(worker_pool.risultato(inviati.popleft()))
+        finally:
+            for id_lavoro in inviati:  # dopo un errore i lotti ancora in coda non servono più
+                worker_pool.annulla(id_lavoro)
+    else:
+        risultati = [_simula_lotto(*args) for args in argomenti]
+    return RisultatoMonteCarlo(anni, np.concatenate(risultati, axis=0))
+
+
+def simula_da_proiezioni(bp_projections, distribuzioni: Dict[int, Dict], n_scenari: int = 10000,
+                         **kwargs) -> RisultatoMonteCarlo:
+    """Simulazione attorno a un BusinessPlanProjections già inizializzato con i dati storici"""
+    riga_base = projection_engine.riga_da_dizionario(bp_projections.dati_proiettati.get(bp_projections.anno_base, {}))
+    matrice = projection_engine.matrice_assumptions(bp_projections.assumptions, bp_projections.durata)
+    return simula(riga_base, matrice, distribuzioni, bp_projections.anni_bp, n_scenari, **kwargs)
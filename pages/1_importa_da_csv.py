@@ -1,9 +1,14 @@
-# 05_Importa_da_CSV.py - Versione 1 - 2025-06-16
+# 05_Importa_da_CSV.py - Versione 2 - 2026-10-17
+# MODIFICA 2026-10-17: importazione massiva tramite import_csv (lettura a blocchi,
+# validazione dei codici conto, executemany in un'unica transazione, modalità aggiungi/sostituisci/upsert)
 
 import streamlit as st
-import pandas as pd
-import sqlite3
-import io
+import database
+import import_csv
+
+def get_database_name():
+    """Restituisce il database dell'utente corrente"""
+    return database.database_utente(st.session_state.get('username'))
 
 st.title("📥 Importa bilancio da file CSV")
 
@@ -20,32 +25,43 @@ file = st.file_uploader("Carica il file CSV", type=["csv"])
 
 if file:
     try:
-        df = pd.read_csv(file)
+        anteprima = import_csv.anteprima_csv(file)
     except Exception as e:
         st.error(f"Errore nella lettura del CSV: {e}")
         st.stop()
 
-    richieste = {"cliente", "anno", "codice", "importo"}
-    colonne_presenti = set(df.columns.str.lower())
-
-    if not richieste.issubset(colonne_presenti):
-        st.error("Il file deve contenere almeno le colonne: cliente, anno, codice, importo")
+    if anteprima is None:
+        st.error("Il file non contiene righe")
         st.stop()
 
-    df.columns = df.columns.str.lower()
-    df = df[["cliente", "anno", "codice", "importo"]]
+    st.success("✅ File caricato correttamente. Ecco un'anteprima (prime 100 righe):")
+    st.dataframe(anteprima)
 
-    st.success("✅ File caricato correttamente. Ecco un'anteprima:")
-    st.dataframe(df)
+    modalita = st.radio("Modalità di importazione", list(import_csv.MODALITA_IMPORT),
+                        format_func=import_csv.MODALITA_IMPORT.get)
+    ignora_scarti = st.checkbox("Importa comunque le righe valide se alcune righe sono errate", value=False)
 
     if st.button("✅ Importa nel database"):
-        conn = sqlite3.connect(get_database_name())
-        cur = conn.cursor()
-        for _, row in df.iterrows():
-            cur.execute("""
-                INSERT INTO righe (cliente, anno, Id_co, importo)
-                VALUES (?, ?, ?, ?)
-            """, (row["cliente"], row["anno"], row["codice"], row["importo"]))
-        conn.commit()
-        conn.close()
-        st.success("🎉 Importazione completata con successo!")
+        try:
+            with st.spinner("Importazione in corso..."):
+                esito = import_csv.importa_csv(file, get_database_name(), modalita, ignora_scarti)
+        except Exception as e:
+            st.error(f"Errore durante l'importazione, nessuna riga è stata scritta: {e}")
+            st.stop()
+        finally:
+            file.seek(0)
+
+        scartate = esito['scartate']
+        if not scartate.empty:
+            if esito['eseguita']:
+                st.warning(f"⚠️ {len(scartate)} righe scartate perché non valide:")
+            else:
+                st.error(f"❌ {len(scartate)} righe non valide su {esito['lette']}: nessuna riga è stata importata.")
+            st.dataframe(scartate)
+
+        if esito['eseguita']:
+            coppie = ", ".join(f"{cliente} {anno}" for cliente, anno in esito['coppie'])
+            messaggio = f"🎉 Importazione completata: {esito['importate']} righe importate ({coppie})"
+            if esito['eliminate']:
+                messaggio += f", {esito['eliminate']} righe precedenti sostituite"
+            st.success(messaggio)
@@ -1,6 +1,7 @@
 # pages/inserisci.py - Progetto Business Plan Pro - versione 1.0 - 2025-06-06
 import streamlit as st
 import sqlite3
+import database
 import pandas as pd
 import sidebar_filtri # Importa il modulo della sidebar per i filtri globali
 
@@ -20,7 +21,7 @@ DATABASE_NAME = get_database_name()
 
 st.title("➕ Nuovo Inserimento")
 
-conn = sqlite3.connect(DATABASE_NAME)
+conn = database.connetti(DATABASE_NAME)
 
 # --- Recupero dati per i Selectbox ---
 
@@ -1,17 +1,18 @@
 # pages/visualizza.py - Progetto Business Plan Pro - versione 2.5 - 2025-06-21
 # Obiettivo: Ripristino logica originale click-per-riga per modifica,
 # con ottimizzazione layout per leggibilità colonne.
+# MODIFICA 2026-10-17: griglia paginata e ordinabile lato server (consulta_righe, LIMIT/OFFSET):
+# vengono caricate e disegnate solo le righe della pagina; esportazione completa su richiesta.
+# MODIFICA 2026-10-17: Excel e PDF generati al click del download (export_service), senza pulsante di preparazione
+# MODIFICA 2026-10-17: PDF dal motore comune pdf_renderer (LongTable, intestazione ripetuta su ogni pagina)
+# MODIFICA 2026-10-17: reportlab importato solo alla generazione del PDF, non all'apertura della pagina
+# MODIFICA 2026-10-17: PDF con generatore e formattazione di export_service (elenchi lunghi generati nel pool di processi)
 
 import streamlit as st
-import sqlite3
+import consulta_righe
+import export_service
 import pandas as pd
 import sidebar_filtri # Importa il modulo della sidebar per i filtri globali
-import io
-from reportlab.lib.pagesizes import letter, A4, landscape 
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
 
 # Chiama la funzione per visualizzare i filtri nella sidebar (saranno sempre visibili)
 sidebar_filtri.display_sidebar_filters()
@@ -37,178 +38,128 @@ st.title("📋 Visualizza Record")
 st.markdown(f"**Filtri applicati:** Cliente: **{selected_cliente}** | Anni: **{', '.join(selected_anni_list) if selected_anni_list else 'Tutti'}** | Sezione: **{selected_sezione}**")
 st.markdown("---")
 
-# Connessione al database
-conn = None 
-df_filtered = pd.DataFrame() 
+# Filtro comune a conteggio, pagina ed esportazione
+filtro = consulta_righe.filtro_righe(selected_cliente, selected_anni_list, selected_sezione)
+n_record, total_importo = 0, 0
 
 try:
-    # MODIFICATO: Usa DATABASE_NAME che ora punta al database utente
-    conn = sqlite3.connect(DATABASE_NAME)
-    query = """
-    SELECT r.ID, r.cliente, r.anno, r.importo, c.Conto, c.Sezione, c.Parte
-    FROM righe r
-    JOIN conti c ON r.Id_co = c.id_co
-    WHERE 1=1
-    """
-    params = []
-
-    if selected_cliente != "Tutti":
-        query += " AND r.cliente = ?"
-        params.append(selected_cliente)
-    
-    if selected_anni_list: 
-        years_placeholders = ','.join(['?' for _ in selected_anni_list])
-        query += f" AND r.anno IN ({years_placeholders})"
-        params.extend([str(y) for y in selected_anni_list]) 
-
-    if selected_sezione != "Tutte": 
-        query += " AND c.Sezione = ?"
-        params.append(selected_sezione)
-
-    df_filtered = pd.read_sql_query(query, conn, params=params)
+    # Conteggio e subtotale in un'unica query aggregata (nessun record caricato)
+    n_record, total_importo = consulta_righe.conta_righe(DATABASE_NAME, filtro)
 
 except pd.io.sql.DatabaseError as e:
     st.error(f"ERRORE GRAVE NEL CARICAMENTO DEI DATI DAL DATABASE (DatabaseError): {e}")
     # MODIFICATO: Messaggio di errore aggiornato
     st.info(f"Assicurati che il database '{DATABASE_NAME}' sia presente nella cartella principale e che le tabelle 'righe', 'conti', 'ricla' esistano e siano popolate.")
-    df_filtered = pd.DataFrame()
 except Exception as e:
     st.error(f"ERRORE GENERICO NEL CARICAMENTO DEI DATI: {e}")
-    df_filtered = pd.DataFrame()
-finally:
-    if conn:
-        conn.close()
-
-# --- Calcolo Subtotale Importo ---
-total_importo = 0
-if not df_filtered.empty:
-    try:
-        df_filtered['importo'] = pd.to_numeric(df_filtered['importo'], errors='coerce').fillna(0).astype(int)
-        total_importo = df_filtered['importo'].sum()
-    except Exception as e:
-        st.warning(f"Impossibile calcolare il subtotale Importo: {e}. Controlla i tipi di dato nella colonna 'importo'.")
-        total_importo = 0
 
 # Formattazione del subtotale
 total_importo_formatted = f"{int(total_importo):,}".replace(",", "X").replace(".", ",").replace("X", ".")
 
 # --- Visualizzazione Subtotale ---
-st.markdown(f"**Subtotale Importo Filtrato:** € {total_importo_formatted}")
+st.markdown(f"**Subtotale Importo Filtrato:** € {total_importo_formatted} ({n_record} record)")
 st.markdown("---")
 
 
-# --- Sezione Esportazione (codice invariato) ---
-st.subheader("Esporta Dati")
-if not df_filtered.empty:
+# Colonne del PDF e larghezze relative
+PDF_COLONNE = ['ID Record', 'Cliente', 'Anno', 'Nome Conto', 'Sezione Conto', 'Importo']
+PDF_PESI = [0.5, 1.5, 0.6, 1.5, 0.8, 1.0]
+
+
+def dati_esportazione(percorso_db, filtro_righe):
+    """Tutti i record filtrati, con colonne e intestazioni dell'esportazione"""
+    df_filtered = consulta_righe.tutte_le_righe(percorso_db, filtro_righe)
+    df_filtered['importo'] = pd.to_numeric(df_filtered['importo'], errors='coerce').fillna(0).astype(int)
     df_export = df_filtered[['ID', 'cliente', 'anno', 'importo', 'Conto', 'Sezione']].copy()
-    df_export = df_export.rename(columns={
+    return df_export.rename(columns={
         'ID': 'ID Record', 'cliente': 'Cliente', 'anno': 'Anno',
         'importo': 'Importo', 'Conto': 'Nome Conto', 'Sezione': 'Sezione Conto'
     })
 
+
+def excel_dati(percorso_db, filtro_righe):
+    """Excel dei record filtrati: lettura al click, file riusato se i dati sono gli stessi"""
+    return export_service.genera_file(export_service.excel_tabella, dati_esportazione(percorso_db, filtro_righe),
+                                      'Dati Business Plan', colonne_numeriche=['Importo'])
+
+
+def pdf_dati(percorso_db, filtro_righe, filtri_applicati):
+    """PDF dei record filtrati: lettura al click, file riusato se i dati sono gli stessi"""
+    return export_service.genera_file(
+        export_service.report_pdf, dati_esportazione(percorso_db, filtro_righe)[PDF_COLONNE], "Report Business Plan Dati",
+        f"<b>Filtri applicati:</b> {filtri_applicati}", formatta=export_service.formatta_importo,
+        colonne_testo=PDF_COLONNE[:-1], pesi=PDF_PESI, stile='elenco', a_capo=False)
+
+
+# --- Sezione Esportazione (file generati solo su richiesta) ---
+st.subheader("Esporta Dati")
+if n_record:
+    # I file vengono generati solo al click del download (export_service)
+    filtri_applicati = (f"Cliente: {selected_cliente} | Anni: {', '.join(selected_anni_list) if selected_anni_list else 'Tutti'}"
+                        f" | Sezione: {selected_sezione}")
     col_excel, col_pdf = st.columns(2)
 
     with col_excel:
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
-            df_export.to_excel(writer, index=False, sheet_name='Dati Business Plan')
-            workbook = writer.book
-            worksheet = writer.sheets['Dati Business Plan']
-            num_format = workbook.add_format({'num_format': '#,##0'}) 
-            worksheet.set_column('D:D', None, num_format) 
-
-        excel_buffer.seek(0)
         st.download_button(
-            label="Esporta in Excel", data=excel_buffer, file_name="business_plan_data.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            help="Esporta i dati filtrati in un file Excel."
+            label="Esporta in Excel", data=lambda: excel_dati(DATABASE_NAME, filtro), file_name="business_plan_data.xlsx",
+            mime=export_service.MIME['xlsx'], on_click="ignore",
+            help=f"Esporta i {n_record} record filtrati in un file Excel."
         )
 
     with col_pdf:
-        def generate_pdf(df_data, title, filters_applied):
-            buffer = io.BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4) 
-            styles = getSampleStyleSheet()
-            if 'bold_text' not in styles:
-                styles.add(ParagraphStyle(name='bold_text', parent=styles['Normal'], fontName='Helvetica-Bold'))
-            if 'normal_text' not in styles:
-                styles.add(ParagraphStyle(name='normal_text', parent=styles['Normal'], fontName='Helvetica'))
-            if 'right_text' not in styles:
-                styles.add(ParagraphStyle(name='right_text', parent=styles['Normal'], alignment=2))  # 2 = right align
-            if 'right_bold_text' not in styles:
-                styles.add(ParagraphStyle(name='right_bold_text', parent=styles['Normal'], alignment=2, fontName='Helvetica-Bold'))
-
-            story = []
-
-            story.append(Paragraph(title, styles['h2']))
-            story.append(Spacer(1, 0.2 * inch))
-            story.append(Paragraph(f"<b>Filtri applicati:</b> {filters_applied}", styles['Normal']))
-            story.append(Spacer(1, 0.2 * inch))
-            
-            pdf_cols_to_include = ['ID Record', 'Cliente', 'Anno', 'Nome Conto', 'Sezione Conto', 'Importo']
-            df_pdf_ready = df_data[pdf_cols_to_include].copy()
-
-            formatted_data_for_pdf = [df_pdf_ready.columns.tolist()] 
-            for row_data in df_pdf_ready.values.tolist(): 
-                new_row = []
-                for c_idx, cell_value in enumerate(row_data):
-                    if pdf_cols_to_include[c_idx] == 'Importo': 
-                        try:
-                            new_row.append(f"{int(cell_value):,}".replace(",", "X").replace(".", ",").replace("X", "."))
-                        except (ValueError, TypeError): 
-                            new_row.append(str(cell_value)) 
-                    else:
-                        new_row.append(str(cell_value))
-                formatted_data_for_pdf.append(new_row)
-
-            col_widths_pdf = []
-            total_cols = len(pdf_cols_to_include) 
-            base_width_per_col = doc.width / total_cols 
-
-            for col_name in pdf_cols_to_include:
-                if col_name == 'ID Record': col_widths_pdf.append(base_width_per_col * 0.5)
-                elif col_name == 'Anno': col_widths_pdf.append(base_width_per_col * 0.6)
-                elif col_name == 'Cliente': col_widths_pdf.append(base_width_per_col * 1.5) 
-                elif col_name == 'Nome Conto': col_widths_pdf.append(base_width_per_col * 1.5)
-                elif col_name == 'Sezione Conto': col_widths_pdf.append(base_width_per_col * 0.8) 
-                elif col_name == 'Importo': col_widths_pdf.append(base_width_per_col * 1.0)
-                else: col_widths_pdf.append(base_width_per_col * 1.0) 
-            
-            sum_widths = sum(col_widths_pdf)
-            col_widths_pdf = [w * (doc.width / sum_widths) for w in col_widths_pdf]
-
-
-            table_style = TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey), 
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'), 
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'), 
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white), 
-                ('GRID', (0, 0), (-1, -1), 0.25, colors.white), 
-                ('ALIGN', (pdf_cols_to_include.index('Importo'), 0), (pdf_cols_to_include.index('Importo'), -1), 'RIGHT'), 
-            ])
-            
-            table = Table(formatted_data_for_pdf, colWidths=col_widths_pdf) 
-            table.setStyle(table_style)
-            story.append(table)
-
-            doc.build(story)
-            buffer.seek(0)
-            return buffer
-
-        pdf_buffer = generate_pdf(df_export, "Report Business Plan Dati", 
-                                  f"Cliente: {selected_cliente} | Anni: {', '.join(selected_anni_list) if selected_anni_list else 'Tutti'} | Sezione: {selected_sezione}")
-        
         st.download_button(
-            label="Esporta in PDF", data=pdf_buffer, file_name="business_plan_data.pdf",
-            mime="application/pdf", help="Esporta i dati filtrati in un file PDF."
+            label="Esporta in PDF", data=lambda: pdf_dati(DATABASE_NAME, filtro, filtri_applicati),
+            file_name="business_plan_data.pdf", mime=export_service.MIME['pdf'], on_click="ignore",
+            help=f"Esporta i {n_record} record filtrati in un file PDF."
         )
 else:
     st.info("Nessun dato da esportare.")
 
 st.markdown("---") 
 
+# --- Ordinamento e paginazione (eseguiti da SQLite) ---
+col_ordina, col_direzione, col_per_pagina = st.columns([2, 1, 1])
+with col_ordina:
+    ordina_per = st.selectbox("Ordina per", list(consulta_righe.ORDINAMENTI), key="visualizza_ordina_per")
+with col_direzione:
+    discendente = st.radio("Direzione", ["Crescente", "Decrescente"], horizontal=True,
+                           key="visualizza_direzione") == "Decrescente"
+with col_per_pagina:
+    righe_per_pagina = st.selectbox("Record per pagina", consulta_righe.RIGHE_PER_PAGINA, index=1,
+                                    key="visualizza_per_pagina")
+
+n_pagine = max(1, -(-n_record // righe_per_pagina))
+# Torna alla prima pagina quando cambiano filtri, ordinamento o dimensione della pagina
+firma_vista = (DATABASE_NAME, filtro, ordina_per, discendente, righe_per_pagina)
+if st.session_state.get('visualizza_firma') != firma_vista:
+    st.session_state.visualizza_firma = firma_vista
+    st.session_state.visualizza_pagina = 1
+st.session_state.visualizza_pagina = min(max(1, st.session_state.get('visualizza_pagina', 1)), n_pagine)
+
+col_prec, col_pagina, col_succ = st.columns([1, 2, 1])
+with col_prec:
+    if st.button("◀ Precedente", disabled=st.session_state.visualizza_pagina <= 1, use_container_width=True):
+        st.session_state.visualizza_pagina -= 1
+        st.rerun()
+with col_pagina:
+    st.markdown(f"<div style='text-align: center'>Pagina <b>{st.session_state.visualizza_pagina}</b> di <b>{n_pagine}</b></div>",
+                unsafe_allow_html=True)
+with col_succ:
+    if st.button("Successiva ▶", disabled=st.session_state.visualizza_pagina >= n_pagine, use_container_width=True):
+        st.session_state.visualizza_pagina += 1
+        st.rerun()
+
+# Solo i record della pagina corrente
+df_pagina = pd.DataFrame()
+if n_record:
+    try:
+        df_pagina = consulta_righe.pagina_righe(DATABASE_NAME, filtro, st.session_state.visualizza_pagina,
+                                                righe_per_pagina, ordina_per, discendente)
+        df_pagina['importo'] = pd.to_numeric(df_pagina['importo'], errors='coerce').fillna(0).astype(int)
+    except Exception as e:
+        st.error(f"ERRORE NEL CARICAMENTO DELLA PAGINA: {e}")
+        df_pagina = pd.DataFrame()
+
 # --- CSS per la compattazione e allineamento (modificato per una migliore resa) ---
 st.markdown("""
 <style>
@@ -303,10 +254,10 @@ st.markdown("---") # Separatore dopo le intestazioni
 if 'last_confirmed_delete_id' not in st.session_state:
     st.session_state.last_confirmed_delete_id = None
 
-if df_filtered.empty:
+if df_pagina.empty:
     st.info("Nessun record trovato con i filtri selezionati.")
 else:
-    for index, row in df_filtered.iterrows():
+    for row in df_pagina.to_dict('records'):
         importo_formatted = f"{int(row['importo']):,}".replace(",", "X").replace(".", ",").replace("X", ".")
 
         col1, col2, col3, col4, col5, col6 = st.columns(cols_widths)
@@ -332,5 +283,5 @@ else:
                     
 # Reset dello stato di conferma se l'ID non corrisponde più a un record visualizzato
 # o se l'utente ha navigato via e torna.
-if st.session_state.get('last_confirmed_delete_id') and (df_filtered.empty or st.session_state.last_confirmed_delete_id not in df_filtered['ID'].tolist()):
+if st.session_state.get('last_confirmed_delete_id') and (df_pagina.empty or st.session_state.last_confirmed_delete_id not in df_pagina['ID'].tolist()):
     st.session_state.last_confirmed_delete_id = None
\ No newline at end of file
@@ -1,6 +1,10 @@
 # pages/modifica.py - Progetto Business Plan Pro - versione 1.0 - 2025-06-06
+# MODIFICA 2026-10-17: ricerca lato server (ID, cliente, anno, conto) con paginazione keyset (consulta_righe):
+# non vengono più caricati tutti i record a ogni esecuzione
 import streamlit as st
 import sqlite3
+import database
+import consulta_righe
 import pandas as pd
 import sidebar_filtri # Importa il modulo della sidebar per i filtri globali
 
@@ -18,76 +22,95 @@ def get_database_name():
 DATABASE_NAME = get_database_name()
 st.title("✏️ Modifica o Cancella Record")
 
-conn = sqlite3.connect(DATABASE_NAME)
+RECORD_PER_PAGINA = 50
+SEGNAPOSTO = "Seleziona un record per modificarlo..."
 
 # Recupera l'ID del record dalla session_state, se presente (se veniamo da visualizza.py)
 record_id_from_session = st.session_state.get('record_to_modify_id')
 current_record_id_selected = None # Variabile per tenere traccia dell'ID effettivamente selezionato nel selectbox
 
-# Recupera tutti i record per il selectbox, ordinati per ID
+# --- Ricerca lato server: solo la pagina di record corrispondenti viene caricata ---
+testo_ricerca = st.text_input("🔍 Cerca record (ID, cliente, anno o conto)", key="mod_ricerca",
+                              help="Più termini separati da spazio devono corrispondere tutti, es. 'Rossi 2024 banca'")
+# Paginazione keyset: pila degli ID da cui partono le pagine già visitate
+if st.session_state.get('mod_ricerca_precedente') != testo_ricerca:
+    st.session_state.mod_ricerca_precedente = testo_ricerca
+    st.session_state.mod_inizi_pagina = [None]
+
 try:
-    # Seleziona anche 'Id_co' perché è un campo del record da modificare
-    df_righe_all = pd.read_sql_query("SELECT ID, cliente, anno, importo, Id_co FROM righe ORDER BY ID ASC", conn)
+    df_pagina = consulta_righe.cerca_righe(DATABASE_NAME, testo_ricerca, st.session_state.mod_inizi_pagina[-1],
+                                           RECORD_PER_PAGINA + 1)
 except pd.io.sql.DatabaseError:
-    df_righe_all = pd.DataFrame(columns=['ID', 'cliente', 'anno', 'importo', 'Id_co']) # Crea un DataFrame vuoto
+    df_pagina = pd.DataFrame(columns=['ID', 'cliente', 'anno', 'importo', 'Id_co', 'Conto']) # Crea un DataFrame vuoto
     st.warning("Tabella 'righe' non trovata o vuota.")
-
-
-if not df_righe_all.empty:
-    # Prepara le opzioni per il selectbox in un formato leggibile
-    # Es: "ID - Cliente (Anno) - € Importo Formattato"
-    options_for_selectbox = [
-        f"{row['ID']} - {row['cliente']} ({row['anno']}) - € {int(row['importo']):,}".replace(",", "X").replace(".", ",").replace("X", ".")
-        for index, row in df_righe_all.iterrows()
-    ]
-    
+altre_pagine = len(df_pagina) > RECORD_PER_PAGINA
+df_pagina = df_pagina.head(RECORD_PER_PAGINA)
+
+# Record arrivato da visualizza.py: caricato direttamente per ID anche se non è nella pagina
+record_da_sessione = consulta_righe.leggi_riga(DATABASE_NAME, record_id_from_session) if record_id_from_session is not None else None
+if record_id_from_session is not None and record_da_sessione is None:
+    # Se l'ID dalla sessione non è valido (es. record cancellato), resetta la session_state
+    st.session_state.record_to_modify_id = None
+
+# Etichette "ID - Cliente (Anno) - € Importo - Conto" solo per i record della pagina
+etichette = {
+    id_riga: f"{id_riga} - {cliente} ({anno}) - € {int(importo or 0):,}".replace(",", "X").replace(".", ",").replace("X", ".")
+    + (f" - {conto}" if conto else "")
+    for id_riga, cliente, anno, importo, conto in zip(df_pagina['ID'], df_pagina['cliente'], df_pagina['anno'],
+                                                      df_pagina['importo'], df_pagina['Conto'])
+}
+if record_da_sessione is not None and record_da_sessione['ID'] not in etichette:
+    r = record_da_sessione
+    etichette = {r['ID']: f"{r['ID']} - {r['cliente']} ({r['anno']}) - € {int(r['importo'] or 0):,}".replace(",", "X").replace(".", ",").replace("X", "."),
+                 **etichette}
+
+if etichette:
+    opzioni = [None] + list(etichette)
     # --- Gestione del default_index per la pre-selezione ---
-    default_index_for_selectbox = 0 # Inizializza a 0 (prima opzione: "Seleziona un record...")
-    if record_id_from_session is not None:
-        # Cerca l'indice della riga nel DataFrame corrispondente all'ID passato dalla sessione
-        idx_in_df = df_righe_all[df_righe_all['ID'] == record_id_from_session].index
-        if not idx_in_df.empty:
-            # L'indice del selectbox sarà l'indice nel DataFrame + 1 (per l'opzione "Seleziona...")
-            default_index_for_selectbox = int(idx_in_df[0]) + 1
-        else:
-            # Se l'ID dalla sessione non è valido (es. record cancellato), resetta la session_state
-            st.session_state.record_to_modify_id = None
-            default_index_for_selectbox = 0 # Torna alla selezione predefinita
-    
-    # Aggiungi l'opzione iniziale "Seleziona un record..."
-    display_options_with_placeholder = ["Seleziona un record per modificarlo..."] + options_for_selectbox
+    default_index_for_selectbox = opzioni.index(record_da_sessione['ID']) if record_da_sessione is not None else 0
 
-    selected_option_str = st.selectbox(
+    current_record_id_selected = st.selectbox(
         "Scegli un record da modificare o cancellare:",
-        display_options_with_placeholder,
+        opzioni,
         index=default_index_for_selectbox, # Usa l'indice calcolato
+        format_func=lambda id_riga: SEGNAPOSTO if id_riga is None else etichette[id_riga],
         key="mod_record_selection_selectbox",
     )
 
-    if selected_option_str != "Seleziona un record per modificarlo...":
-        current_record_id_selected = int(selected_option_str.split(" - ")[0])
-    else:
-        current_record_id_selected = None
-
+    col_prec, col_info, col_succ = st.columns([1, 2, 1])
+    with col_prec:
+        if st.button("◀ Precedenti", disabled=len(st.session_state.mod_inizi_pagina) <= 1, key="mod_pagina_prec"):
+            st.session_state.mod_inizi_pagina.pop()
+            st.rerun()
+    with col_info:
+        st.caption(f"Pagina {len(st.session_state.mod_inizi_pagina)} - {len(df_pagina)} record")
+    with col_succ:
+        if st.button("Successivi ▶", disabled=not altre_pagine, key="mod_pagina_succ"):
+            st.session_state.mod_inizi_pagina.append(int(df_pagina['ID'].iloc[-1]))
+            st.rerun()
+
+elif testo_ricerca:
+    st.warning("Nessun record corrisponde alla ricerca.")
+    current_record_id_selected = None
 else:
     st.warning("Nessun record disponibile nella tabella 'righe' per la modifica.")
     current_record_id_selected = None
 
 # Procedi solo se un record è stato effettivamente selezionato
 if current_record_id_selected:
-    # Recupera i dati del record specifico usando l'ID selezionato dal selectbox
-    # Usiamo df_righe_all che abbiamo già caricato
-    df_record_to_edit = df_righe_all[df_righe_all['ID'] == current_record_id_selected]
+    # Recupera i dati del record specifico usando l'ID selezionato (lettura per chiave primaria)
+    record = consulta_righe.leggi_riga(DATABASE_NAME, current_record_id_selected)
     
-    if not df_record_to_edit.empty:
-        record = df_record_to_edit.iloc[0]
-
+    if record is not None:
         # Recupera i conti disponibili per il selectbox di Id_co
         try:
-            df_conti = pd.read_sql_query("SELECT id_co, Conto, Sezione FROM conti", conn)
-            conti_options_map = {row["Conto"]: row["id_co"] for index, row in df_conti.iterrows()}
+            with database.connessione(DATABASE_NAME) as conn:
+                df_conti = pd.read_sql_query("SELECT id_co, Conto, Sezione FROM conti", conn)
+            conti_options_map = dict(zip(df_conti["Conto"], df_conti["id_co"]))
             conti_names = sorted(conti_options_map.keys())
         except pd.io.sql.DatabaseError:
+            df_conti = pd.DataFrame(columns=["id_co", "Conto", "Sezione"])
+            conti_options_map = {}
             conti_names = []
             st.warning("Tabella 'conti' non trovata o vuota.")
 
@@ -121,9 +144,9 @@ if current_record_id_selected:
                 st.error("Seleziona un Conto valido per l'aggiornamento.")
             else:
                 try:
-                    conn.execute("UPDATE righe SET cliente=?, anno=?, importo=?, Id_co=? WHERE ID=?",
-                                 (edited_cliente, edited_anno, edited_importo, edited_id_co, current_record_id_selected))
-                    conn.commit()
+                    with database.transazione(DATABASE_NAME) as conn:
+                        conn.execute("UPDATE righe SET cliente=?, anno=?, importo=?, Id_co=? WHERE ID=?",
+                                     (edited_cliente, edited_anno, edited_importo, edited_id_co, current_record_id_selected))
                     st.success("Record aggiornato con successo.")
                     st.session_state.record_to_modify_id = None # Resetta l'ID
                     st.switch_page("pages/2_visualizza.py") # Torna alla pagina di visualizzazione
@@ -135,8 +158,8 @@ if current_record_id_selected:
         # Pulsante Elimina
         if st.button("Elimina Record", help="Questa azione non può essere annullata.", key="btn_delete_page"):
             try:
-                conn.execute("DELETE FROM righe WHERE ID=?", (current_record_id_selected,))
-                conn.commit()
+                with database.transazione(DATABASE_NAME) as conn:
+                    conn.execute("DELETE FROM righe WHERE ID=?", (current_record_id_selected,))
                 st.success("Record eliminato con successo.")
                 st.session_state.record_to_modify_id = None # Resetta l'ID
                 st.switch_page("pages/2_visualizza.py") # Torna alla pagina di visualizzazione
@@ -151,5 +174,3 @@ else:
     st.info("Seleziona un record dal menu a discesa qui sopra.")
     if st.button("Vai a Visualizza Record", key="mod_go_to_view_if_no_selection"):
         st.switch_page("pages/2_visualizza.py")
-
-conn.close()
\ No newline at end of file
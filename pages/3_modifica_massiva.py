@@ -0,0 +1,110 @@
+# pages/modifica_massiva.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Modifica a griglia di un intero bilancio (cliente, anno): le righe aggiunte, cambiate o
+# tolte vengono salvate insieme, in un'unica transazione (modifica_massiva.py)
+import streamlit as st
+import sqlite3
+import database
+import metadati_filtri
+import modifica_massiva
+import pandas as pd
+import sidebar_filtri # Importa il modulo della sidebar per i filtri globali
+
+# Chiama la funzione per visualizzare i filtri nella sidebar (saranno sempre visibili)
+sidebar_filtri.display_sidebar_filters()
+
+# Funzione per database utente
+def get_database_name():
+    """Restituisce il database dell'utente corrente"""
+    return database.database_utente(st.session_state.get('username'))
+
+DATABASE_NAME = get_database_name()
+
+st.title("📝 Modifica Massiva Bilancio")
+st.caption("Modifica importi e conti direttamente nella griglia, aggiungi o elimina righe, poi salva tutto con un solo click.")
+
+# --- Scelta del bilancio (cliente, anno), proposto dai filtri della sidebar ---
+metadati = metadati_filtri.metadati_filtri(DATABASE_NAME)
+if not metadati.clienti:
+    st.warning("Nessun bilancio disponibile nella tabella 'righe'. Inserisci o importa prima dei record.")
+    st.stop()
+
+col_cliente, col_anno = st.columns(2)
+with col_cliente:
+    cliente_sidebar = st.session_state.get('selected_cliente', 'Tutti')
+    cliente = st.selectbox("Cliente", metadati.clienti, key="mm_cliente",
+                           index=metadati.clienti.index(cliente_sidebar) if cliente_sidebar in metadati.clienti else 0)
+with col_anno:
+    anni = metadati.anni(cliente)
+    anni_sidebar = [a for a in st.session_state.get('selected_anni', []) if a in anni]
+    anno = st.selectbox("Anno", anni, key="mm_anno", index=anni.index(anni_sidebar[0]) if anni_sidebar else 0)
+
+# --- Conti disponibili ---
+try:
+    with database.connessione(DATABASE_NAME) as conn:
+        df_conti = pd.read_sql_query("SELECT id_co, Conto FROM conti ORDER BY id_co", conn)
+except pd.io.sql.DatabaseError:
+    st.error("Tabella 'conti' non trovata o vuota.")
+    st.stop()
+nomi_conti = dict(zip(df_conti['id_co'], df_conti['Conto']))
+
+# --- Bilancio caricato: resta in sessione come base del confronto fino al salvataggio ---
+chiave_bilancio = (DATABASE_NAME, cliente, int(anno))
+if st.session_state.get('mm_chiave') != chiave_bilancio:
+    st.session_state.mm_chiave = chiave_bilancio
+    st.session_state.mm_originale = modifica_massiva.carica_bilancio(DATABASE_NAME, cliente, int(anno))
+    st.session_state.mm_revisione = st.session_state.get('mm_revisione', 0) + 1
+originale = st.session_state.mm_originale
+
+griglia = originale.assign(Conto=originale['Id_co'].map(nomi_conti))
+modificato = st.data_editor(
+    griglia,
+    num_rows="dynamic",
+    hide_index=True,
+    use_container_width=True,
+    column_order=['ID', 'Id_co', 'Conto', 'importo'],
+    column_config={
+        'ID': st.column_config.NumberColumn("ID", disabled=True, help="Vuoto per le righe nuove"),
+        'Id_co': st.column_config.SelectboxColumn("Codice conto", options=list(nomi_conti), required=True),
+        'Conto': st.column_config.TextColumn("Conto", disabled=True),
+        'importo': st.column_config.NumberColumn("Importo", step=1, format="%d", required=True),
+    },
+    key=f"mm_griglia_{st.session_state.mm_revisione}",
+)
+
+# --- Riepilogo delle differenze rispetto al bilancio caricato ---
+differenze = modifica_massiva.calcola_differenze(originale, modificato, df_conti['id_co'])
+n_ins, n_agg, n_del = (len(differenze[k]) for k in ('inserimenti', 'aggiornamenti', 'eliminazioni'))
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Righe", len(originale))
+col2.metric("Nuove", n_ins)
+col3.metric("Modificate", n_agg)
+col4.metric("Eliminate", n_del)
+
+if not differenze['scarti'].empty:
+    st.error(f"{len(differenze['scarti'])} righe non valide: correggile prima di salvare.")
+    st.dataframe(differenze['scarti'], hide_index=True, use_container_width=True)
+
+col_salva, col_annulla = st.columns(2)
+with col_salva:
+    salva = st.button("💾 Salva modifiche", type="primary", use_container_width=True, key="mm_salva",
+                      disabled=not (n_ins or n_agg or n_del) or not differenze['scarti'].empty)
+with col_annulla:
+    if st.button("↩️ Annulla modifiche", use_container_width=True, key="mm_annulla"):
+        st.session_state.mm_chiave = None  # ricarica il bilancio dal database
+        st.rerun()
+
+if salva:
+    try:
+        esito = modifica_massiva.applica_differenze(DATABASE_NAME, cliente, int(anno), differenze)
+        st.session_state.mm_chiave = None  # ricarica il bilancio salvato
+        st.session_state.mm_esito = (f"Bilancio salvato: {esito['inseriti']} righe inserite, "
+                                     f"{esito['aggiornati']} modificate, {esito['eliminati']} eliminate.")
+        st.rerun()
+    except modifica_massiva.ConflittoModifica as e:
+        st.session_state.mm_chiave = None
+        st.error(f"{e} Nessuna modifica è stata salvata.")
+    except sqlite3.Error as e:
+        st.error(f"Errore durante il salvataggio: {e}. Nessuna modifica è stata salvata.")
+
+if st.session_state.get('mm_esito'):
+    st.success(st.session_state.pop('mm_esito'))
@@ -1,31 +1,28 @@
 # pages/report_flussi_finanziari.py - Business Plan Pro v6.0 - PDF Professionale
 # Layout verticale, una pagina, senza fronzoli
+# MODIFICA 2026-10-17: flussi di tutte le coppie di anni in un solo calcolo (financial_model.calculate_flows_all_pairs)
+# MODIFICA 2026-10-17: dati letti da righe_agg già aggregati per (anno, ID_RI) (financial_model.carica_totali_id_ri)
+# MODIFICA 2026-10-17: dati e report dalla cache condivisa tra le pagine (report_cache), invalidata a ogni commit
+# MODIFICA 2026-10-17: tabelle PDF dal motore comune pdf_renderer (stili precalcolati, celle stringa, LongTable)
+# MODIFICA 2026-10-17: tabella HTML dal renderer vettoriale html_renderer, memorizzata per impronta dei dati
+# MODIFICA 2026-10-17: Excel, PDF e ASCII generati al click (export_service); plotly, matplotlib e
+# reportlab importati solo dalle funzioni che li usano, non all'apertura della pagina
 
 import streamlit as st
-import sqlite3
 import pandas as pd
 import sidebar_filtri 
 import io
-import plotly.graph_objects as go
-from reportlab.lib.pagesizes import A4, portrait
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle 
-from reportlab.lib.units import inch
 from streamlit.components.v1 import html
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
 import tempfile
 import os
 from datetime import datetime
 import financial_model 
+import report_cache
+import export_service
+import html_renderer
 
-try:
-    from ascii_table_generator import create_downloadable_ascii_report
-    ASCII_AVAILABLE = True
-except ImportError:
-    ASCII_AVAILABLE = False
+# Export ASCII disponibile se è installato tabulate
+ASCII_AVAILABLE = export_service.disponibile('tabulate')
 
 def safe_string_to_float(value):
     """Converte stringhe formattate in float gestendo numeri negativi tra parentesi"""
@@ -53,6 +50,10 @@ def safe_string_to_float(value):
 def generate_waterfall_chart_for_pdf(df_multi, years_list, temp_dir):
     """Genera grafico waterfall pulito per PDF con progressione cumulativa corretta"""
     try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
         # Trova la colonna con il periodo più lungo
         longest_period_col = None
         max_years_span = 0
@@ -190,89 +191,45 @@ def generate_waterfall_chart_for_pdf(df_multi, years_list, temp_dir):
         print(f"Errore grafico PDF: {e}")
         return None
 
+def formatta_importo_pdf(value):
+    """Importo intero con punto delle migliaia, '-' per zero"""
+    numero = safe_string_to_float(value)
+    return f"{numero:,.0f}".replace(',', '.') if numero != 0 else "-"
+
 def generate_pdf_flussi_multi_column(df_data, years_list, combinations, title, filters_applied):
     """PDF professionale: una pagina, TUTTE le righe, matematica corretta"""
+    from reportlab.lib.pagesizes import A4, portrait
+    from reportlab.platypus import Paragraph, Spacer, Image
+    from reportlab.lib.units import inch
+    import pdf_renderer
+
     buffer = io.BytesIO()
     temp_dir = tempfile.mkdtemp()
     
     try:
-        doc = SimpleDocTemplate(buffer, pagesize=portrait(A4), 
-                               topMargin=0.4*inch, bottomMargin=0.4*inch,
-                               leftMargin=0.6*inch, rightMargin=0.6*inch)
-        styles = getSampleStyleSheet()
-        
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], 
-                                   fontSize=14, spaceAfter=8, alignment=1)
-        subtitle_style = ParagraphStyle('CustomSubtitle', parent=styles['Normal'], 
-                                      fontSize=9, spaceAfter=12, alignment=1)
-        
+        doc = pdf_renderer.documento(buffer, portrait(A4),
+                                     topMargin=0.4*inch, bottomMargin=0.4*inch,
+                                     leftMargin=0.6*inch, rightMargin=0.6*inch)
         story = []
 
-        story.append(Paragraph("REPORT FLUSSI DI CASSA", title_style))
+        story.append(Paragraph("REPORT FLUSSI DI CASSA", pdf_renderer.STILI['titolo_centrato']))
         
         periodo_info = f"{filters_applied} | Periodo: {', '.join([f'{c[0]}→{c[1]}' for c in combinations])}"
-        story.append(Paragraph(periodo_info, subtitle_style))
-
-        # === TABELLA CON TUTTE LE RIGHE (non filtrata) ===
-        table_data = []
-        
-        headers = ['Voce']
-        for col in df_data.columns[1:]:
-            headers.append(col)
-        table_data.append(headers)
-
-        # INCLUDI TUTTE LE RIGHE con IMPORTI INTERI
-        for _, row in df_data.iterrows():
-            voce = str(row['Voce'])
-            
-            # Salta solo la riga di intestazione "ANALISI DEI FLUSSI FINANZIARI" con valore 0
-            if 'ANALISI DEI FLUSSI' in voce.upper() and all(safe_string_to_float(row[col]) == 0 for col in df_data.columns[1:]):
-                continue
-                
-            # Abbrevia solo se necessario per layout
-            if len(voce) > 45:
-                voce = voce[:42] + "..."
-            
-            row_data = [voce]
-            
-            # Formatta valori numerici MANTENENDO IMPORTI INTERI
-            for col in df_data.columns[1:]:
-                value = safe_string_to_float(row[col])
-                if value == 0:
-                    formatted = "-"
-                else:
-                    # FORMATO INTERO come richiesto
-                    formatted = f"{value:,.0f}".replace(',', '.')
-                row_data.append(formatted)
-            
-            table_data.append(row_data)
-
-        # Crea tabella con font più piccolo per includere tutto
-        table = Table(table_data)
-        table.setStyle(TableStyle([
-            # Header
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            
-            # Corpo tabella
-            ('ALIGN', (0, 1), (0, -1), 'LEFT'),      
-            ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),    
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),  # Font più piccolo per più righe
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-            ('TOPPADDING', (0, 1), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
-            
-            # Bordi
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
-        
-        story.append(table)
+        story.append(Paragraph(periodo_info, pdf_renderer.STILI['sottotitolo_centrato']))
+
+        # === TABELLA CON TUTTE LE RIGHE (non filtrata), IMPORTI INTERI ===
+        colonne_valori = list(df_data.columns[1:])
+        valori = df_data[colonne_valori].apply(lambda col: col.map(safe_string_to_float))
+        # Salta solo la riga di intestazione "ANALISI DEI FLUSSI" con valori tutti a zero
+        intestazione_vuota = df_data['Voce'].astype(str).str.upper().str.contains('ANALISI DEI FLUSSI', regex=False) \
+            & (valori == 0).all(axis=1)
+        df_pdf = df_data.loc[~intestazione_vuota, ['Voce'] + colonne_valori].copy()
+        # Abbrevia solo se necessario per layout
+        voci = df_pdf['Voce'].astype(str)
+        df_pdf['Voce'] = voci.where(voci.str.len() <= 45, voci.str[:42] + "...")
+
+        righe, _ = pdf_renderer.righe_report(df_pdf, formatta=formatta_importo_pdf)
+        story.append(pdf_renderer.tabella(righe, stile='flussi', colonne_destra=range(1, len(df_pdf.columns))))
         story.append(Spacer(1, 0.2 * inch))
 
         # === GRAFICO MATEMATICAMENTE CORRETTO ===
@@ -287,14 +244,10 @@ def generate_pdf_flussi_multi_column(df_data, years_list, combinations, title, f
 
         # Footer
         story.append(Spacer(1, 0.1 * inch))
-        footer = Paragraph(f"Generato: {datetime.now().strftime('%d/%m/%Y')}", 
-                          ParagraphStyle('Footer', parent=styles['Normal'], 
-                                       fontSize=7, alignment=1))
-        story.append(footer)
+        story.append(Paragraph(f"Generato: {datetime.now().strftime('%d/%m/%Y')}", pdf_renderer.STILI['pie_pagina']))
 
         doc.build(story)
-        buffer.seek(0)
-        return buffer
+        return buffer.getvalue()
         
     except Exception as e:
         print(f"Errore PDF: {e}")
@@ -309,44 +262,38 @@ def generate_pdf_flussi_multi_column(df_data, years_list, combinations, title, f
 
 def generate_simple_table_pdf(df_data, years_list, title, filters_applied):
     """Fallback PDF solo tabella"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=portrait(A4))
-    styles = getSampleStyleSheet()
-    
-    story = []
-    story.append(Paragraph(title, styles['Heading1']))
-    story.append(Spacer(1, 0.2 * inch))
-    story.append(Paragraph(f"{filters_applied}", styles['Normal']))
-    story.append(Spacer(1, 0.2 * inch))
-    
-    table_data = [df_data.columns.tolist()]
-    for _, row in df_data.iterrows():
-        formatted_row = []
-        for i, val in enumerate(row.tolist()):
-            if i == 0:
-                formatted_row.append(str(val))
-            else:
-                numeric_val = safe_string_to_float(val)
-                formatted_row.append(f"{numeric_val:,.0f}".replace(',', '.') if numeric_val != 0 else "-")
-        table_data.append(formatted_row)
-    
-    table = Table(table_data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(table)
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+    return export_service.report_pdf(df_data, title, filters_applied, formatta=formatta_importo_pdf,
+                                     colonne_testo=[df_data.columns[0]], quota_prima=None, stile='semplice')
+
+def pdf_flussi(df_data, years_list, combinations, title, filters_applied):
+    """PDF professionale; se la generazione non riesce, PDF di riserva con la sola tabella"""
+    return (generate_pdf_flussi_multi_column(df_data, years_list, combinations, title, filters_applied)
+            or generate_simple_table_pdf(df_data, years_list, title, filters_applied))
+
+def excel_flussi(df_data):
+    """Excel multi-colonna con importi numerici (negativi tra parentesi riconvertiti)"""
+    excel_buffer = io.BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
+        df_export = df_data.copy()
+        
+        for col in df_export.columns:
+            if col != 'Voce':
+                df_export[col] = df_export[col].apply(safe_string_to_float)
+        
+        df_export.to_excel(writer, index=False, sheet_name='Flussi Multi-Anno')
+        
+        workbook = writer.book
+        worksheet = writer.sheets['Flussi Multi-Anno']
+        
+        num_format = workbook.add_format({'num_format': '#,##0'})
+        for i, col in enumerate(df_export.columns):
+            if col != 'Voce':
+                worksheet.set_column(i, i, 15, num_format)
+    return excel_buffer.getvalue()
+
+def testo_flussi(df_data):
+    """Tabella in testo semplice per email/console"""
+    return df_data.to_string(index=False)
 
 sidebar_filtri.display_sidebar_filters()
 
@@ -391,83 +338,30 @@ if len(years_to_display) < 2:
 
 st.info(f"📅 **Anni per l'analisi**: {', '.join(map(str, years_to_display))} • **Totale**: {len(years_to_display)} esercizi")
 
-conn = None
 df_full_data = pd.DataFrame() 
 
 try:
-    conn = sqlite3.connect(DATABASE_NAME)
-    query = """
-    SELECT 
-        r.ID, r.cliente, r.anno, r.importo, 
-        c.id_co, c.Conto, c.Parte, c.Sezione, c.Ord, c.ID_RI,
-        rl.Ricla
-    FROM righe r
-    JOIN conti c ON r.Id_co = c.id_co
-    JOIN ricla rl ON c.ID_RI = rl.ID_RI
-    WHERE r.anno IN ({})
-    """.format(','.join(['?' for _ in years_to_display]))
-    
-    params = [str(y) for y in years_to_display]
-
-    if selected_cliente != "Tutti":
-        query += " AND r.cliente = ?"
-        params.append(selected_cliente)
-    
-    query += " ORDER BY r.anno, c.Ord, c.ID_RI" 
-
-    df_full_data = pd.read_sql_query(query, conn, params=params)
+    # Totali per (anno, ID_RI) dalla cache condivisa tra le pagine (report_cache)
+    df_full_data = report_cache.dati_cliente(DATABASE_NAME, selected_cliente, years_to_display)
 
 except Exception as e:
     st.error(f"Errore nel caricamento dei dati per i Flussi Finanziari: {e}")
     st.info("Verifica che il database sia popolato e che le tabelle 'righe', 'conti', 'ricla' esistano e siano correlate correttamente.")
     df_full_data = pd.DataFrame()
-finally:
-    if conn:
-        conn.close()
 
 if df_full_data.empty:
     st.error("Nessun dato trovato per gli anni selezionati. Verifica che ci siano dati nel database per questi anni.")
     st.stop()
 
-def calculate_multi_column_flows(df_data, years_list):
-    """Calcola flussi per tutte le combinazioni di anni"""
-    
-    flows_results = {}
-    flow_combinations = []
-    
-    for i in range(len(years_list)):
-        for j in range(i + 1, len(years_list)):
-            year_from = years_list[i]
-            year_to = years_list[j]
-            combination = (year_from, year_to)
-            flow_combinations.append(combination)
-    
-    for year_from, year_to in flow_combinations:
-        try:
-            years_pair = [year_from, year_to]
-            
-            calculated_reports = financial_model.calculate_all_reports(
-                df_data, 
-                years_pair,
-                financial_model.report_structure_ce,
-                financial_model.report_structure_sp,
-                financial_model.report_structure_ff
-            )
-            
-            if 'error' not in calculated_reports:
-                column_name = f"{year_from}→{year_to}"
-                flows_results[column_name] = calculated_reports['ff']
-                
-        except Exception as e:
-            st.warning(f"Errore nel calcolo flusso {year_from}→{year_to}: {e}")
-            continue
-    
-    return flows_results, flow_combinations
+def calculate_multi_column_flows(years_list):
+    """Calcola flussi per tutte le combinazioni di anni: valori CE/SP una volta per anno, una colonna per coppia"""
+    # Memorizzati in report_cache: ricalcolati solo se cambiano cliente, anni o dati
+    return report_cache.flussi_coppie(DATABASE_NAME, selected_cliente, years_list)
 
 try:
-    flows_multi_results, combinations = calculate_multi_column_flows(df_full_data, years_to_display)
+    df_flows_numeric, combinations = calculate_multi_column_flows(years_to_display)
     
-    if not flows_multi_results:
+    if df_flows_numeric.empty:
         st.error("Impossibile calcolare i flussi per le combinazioni di anni selezionate.")
         st.stop()
         
@@ -475,115 +369,15 @@ except Exception as e:
     st.error(f"Errore durante il calcolo dei flussi multi-colonna: {e}")
     st.stop()
 
-def merge_flows_dataframes(flows_dict):
-    """Unisce tutti i DataFrame dei flussi in uno con colonne multiple"""
-    
-    if not flows_dict:
-        return pd.DataFrame()
-    
-    first_key = list(flows_dict.keys())[0]
-    df_merged = flows_dict[first_key][['Voce']].copy()
-    
-    for column_name, df_flow in flows_dict.items():
-        if len(df_flow.columns) > 1:
-            year_col = df_flow.columns[1]
-            df_merged[column_name] = df_flow[year_col]
-    
-    return df_merged
-
-df_final_multi = merge_flows_dataframes(flows_multi_results)
+df_final_multi = financial_model.format_report_frame(df_flows_numeric)
 
 if not df_final_multi.empty:
     st.markdown("### 📊 Visualizzazione Tabellare Multi-Anno")
     
-    def display_multi_column_html(df, structure):
-        """Visualizza tabella HTML con colonne multiple"""
-        if df.empty:
-            return
-        
-        bold_rows = [item['Voce'] for item in structure if item.get('Grassetto', False)]
-        
-        df_display = df.copy()
-        for col in df_display.columns:
-            if col != 'Voce':
-                df_display[col] = df_display[col].apply(
-                    lambda x: financial_model.format_number(x) if pd.notnull(x) and x != 0 else ""
-                )
-
-        html_table = """
-        <style>
-            .multi-table {
-                width: 100%;
-                border-collapse: collapse;
-                font-family: Arial, sans-serif;
-                margin: 1em 0;
-                font-size: 0.9em;
-            }
-            .multi-table th, .multi-table td {
-                border: 1px solid #e0e0e0;
-                padding: 6px 10px;
-                text-align: left;
-            }
-            .multi-table th {
-                background-color: #f8f9fa;
-                font-weight: bold;
-                color: #2c3e50;
-            }
-            .multi-table td.numeric {
-                text-align: right;
-                font-family: inherit;
-            }
-            .multi-table tr.bold-row td {
-                font-weight: bold;
-                background-color: #f0f8ff;
-            }
-            .multi-table td.uppercase-text {
-                text-transform: uppercase;
-            }
-            .multi-table th.year-header {
-                background-color: #e3f2fd;
-                color: #1565c0;
-            }
-        </style>
-        <table class="multi-table">
-            <thead>
-                <tr>
-        """
-        
-        html_table += "<th>Voce</th>" 
-        for col in df_display.columns:
-            if col != 'Voce':
-                html_table += f"<th class='numeric year-header'>{col}</th>" 
-        html_table += "</tr></thead><tbody>"
-        
-        for _, row in df_display.iterrows(): 
-            row_class = ""
-            if row['Voce'] in bold_rows:
-                row_class += "bold-row "
-            
-            html_table += f"<tr class='{row_class.strip()}'>"
-            
-            cell_content_voce = str(row['Voce'])
-            cell_class_voce = ""
-            item_struct = next((item for item in structure if item['Voce'].upper() == row['Voce'].upper() or item['Voce'] == row['Voce']), None)
-            if item_struct and item_struct.get('Maiuscolo', False):
-                cell_class_voce = "uppercase-text"
-            
-            html_table += f"<td class='{cell_class_voce}'>{cell_content_voce}</td>"
-            
-            for col in df_display.columns:
-                if col != 'Voce':
-                    val_to_display = row[col]
-                    html_table += f"<td class='numeric'>{val_to_display}</td>" 
-            
-            html_table += "</tr>"
-        
-        html_table += "</tbody></table>"
-        
-        table_height = len(df) * 35 + (len(df.columns) * 5) + 120
-        html(html_table, height=min(table_height, 800), scrolling=True)
-
-    display_multi_column_html(df_final_multi, financial_model.report_structure_ff)
+    # Tabella HTML dal renderer comune (formattazione per colonne, HTML riusato finché i dati non cambiano)
+    table_height = len(df_flows_numeric) * 35 + (len(df_flows_numeric.columns) * 5) + 120
+    html(html_renderer.tabella_html(df_flows_numeric, financial_model.report_structure_ff, stile='flussi'),
+         height=min(table_height, 800), scrolling=True)
 
     st.markdown("---")
     st.markdown("### 📊 Grafico a Cascata Intelligente - Analisi Triennale")
@@ -595,6 +389,8 @@ if not df_final_multi.empty:
             st.info("Dati insufficienti per il grafico a cascata intelligente.")
             return
         
+        import plotly.graph_objects as go
+        
         st.markdown("#### 🧮 Logica di Calcolo:")
         
         col1, col2 = st.columns(2)
@@ -783,105 +579,39 @@ if not df_final_multi.empty:
     if not df_final_multi.empty:
         col_excel, col_pdf, col_ascii = st.columns(3)
 
+        filtri_pdf = f"Cliente: {selected_cliente} | Anni: {', '.join(str(y) for y in years_to_display)}"
+
         with col_excel:
-            try:
-                excel_buffer = io.BytesIO()
-                with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
-                    df_export = df_final_multi.copy()
-                    
-                    for col in df_export.columns:
-                        if col != 'Voce':
-                            df_export[col] = df_export[col].apply(safe_string_to_float)
-                    
-                    df_export.to_excel(writer, index=False, sheet_name='Flussi Multi-Anno')
-                    
-                    workbook = writer.book
-                    worksheet = writer.sheets['Flussi Multi-Anno']
-                    
-                    num_format = workbook.add_format({'num_format': '#,##0'})
-                    for i, col in enumerate(df_export.columns):
-                        if col != 'Voce':
-                            worksheet.set_column(i, i, 15, num_format)
-
-                excel_buffer.seek(0)
-                st.download_button(
-                    label="📊 Excel Multi-Colonna",
-                    data=excel_buffer,
-                    file_name=f"flussi_multi_anno_{'-'.join(map(str, years_to_display))}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    help="Excel con gestione corretta numeri negativi tra parentesi"
-                )
-                
-                st.success("✅ Excel con BUGFIX applicato")
-                
-            except Exception as e:
-                st.error(f"Errore Excel: {e}")
+            st.download_button(
+                label="📊 Excel Multi-Colonna",
+                data=export_service.su_richiesta(excel_flussi, df_final_multi),
+                file_name=f"flussi_multi_anno_{'-'.join(map(str, years_to_display))}.xlsx",
+                mime=export_service.MIME['xlsx'],
+                help="Excel con gestione corretta numeri negativi tra parentesi",
+                on_click="ignore"
+            )
 
         with col_pdf:
-            try:
-                if not df_final_multi.empty:
-                    pdf_buffer_flussi = generate_pdf_flussi_multi_column(
-                        df_final_multi, 
-                        years_to_display,
-                        combinations,
-                        "REPORT FLUSSI DI CASSA", 
-                        f"Cliente: {selected_cliente} | Anni: {', '.join(str(y) for y in years_to_display)}"
-                    )
-                    
-                    if pdf_buffer_flussi:
-                        st.download_button(
-                            label="PDF Professionale",
-                            data=pdf_buffer_flussi,
-                            file_name=f"flussi_report_{'-'.join(map(str, years_to_display))}.pdf",
-                            mime="application/pdf",
-                            help="Report professionale: una pagina, layout verticale"
-                        )
-                        
-                        st.success("PDF Professionale - Una pagina")
-                        
-                    else:
-                        st.error("Errore nella generazione del PDF")
-                else:
-                    st.warning("Nessun dato disponibile per il PDF")
-                    
-            except Exception as e:
-                st.error(f"Errore PDF: {e}")
-                try:
-                    simple_pdf = generate_simple_table_pdf(
-                        df_final_multi, 
-                        years_to_display,
-                        "REPORT FLUSSI DI CASSA",
-                        f"Cliente: {selected_cliente} | Anni: {', '.join(str(y) for y in years_to_display)}"
-                    )
-                    if simple_pdf:
-                        st.download_button(
-                            label="PDF Fallback",
-                            data=simple_pdf,
-                            file_name=f"flussi_simple_{'-'.join(map(str, years_to_display))}.pdf",
-                            mime="application/pdf",
-                            help="PDF semplificato - solo tabella"
-                        )
-                        st.info("PDF fallback disponibile")
-                except Exception as fallback_error:
-                    st.error(f"Impossibile generare PDF: {fallback_error}")
+            st.download_button(
+                label="PDF Professionale",
+                data=export_service.su_richiesta(pdf_flussi, df_final_multi, years_to_display, combinations,
+                                                 "REPORT FLUSSI DI CASSA", filtri_pdf),
+                file_name=f"flussi_report_{'-'.join(map(str, years_to_display))}.pdf",
+                mime=export_service.MIME['pdf'],
+                help="Report professionale: una pagina, layout verticale",
+                on_click="ignore"
+            )
 
         with col_ascii:
             if ASCII_AVAILABLE:
-                try:
-                    ascii_content = df_final_multi.to_string(index=False)
-                    ascii_buffer = io.BytesIO()
-                    ascii_buffer.write(ascii_content.encode('utf-8'))
-                    ascii_buffer.seek(0)
-                    
-                    st.download_button(
-                        label="📝 Testo ASCII",
-                        data=ascii_buffer,
-                        file_name=f"flussi_ascii_{'-'.join(map(str, years_to_display))}.txt",
-                        mime="text/plain",
-                        help="Formato testo per email/console"
-                    )
-                except Exception as e:
-                    st.error(f"Errore ASCII: {e}")
+                st.download_button(
+                    label="📝 Testo ASCII",
+                    data=export_service.su_richiesta(testo_flussi, df_final_multi),
+                    file_name=f"flussi_ascii_{'-'.join(map(str, years_to_display))}.txt",
+                    mime=export_service.MIME['txt'],
+                    help="Formato testo per email/console",
+                    on_click="ignore"
+                )
             else:
                 st.info("ASCII non disponibile")
 
@@ -1,10 +1,13 @@
 # indicatori.py - Progetto Business Plan Pro - versione corretta - 2025-06-12
+# MODIFICA 2026-10-17: i KPI leggono i report numerici (calculate_reports_numeric), niente parsing di stringhe
+# MODIFICA 2026-10-17: dati letti da righe_agg già aggregati per (anno, ID_RI) (financial_model.carica_totali_id_ri)
+# MODIFICA 2026-10-17: dati e report dalla cache condivisa tra le pagine (report_cache), invalidata a ogni commit
+# MODIFICA 2026-10-17: plotly importato solo quando c'è un grafico da disegnare
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import sqlite3
 import sidebar_filtri
-from financial_model import calculate_all_reports, report_structure_ce, report_structure_sp, report_structure_ff
+import report_cache
+from financial_model import calculate_reports_numeric, report_structure_ce, report_structure_sp, report_structure_ff
 
 # Nome del database
 def get_database_name():
@@ -44,50 +47,18 @@ if not years_to_display:
     st.stop()
 
 # --- Caricamento dati dal database ---
-conn = None
-df_full_data = pd.DataFrame()
-
 try:
-    conn = sqlite3.connect(DATABASE_NAME)
-    query = """
-    SELECT 
-        r.ID, r.cliente, r.anno, r.importo, 
-        c.id_co, c.Conto, c.Parte, c.Sezione, c.Ord, c.ID_RI,
-        rl.Ricla
-    FROM righe r
-    JOIN conti c ON r.Id_co = c.id_co
-    JOIN ricla rl ON c.ID_RI = rl.ID_RI
-    WHERE r.anno IN ({})
-    """.format(','.join(['?' for _ in years_to_display]))
-    
-    params = [str(y) for y in years_to_display]
-
-    if selected_cliente != "Tutti":
-        query += " AND r.cliente = ?"
-        params.append(selected_cliente)
-    
-    query += " ORDER BY r.anno, c.Ord, c.ID_RI"
-
-    df_full_data = pd.read_sql_query(query, conn, params=params)
+    # Dati e report dalla cache condivisa tra le pagine (report_cache): query e calcoli
+    # vengono ripetuti solo se cambiano cliente, anni o i dati del database
+    all_calculated_reports = report_cache.report_numerici(DATABASE_NAME, selected_cliente, years_to_display)
 
 except Exception as e:
     st.error(f"Errore nel caricamento dei dati grezzi: {e}")
     st.info("Verifica che il database sia popolato e che le tabelle 'righe', 'conti', 'ricla' esistano e siano correlate correttamente.")
-    df_full_data = pd.DataFrame()
-finally:
-    if conn:
-        conn.close()
-
-# --- Calcolo dei report ---
-all_calculated_reports = calculate_all_reports(
-    df_full_data, 
-    years_to_display,
-    report_structure_ce,
-    report_structure_sp,
-    report_structure_ff
-)
+    all_calculated_reports = calculate_reports_numeric(
+        pd.DataFrame(), years_to_display, report_structure_ce, report_structure_sp, report_structure_ff)
 
-# Estrazione dei DataFrame necessari
+# Estrazione dei DataFrame necessari (numerici: nessuna conversione da stringhe formattate)
 ce_df = all_calculated_reports['ce']
 sp_df = all_calculated_reports['sp']
 ff_df = all_calculated_reports['ff']
@@ -97,41 +68,26 @@ if ce_df.empty or sp_df.empty:
     st.stop()
 
 # --- Funzione per il calcolo dei KPI ---
+def _valore_voce(df, voce, year):
+    """Valore numerico di una voce del report per l'anno (0 se assente)"""
+    try:
+        valore = df.loc[df['Voce'] == voce, str(year)].values[0]
+        return valore if valore != "" else 0
+    except (IndexError, KeyError):
+        return 0
+
 def calcola_kpi(ce_df, sp_df, years):
     kpi_data = []
     
     for year in years:
         # Estrazione valori dal Conto Economico
-        try:
-            ricavi = ce_df.loc[ce_df['Voce'] == 'Ricavi dalle vendite e prestazioni', str(year)].values[0]
-            ricavi = int(ricavi.replace('.', '')) if isinstance(ricavi, str) else ricavi
-        except:
-            ricavi = 0
-            
-        try:
-            ebit = ce_df.loc[ce_df['Voce'] == 'RISULTATO OPERATIVO (EBIT)', str(year)].values[0]
-            ebit = int(ebit.replace('.', '')) if isinstance(ebit, str) else ebit
-        except:
-            ebit = 0
-            
-        try:
-            utile = ce_df.loc[ce_df['Voce'] == 'RISULTATO NETTO', str(year)].values[0]
-            utile = int(utile.replace('.', '')) if isinstance(utile, str) else utile
-        except:
-            utile = 0
+        ricavi = _valore_voce(ce_df, 'Ricavi dalle vendite e prestazioni', year)
+        ebit = _valore_voce(ce_df, 'RISULTATO OPERATIVO (EBIT)', year)
+        utile = _valore_voce(ce_df, 'RISULTATO NETTO', year)
         
         # Estrazione valori dallo Stato Patrimoniale
-        try:
-            attivo_tot = sp_df.loc[sp_df['Voce'] == 'TOTALE IMMOBILIZZAZIONI', str(year)].values[0]
-            attivo_tot = int(attivo_tot.replace('.', '')) if isinstance(attivo_tot, str) else attivo_tot
-        except:
-            attivo_tot = 0
-            
-        try:
-            patrimonio = sp_df.loc[sp_df['Voce'] == 'Patrimonio netto', str(year)].values[0]
-            patrimonio = int(patrimonio.replace('.', '')) if isinstance(patrimonio, str) else patrimonio
-        except:
-            patrimonio = 0
+        attivo_tot = _valore_voce(sp_df, 'TOTALE IMMOBILIZZAZIONI', year)
+        patrimonio = _valore_voce(sp_df, 'Patrimonio netto', year)
         
         # Calcolo indicatori
         roe = (utile / patrimonio * 100) if patrimonio != 0 else 0
@@ -174,6 +130,7 @@ kpi_selezionati = st.multiselect(
 )
 
 if kpi_selezionati:
+    import plotly.express as px
     fig = px.line(kpi_df, x="Anno", y=kpi_selezionati, 
                  title="Andamento indicatori chiave",
                  markers=True)
@@ -187,6 +144,7 @@ valori_selezionati = st.multiselect(
 )
 
 if valori_selezionati:
+    import plotly.express as px
     fig_bar = px.bar(kpi_df, x="Anno", y=valori_selezionati,
                     title="Valori assoluti",
                     barmode='group')
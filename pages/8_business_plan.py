@@ -1,35 +1,33 @@
 # pages/8_business_plan.py - VERSIONE 5.0 (STABILE) - 2025-06-26
 # VERSIONE FINALE: Wizard a step atomici, stepper visivo robusto,
 # codice modernizzato e logica di export completa e funzionante.
+# MODIFICA 2026-10-17: PDF dal motore comune pdf_renderer (stili precalcolati, celle stringa, LongTable)
+# MODIFICA 2026-10-17: tabelle HTML dal renderer vettoriale html_renderer, memorizzate per impronta dei dati
+# MODIFICA 2026-10-17: reportlab e tabulate importati solo all'export, non all'apertura della pagina
+# MODIFICA 2026-10-17: utente, database e cliente passati al calcolo con un ContestoCalcolo (compute_context)
+# MODIFICA 2026-10-17: proiezioni calcolate nel pool di processi (worker_pool), con avanzamento e annullamento
 
 import streamlit as st
 import pandas as pd
 import numpy as np
 import sidebar_filtri
 import io
-import sqlite3
+import database
+import compute_context
+import export_service
+import worker_pool
 import json
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 from streamlit.components.v1 import html
 
 # --- IMPORT MODULI ---
-try:
-    from reportlab.lib.pagesizes import A4, landscape
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+# Librerie di export: solo verificate qui, importate al momento dell'export
+REPORTLAB_AVAILABLE = export_service.disponibile('reportlab')
 
-try:
-    # Utilizza il modulo fornito dall'utente
-    from ascii_table_generator import create_downloadable_ascii_report
-    ASCII_AVAILABLE = True
-except ImportError:
-    ASCII_AVAILABLE = False
+# Utilizza il modulo fornito dall'utente (richiede tabulate)
+ASCII_AVAILABLE = export_service.disponibile('tabulate')
+if not ASCII_AVAILABLE:
     st.sidebar.warning("Modulo 'ascii_table_generator.py' non trovato.")
 
 try:
@@ -41,18 +39,24 @@ try:
         genera_anni_business_plan
     )
     from business_plan_projections import BusinessPlanProjections
+    import montecarlo
     BP_MODULES_AVAILABLE = True
 except ImportError as e:
     BP_MODULES_AVAILABLE = False
     st.error(f"Moduli Business Plan non disponibili: {e}")
 
 import financial_model
+import html_renderer
+
+def get_database_name():
+    """Restituisce il database dell'utente corrente"""
+    return compute_context.da_sessione().database
 
 # --- FUNZIONI DI SUPPORTO E UTILITY (INVARIATE) ---
 def save_assumptions_to_db(cliente: str, scenario_name: str, assumptions: dict, anni_bp: list, durata: int) -> None:
     conn = None
     try:
-        conn = sqlite3.connect(get_database_name())
+        conn = database.connetti(get_database_name())
         cursor = conn.cursor()
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS bp_scenarios (
@@ -75,7 +79,7 @@ def save_assumptions_to_db(cliente: str, scenario_name: str, assumptions: dict,
 def get_saved_scenarios(cliente: str) -> List[str]:
     conn = None
     try:
-        conn = sqlite3.connect(sqlite3.connect(get_database_name()))
+        conn = database.connetti(get_database_name())
         cursor = conn.cursor()
         cursor.execute("SELECT scenario_name FROM bp_scenarios WHERE cliente = ? ORDER BY created_at DESC", (cliente,))
         return [row[0] for row in cursor.fetchall()]
@@ -87,7 +91,7 @@ def get_saved_scenarios(cliente: str) -> List[str]:
 def load_assumptions_from_db(cliente: str, scenario_name: str) -> Tuple[Optional[dict], Optional[list], Optional[int]]:
     conn = None
     try:
-        conn = sqlite3.connect(sqlite3.connect(get_database_name()))
+        conn = database.connetti(get_database_name())
         cursor = conn.cursor()
         cursor.execute("SELECT assumptions_json, anni_bp_json, durata FROM bp_scenarios WHERE cliente = ? AND scenario_name = ?", (cliente, scenario_name))
         result = cursor.fetchone()
@@ -106,54 +110,20 @@ def display_with_html_bp(df, years, structure_name="Business Plan"):
     if df.empty:
         st.warning("Nessun dato da visualizzare per questo report.")
         return
-    df_display = df.copy()
-    anni_colonne = [col for col in df.columns if col != 'Voce']
-    for col in anni_colonne:
-        if df_display[col].dtype in ['int64', 'float64', 'int32', 'float32', 'object']:
-             df_display[col] = df_display[col].apply(lambda x: financial_model.format_number(x) if pd.api.types.is_number(x) else x)
-    html_table = f"""
-    <style>
-        .custom-table-bp {{ width: 100%; border-collapse: collapse; font-family: Arial, sans-serif; margin: 1em 0; }}
-        .custom-table-bp th, .custom-table-bp td {{ border: 1px solid #e0e0e0; padding: 8px 12px; text-align: left; }}
-        .custom-table-bp th {{ background-color: #f0f0f0; font-weight: bold; position: sticky; top: 0; z-index: 1;}}
-        .custom-table-bp td.numeric {{ text-align: right; }}
-    </style>
-    <div style="max-height: 600px; overflow-y: auto; border: 1px solid #e0e0e0;">
-        <h3>{structure_name}</h3>
-        <table class="custom-table-bp"><thead><tr><th>Voce</th>
-    """
-    for year in anni_colonne:
-        html_table += f"<th class='numeric'>{year}</th>"
-    html_table += "</tr></thead><tbody>"
-    for _, row in df_display.iterrows():
-        html_table += f"<tr><td>{row['Voce']}</td>"
-        for year in anni_colonne:
-            html_table += f"<td class='numeric'>{row.get(year, '')}</td>"
-        html_table += "</tr>"
-    html_table += "</tbody></table></div>"
-    html(html_table, height=min(len(df) * 45 + 50, 650), scrolling=True)
+    # HTML dal renderer comune: importi formattati per colonna, valori non numerici invariati
+    html(html_renderer.tabella_html(df, stile='bp', titolo=structure_name, solo_numeri=True),
+         height=min(len(df) * 45 + 50, 650), scrolling=True)
+
+def formatta_valore_bp(cell_value):
+    return financial_model.format_number(cell_value) if pd.api.types.is_number(cell_value) else str(cell_value)
 
 def generate_professional_pdf_safe(df_data, title, subtitle, cliente, anni_bp):
     if not REPORTLAB_AVAILABLE: return None
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), topMargin=20, bottomMargin=20, leftMargin=25, rightMargin=25)
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='right_text', parent=styles['Normal'], alignment=2, fontSize=9, fontName='Helvetica'))
-    story = [Paragraph(f"{cliente} | Periodo: {anni_bp[0]}-{anni_bp[-1]}", styles['Normal']), Spacer(1, 0.2 * inch)]
-    table_data_pdf = [[Paragraph(f'<b>{col}</b>', styles['Normal']) for col in df_data.columns]]
-    for index, row in df_data.iterrows():
-        row_list = [Paragraph(str(row.iloc[0]), styles['Normal'])]
-        for cell_value in row.iloc[1:]:
-            formatted_val = financial_model.format_number(cell_value) if pd.api.types.is_number(cell_value) else str(cell_value)
-            row_list.append(Paragraph(formatted_val, styles['right_text']))
-        table_data_pdf.append(row_list)
-    col_widths = [doc.width * 0.4] + [(doc.width * 0.6) / (len(df_data.columns) - 1)] * (len(df_data.columns) - 1)
-    table = Table(table_data_pdf, colWidths=col_widths)
-    table.setStyle(TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey), ('GRID', (0,0), (-1,-1), 0.5, colors.grey), ('VALIGN', (0,0), (-1,-1), 'MIDDLE')]))
-    story.append(table)
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+    from reportlab.lib.pagesizes import A4, landscape
+    return export_service.report_pdf(
+        df_data, intestazione=f"{cliente} | Periodo: {anni_bp[0]}-{anni_bp[-1]}", formatta=formatta_valore_bp,
+        colonne_testo=[df_data.columns[0]], quota_prima=0.4, stile='griglia', pagesize=landscape(A4),
+        margini=dict(topMargin=20, bottomMargin=20, leftMargin=25, rightMargin=25))
 
 def prepare_export_data_safe(export_tipo, bp_projections, anni_bp):
     df_export, title = pd.DataFrame(), "Business Plan"
@@ -188,6 +158,8 @@ def initialize_state():
 
 def reset_and_go_to_step_0():
     """Pulisce lo stato del BP e torna allo step 0."""
+    if 'bp_lavoro' in st.session_state:
+        worker_pool.annulla(st.session_state.bp_lavoro)
     keys_to_delete = [key for key in st.session_state if key.startswith('bp_')]
     for key in keys_to_delete:
         del st.session_state[key]
@@ -278,9 +250,12 @@ def render_step_0_config():
         st.warning("⚠️ Seleziona un cliente specifico nella sidebar per procedere."); st.stop()
     st.success(f"✅ **Cliente selezionato**: {selected_cliente}")
 
+    # Contesto del calcolo costruito dalla sessione a ogni esecuzione della pagina
+    contesto = compute_context.da_sessione(selected_cliente)
+
     try:
-        anni_disponibili = get_anni_disponibili(selected_cliente)
-        anno_base = determina_anno_base(selected_cliente)
+        anni_disponibili = get_anni_disponibili(selected_cliente, contesto)
+        anno_base = determina_anno_base(selected_cliente, contesto)
         if not anni_disponibili or not anno_base:
             st.error(f"❌ Nessun dato storico trovato per il cliente {selected_cliente}"); st.stop()
         st.info(f"📅 Anno base (N0): {anno_base} | Storico disponibile: {', '.join(map(str, anni_disponibili))}")
@@ -299,7 +274,7 @@ def render_step_0_config():
     if st.button("Calcola Medie Storiche e Procedi ➡️", type="primary", use_container_width=True):
         with st.spinner("Analizzando dati storici..."):
             try:
-                bp_assumptions = BusinessPlanAssumptions(selected_cliente)
+                bp_assumptions = BusinessPlanAssumptions(selected_cliente, contesto)
                 dati_storici = bp_assumptions.carica_dati_storici(st.session_state.bp_anni_disponibili)
                 medie_storiche = bp_assumptions.calcola_medie_storiche(st.session_state.bp_anni_disponibili)
                 st.session_state.update({
@@ -386,18 +361,90 @@ def render_step_2_modifica_assumption():
     with col1:
         st.button("⬅️ Torna alle Medie Storiche", on_click=go_to_step, args=[1], use_container_width=True)
     with col2:
-        if st.button("Genera Business Plan ➡️", type="primary", use_container_width=True):
-            with st.spinner("🔄 Generando proiezioni..."):
-                try:
-                    bp_assumptions = st.session_state.bp_assumptions_obj
-                    bp_assumptions.imposta_assumptions_manuali(st.session_state.bp_assumption_inputs)
-                    bp_projections = BusinessPlanProjections(selected_cliente, st.session_state.bp_anno_base, st.session_state.bp_durata, assumptions=bp_assumptions)
-                    bp_projections.inizializza_con_dati_storici(st.session_state.bp_dati_storici)
-                    st.session_state.bp_projections_obj = bp_projections
-                    bp_projections.calcola_proiezioni()
-                    go_to_step(3)
-                except Exception as e:
-                    st.error(f"Errore generazione proiezioni: {e}"); st.exception(e)
+        in_corso = 'bp_lavoro' in st.session_state
+        if st.button("Genera Business Plan ➡️", type="primary", use_container_width=True, disabled=in_corso):
+            try:
+                # Proiezioni calcolate nel pool di processi: le altre sessioni non restano in attesa
+                bp_assumptions = st.session_state.bp_assumptions_obj
+                bp_assumptions.imposta_assumptions_manuali(st.session_state.bp_assumption_inputs)
+                st.session_state.bp_lavoro = worker_pool.invia(
+                    worker_pool.proiezioni_business_plan, selected_cliente, st.session_state.bp_anno_base,
+                    st.session_state.bp_durata, bp_assumptions, st.session_state.bp_dati_storici,
+                    descrizione=f"Business Plan {selected_cliente}")
+            except Exception as e:
+                st.error(f"Errore generazione proiezioni: {e}"); st.exception(e)
+    if 'bp_lavoro' in st.session_state:
+        render_avanzamento_proiezioni()
+    esito = st.session_state.pop('bp_esito_lavoro', None)
+    if esito:
+        getattr(st, esito[0])(esito[1])
+
+@st.fragment(run_every=0.5)
+def render_avanzamento_proiezioni():
+    """Avanzamento del calcolo delle proiezioni (aggiornato ogni mezzo secondo), con annullamento."""
+    id_lavoro = st.session_state.get('bp_lavoro')
+    info = worker_pool.stato(id_lavoro) if id_lavoro is not None else None
+    if info is None:
+        st.session_state.pop('bp_lavoro', None)
+        return
+    if info['stato'] not in worker_pool.CONCLUSI:
+        testo = info['messaggio'] or ("In coda..." if info['stato'] == worker_pool.IN_CODA else "Calcolo in corso...")
+        st.progress(info['progresso'], text=f"🔄 {testo} ({info['secondi']:.0f} s)")
+        if st.button("⏹️ Annulla", key="bp_annulla_lavoro"):
+            worker_pool.annulla(id_lavoro)
+        return
+
+    del st.session_state['bp_lavoro']
+    try:
+        st.session_state.bp_projections_obj = worker_pool.risultato(id_lavoro)
+        st.session_state.pop('bp_montecarlo', None)
+        go_to_step(3)
+    except worker_pool.LavoroAnnullato:
+        st.session_state.bp_esito_lavoro = ('warning', "Generazione del Business Plan annullata.")
+    except Exception as e:
+        st.session_state.bp_esito_lavoro = ('error', f"Errore generazione proiezioni: {e}")
+    st.rerun()
+
+def render_simulazione_montecarlo(bp_projections):
+    """Configura le distribuzioni delle assumption ed esegue la simulazione Monte Carlo."""
+    df_distribuzioni = pd.DataFrame([
+        {'ID': a['id'], 'Assumption': a['nome'], 'Unità': a['unita'], 'Distribuzione': 'nessuna', 'Ampiezza': 0.0}
+        for a in ASSUMPTION_DEFINITIONS
+    ])
+    df_distribuzioni = st.data_editor(
+        df_distribuzioni, key="bp_mc_distribuzioni", hide_index=True, use_container_width=True,
+        disabled=['ID', 'Assumption', 'Unità'],
+        column_config={
+            'Distribuzione': st.column_config.SelectboxColumn(options=['nessuna', *montecarlo.DISTRIBUZIONI]),
+            'Ampiezza': st.column_config.NumberColumn(min_value=0.0, step=0.1, format="%.2f",
+                                                      help="Normale: deviazione standard. Triangolare/uniforme: ± attorno al valore."),
+        })
+    col1, col2, col3 = st.columns(3)
+    n_scenari = col1.selectbox("Numero scenari", [1000, 10000, 50000, 100000], index=1, key="bp_mc_n")
+    seme = col2.number_input("Seme casuale", min_value=0, value=42, step=1, key="bp_mc_seme")
+    shock_per_anno = col3.checkbox("Scostamento diverso per ogni anno", value=False, key="bp_mc_shock")
+
+    if st.button("▶️ Esegui simulazione", key="bp_mc_esegui"):
+        distribuzioni = {
+            int(r['ID']): {'tipo': r['Distribuzione'], 'ampiezza': float(r['Ampiezza'])}
+            for _, r in df_distribuzioni.iterrows() if r['Distribuzione'] != 'nessuna' and r['Ampiezza'] > 0
+        }
+        if not distribuzioni:
+            st.warning("Assegnare almeno una distribuzione con ampiezza maggiore di zero.")
+        else:
+            with st.spinner(f"Simulazione di {n_scenari:,} scenari in corso..."):
+                st.session_state.bp_montecarlo = montecarlo.simula_da_proiezioni(
+                    bp_projections, distribuzioni, n_scenari=n_scenari, seme=int(seme), shock_per_anno=shock_per_anno)
+
+    risultato = st.session_state.get('bp_montecarlo')
+    if risultato is None or risultato.anni != list(bp_projections.anni_bp):
+        return
+    st.caption(f"Scenari simulati: {risultato.n_scenari:,}")
+    indicatore = st.radio("Indicatore", montecarlo.INDICATORI, horizontal=True, key="bp_mc_indicatore")
+    st.dataframe(risultato.percentili(indicatore).style.format("{:,.0f}"), use_container_width=True)
+    st.markdown("**Probabilità di downside**")
+    st.dataframe(risultato.riepilogo_downside().style.format("{:.1%}"), use_container_width=True)
+
 
 def render_step_3_risultati():
     """STEP 3: Visualizzazione dei risultati finali e opzioni di export."""
@@ -414,6 +461,19 @@ def render_step_3_risultati():
     bp_projections = st.session_state.bp_projections_obj
     anni_bp = st.session_state.bp_anni_bp
     selected_cliente = st.session_state.selected_cliente
+
+    anni_non_convergenti = bp_projections.anni_non_convergenti()
+    if anni_non_convergenti:
+        st.warning(f"⚠️ Calcolo oneri finanziari/PFN non convergente per gli anni: {', '.join(map(str, anni_non_convergenti))}. "
+                   "Verificare il tasso medio sui debiti bancari.")
+    with st.expander("🔁 Diagnostica calcolo oneri finanziari / PFN"):
+        st.dataframe(pd.DataFrame([
+            {'Anno': anno, 'Iterazioni': diag['iterazioni'], 'Residuo': round(diag['residuo'], 6),
+             'Convergente': '✅' if diag['convergente'] else '❌'}
+            for anno, diag in bp_projections.convergenza.items()
+        ]), use_container_width=True, hide_index=True)
+    with st.expander("🎲 Simulazione Monte Carlo (bande percentili e probabilità di downside)"):
+        render_simulazione_montecarlo(bp_projections)
     
     tab_overview, tab_ce, tab_sp, tab_flussi = st.tabs(["🔍 Overview", "💰 C. Economico", "🏦 S. Patrimoniale", "💸 Flussi di Cassa"])
     with tab_overview:
@@ -475,6 +535,7 @@ def render_step_3_risultati():
         if st.button("📝 Export ASCII", key="exp_ascii_bp"):
             if ASCII_AVAILABLE and not export_tipo.startswith('Excel'):
                 with st.spinner("🔄 Generando ASCII..."):
+                    from ascii_table_generator import create_downloadable_ascii_report
                     df_export, title = prepare_export_data_safe(export_tipo, bp_projections, anni_bp)
                     if not df_export.empty:
                         subtitle = f"Proiezioni Multi-Anno - {selected_cliente}"
@@ -0,0 +1,196 @@
+# pdf_renderer.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Motore comune per i PDF dei report (pagine 2, 4, 5, 6 e 8).
+# Stili creati una sola volta all'import, celle numeriche come semplici stringhe
+# (un Paragraph solo per le voci troppo lunghe da stare nella colonna), grassetto e
+# maiuscolo delle voci da un indice della struttura del report calcolato una volta,
+# LongTable con intestazione ripetuta su ogni pagina per i report lunghi.
+
+import io
+from typing import Callable, List, Optional, Sequence
+
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+import financial_model
+
+FONT = 'Helvetica'
+FONT_GRASSETTO = 'Helvetica-Bold'
+DIMENSIONE_FONT = 10
+PADDING_CELLA = 6  # LEFTPADDING + RIGHTPADDING predefiniti di reportlab
+
+
+def _crea_stili():
+    stili = getSampleStyleSheet()
+    stili.add(ParagraphStyle(name='bold_text', parent=stili['Normal'], fontName=FONT_GRASSETTO))
+    stili.add(ParagraphStyle(name='normal_text', parent=stili['Normal'], fontName=FONT))
+    stili.add(ParagraphStyle(name='titolo_centrato', parent=stili['Heading1'], fontSize=14, spaceAfter=8, alignment=1))
+    stili.add(ParagraphStyle(name='sottotitolo_centrato', parent=stili['Normal'], fontSize=9, spaceAfter=12, alignment=1))
+    stili.add(ParagraphStyle(name='pie_pagina', parent=stili['Normal'], fontSize=7, alignment=1))
+    return stili
+
+
+# Foglio di stile condiviso: creato una volta, solo letto dai generatori (sicuro tra thread)
+STILI = _crea_stili()
+
+# Stili delle tabelle: comandi TableStyle comuni, la riga 0 è l'intestazione
+STILI_TABELLA = {
+    # Conto economico e stato patrimoniale (pagine 4 e 5): solo cornice esterna
+    'report': [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+        ('FONTNAME', (0, 0), (-1, 0), FONT_GRASSETTO),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ],
+    # Proiezioni del business plan (pagina 8): griglia, importi più piccoli
+    'griglia': [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('FONTNAME', (0, 0), (-1, 0), FONT_GRASSETTO),
+        ('FONTSIZE', (1, 1), (-1, -1), 9),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ],
+    # Elenco dei record (pagina 2)
+    'elenco': [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+        ('FONTNAME', (0, 0), (-1, 0), FONT_GRASSETTO),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.white),
+    ],
+    # Flussi di cassa (pagina 6): righe alternate, font ridotto per stare in una pagina
+    'flussi': [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), FONT_GRASSETTO),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+        ('TOPPADDING', (0, 1), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ],
+    # Tabella semplice di riserva (pagina 6)
+    'semplice': [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), FONT_GRASSETTO),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ],
+}
+
+def larghezze_colonne(larghezza_totale: float, n_colonne: int, quota_prima: Optional[float] = None,
+                      pesi: Optional[Sequence[float]] = None) -> Optional[List[float]]:
+    """Larghezze da pesi relativi, oppure prima colonna a quota_prima e le altre uguali (None = automatiche)"""
+    if pesi is not None:
+        totale = float(sum(pesi))
+        return [larghezza_totale * p / totale for p in pesi]
+    if quota_prima is None:
+        return None
+    if n_colonne <= 1:
+        return [larghezza_totale]
+    prima = larghezza_totale * quota_prima
+    return [prima] + [(larghezza_totale - prima) / (n_colonne - 1)] * (n_colonne - 1)
+
+
+def tabella(righe: List[list], larghezze: Optional[List[float]] = None, stile: str = 'report',
+            righe_grassetto: Sequence[int] = (), colonne_destra: Sequence[int] = ()) -> LongTable:
+    """LongTable con intestazione (riga 0) ripetuta a ogni pagina; indici di riga riferiti a righe"""
+    # Allineamenti prima dello stile, che può ridefinirli (es. intestazione centrata)
+    comandi = [('ALIGN', (0, 0), (-1, -1), 'LEFT')]
+    comandi += [('ALIGN', (colonna, 0), (colonna, -1), 'RIGHT') for colonna in colonne_destra]
+    comandi += STILI_TABELLA[stile]
+    for riga in righe_grassetto:
+        comandi.append(('FONTNAME', (0, riga), (-1, riga), FONT_GRASSETTO))
+    return LongTable(righe, colWidths=larghezze, repeatRows=1, style=TableStyle(comandi))
+
+
+def righe_report(df: pd.DataFrame, struttura: Optional[Sequence[dict]] = None,
+                 formatta: Optional[Callable] = None, colonne_testo: Sequence[str] = ('Voce',),
+                 larghezze: Optional[List[float]] = None, dimensione_font: float = DIMENSIONE_FONT):
+    """
+    Righe della tabella (intestazione compresa) con celle stringa e indici delle righe in grassetto.
+    Le colonne non di testo sono formattate con formatta, colonna per colonna; grassetto e
+    maiuscolo delle voci arrivano dall'indice della struttura. Le voci più larghe della
+    colonna diventano Paragraph per andare a capo.
+    """
+    colonne = list(df.columns)
+    valori = {}
+    for colonna in colonne:
+        serie = df[colonna]
+        if colonna in colonne_testo or formatta is None:
+            valori[colonna] = ['' if pd.isna(v) else str(v) for v in serie.tolist()]
+        else:
+            valori[colonna] = [formatta(v) for v in serie.tolist()]
+
+    righe_grassetto = []
+    if struttura is not None and 'Voce' in valori:
+        indice = financial_model.indice_struttura(struttura)
+        voci = valori['Voce']
+        for i, voce in enumerate(voci):
+            elemento = indice.get(voce.upper())
+            if elemento is None:
+                continue
+            if elemento.get('Maiuscolo', False):
+                voci[i] = voce.upper()
+            if elemento.get('Grassetto', False):
+                righe_grassetto.append(i + 1)
+
+    righe = [[str(c) for c in colonne]] + [list(r) for r in zip(*(valori[c] for c in colonne))]
+
+    if larghezze is not None:
+        grassetto = set(righe_grassetto)
+        for j, colonna in enumerate(colonne):
+            if colonna not in colonne_testo:
+                continue
+            spazio = larghezze[j] - PADDING_CELLA
+            for i in range(1, len(righe)):
+                font = FONT_GRASSETTO if i in grassetto else FONT
+                if stringWidth(righe[i][j], font, dimensione_font) > spazio:
+                    righe[i][j] = Paragraph(righe[i][j], STILI['bold_text' if i in grassetto else 'normal_text'])
+    return righe, righe_grassetto
+
+
+def documento(buffer, pagesize=A4, **margini) -> SimpleDocTemplate:
+    return SimpleDocTemplate(buffer, pagesize=pagesize, **margini)
+
+
+def report_pdf(df: pd.DataFrame, titolo: Optional[str] = None, intestazione: Optional[str] = None,
+               struttura: Optional[Sequence[dict]] = None, formatta: Optional[Callable] = None,
+               colonne_testo: Sequence[str] = ('Voce',), quota_prima: Optional[float] = 0.5,
+               pesi: Optional[Sequence[float]] = None, stile: str = 'report', pagesize=A4,
+               margini: Optional[dict] = None, a_capo: bool = True) -> bytes:
+    """
+    PDF di un report tabellare: titolo (h2), testo di intestazione (markup reportlab ammesso)
+    e tabella con le colonne numeriche allineate a destra. a_capo=False lascia tutte le celle
+    come stringhe anche se più larghe della colonna (elenchi lunghi: massima velocità).
+    """
+    buffer = io.BytesIO()
+    doc = documento(buffer, pagesize, **(margini or {}))
+    story = []
+    if titolo:
+        story += [Paragraph(titolo, STILI['h2']), Spacer(1, 0.2 * inch)]
+    if intestazione:
+        story += [Paragraph(intestazione, STILI['Normal']), Spacer(1, 0.2 * inch)]
+
+    larghezze = larghezze_colonne(doc.width, len(df.columns), quota_prima, pesi)
+    righe, righe_grassetto = righe_report(df, struttura, formatta, colonne_testo, larghezze if a_capo else None)
+    colonne_destra = [j for j, c in enumerate(df.columns) if c not in colonne_testo]
+    story.append(tabella(righe, larghezze, stile, righe_grassetto, colonne_destra))
+
+    doc.build(story)
+    return buffer.getvalue()
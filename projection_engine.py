@@ -0,0 +1,257 @@
+# projection_engine.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Motore vettoriale NumPy per le proiezioni del Business Plan.
+# Applica le stesse formule di BusinessPlanProjections._calcola_anno_proiezione,
+# ma lavora su una proiezione densa (anni × RI_CODES) e su una matrice di
+# assumption (26 × anni). Tutte le funzioni accettano dimensioni iniziali
+# aggiuntive (es. più scenari insieme): l'ultima dimensione è sempre RI_CODES.
+# Il riferimento circolare oneri finanziari (RI13) <-> PFN (RI33/RI31) può essere
+# risolto con il ciclo a punto fisso originale ('iterativo') o in forma chiusa
+# ('analitico'): la relazione è lineare a tratti, quindi basta un solo passaggio.
+
+from collections.abc import Mapping
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from business_plan_assumptions import ASSUMPTION_DEFINITIONS, RI_CODES
+
+CODICI_RI = list(RI_CODES.keys())
+IDX_RI = {codice: i for i, codice in enumerate(CODICI_RI)}
+N_RI = len(CODICI_RI)
+N_ASSUMPTIONS = len(ASSUMPTION_DEFINITIONS)
+ALIQUOTA_IMPOSTE = 0.28
+METODI_PFN = ('iterativo', 'analitico')
+
+
+def matrice_assumptions(assumptions, durata: int) -> np.ndarray:
+    """Restituisce le assumption come matrice (26 × durata), colonna j = anno indice j+1"""
+    matrice = np.zeros((N_ASSUMPTIONS, durata), dtype=np.float64)
+    if hasattr(assumptions, 'compila'):
+        tabella = assumptions.compila()
+        righe = min(N_ASSUMPTIONS, tabella.shape[0])
+        colonne = min(durata, tabella.shape[1])
+        matrice[:righe, :colonne] = tabella[:righe, :colonne]
+        return matrice
+    for ass_id in range(N_ASSUMPTIONS):
+        for anno_indice in range(1, durata + 1):
+            matrice[ass_id, anno_indice - 1] = assumptions.get_assumption_value(ass_id, anno_indice)
+    return matrice
+
+
+def riga_da_dizionario(valori: Dict) -> np.ndarray:
+    """Converte un dizionario {codice_ri: valore} in una riga densa ordinata come RI_CODES"""
+    return np.array([float(valori.get(codice, 0) or 0) for codice in CODICI_RI], dtype=np.float64)
+
+
+def calcola_proiezioni_array(riga_base: np.ndarray, matrice: np.ndarray, metodo: str = 'iterativo',
+                             max_iterazioni: int = 100, tolleranza: float = 0.01) -> np.ndarray:
+    """
+    Calcola la proiezione completa.
+    riga_base: (..., N_RI) valori dell'anno base
+    matrice:   (..., 26, durata) assumption per anno
+    Restituisce un array (..., durata + 1, N_RI) con l'anno base in posizione 0.
+    """
+    risultato, _ = calcola_proiezioni_con_diagnostica(riga_base, matrice, metodo, max_iterazioni, tolleranza)
+    return risultato
+
+
+def calcola_proiezioni_con_diagnostica(riga_base: np.ndarray, matrice: np.ndarray, metodo: str = 'iterativo',
+                                       max_iterazioni: int = 100, tolleranza: float = 0.01) -> Tuple[np.ndarray, Dict]:
+    """
+    Come calcola_proiezioni_array, ma restituisce anche la diagnostica del calcolo di RI13:
+    {'iterazioni': (..., durata), 'residuo': (..., durata), 'convergente': (..., durata)}
+    """
+    if metodo not in METODI_PFN:
+        raise ValueError(f"Metodo PFN non valido: {metodo}. Valori ammessi: {', '.join(METODI_PFN)}")
+    riga_base = np.asarray(riga_base, dtype=np.float64)
+    matrice = np.asarray(matrice, dtype=np.float64)
+    durata = matrice.shape[-1]
+    forma_batch = np.broadcast_shapes(riga_base.shape[:-1], matrice.shape[:-2])
+
+    risultato = np.empty(forma_batch + (durata + 1, N_RI), dtype=np.float64)
+    iterazioni = np.zeros(forma_batch + (durata,), dtype=np.int64)
+    residuo = np.zeros(forma_batch + (durata,), dtype=np.float64)
+    risultato[..., 0, :] = riga_base
+    for t in range(1, durata + 1):
+        risultato[..., t, :], iterazioni[..., t - 1], residuo[..., t - 1] = _calcola_anno(
+            risultato[..., t - 1, :], matrice[..., :, t - 1], metodo, max_iterazioni, tolleranza)
+    diagnostica = {'iterazioni': iterazioni, 'residuo': residuo, 'convergente': residuo < tolleranza}
+    return risultato, diagnostica
+
+
+def risolvi_oneri_finanziari(lordo_senza_oneri, pfn_senza_utile, tasso_interesse):
+    """
+    Soluzione in forma chiusa di RI13 = tasso * max(PFN media, 0), dove la PFN dipende
+    dall'utile netto e quindi dagli stessi oneri finanziari.
+    lordo_senza_oneri: risultato lordo con RI13 = 0
+    pfn_senza_utile:   PFN precedente + PFN corrente calcolata con utile netto nullo
+    Restituisce NaN dove nessun tratto ammette soluzione (es. tassi >= 200%).
+    """
+    k = np.asarray(lordo_senza_oneri, dtype=np.float64)
+    a = np.asarray(pfn_senza_utile, dtype=np.float64)
+    t = np.asarray(tasso_interesse, dtype=np.float64)
+    quota_netta = 1 - ALIQUOTA_IMPOSTE
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Tratto con risultato lordo positivo (imposte al 28%)
+        r_utile = t * (a - quota_netta * k) / (2 - quota_netta * t)
+        valido_utile = (r_utile < k) & (a - quota_netta * (k - r_utile) > 0)
+        # Tratto con risultato lordo negativo o nullo (nessuna imposta)
+        r_perdita = t * (a - k) / (2 - t)
+        valido_perdita = (r_perdita >= k) & (a - k + r_perdita > 0)
+        # PFN media non positiva: nessun onere
+        netto_senza_oneri = np.where(k > 0, quota_netta * k, k)
+        valido_zero = a - netto_senza_oneri <= 0
+    return np.where(valido_utile, r_utile,
+                    np.where(valido_perdita, r_perdita,
+                             np.where(valido_zero, 0.0, np.nan)))
+
+
+def _calcola_anno(prec: np.ndarray, a: np.ndarray, metodo: str, max_iterazioni: int,
+                  tolleranza: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calcola un anno di proiezione per tutti gli scenari (stesse formule del motore a dizionari).
+    Restituisce (riga dell'anno, iterazioni, residuo finale su RI13).
+    """
+    p = lambda codice: prec[..., IDX_RI[codice]]
+    ass = lambda ass_id: a[..., ass_id]
+
+    curr = np.empty(np.broadcast_shapes(prec.shape, a.shape[:-1] + (N_RI,)), dtype=np.float64)
+    c = {}
+
+    tasso_interesse = ass(11) / 100
+    c['RI01'] = p('RI01') * (1 + ass(0) / 100)
+    rotazione = ass(3)
+    rotazione_valida = rotazione > 0
+    c['RI25'] = np.where(rotazione_valida, c['RI01'] / np.where(rotazione_valida, rotazione, 1.0), p('RI25'))
+    c['RI09'] = c['RI25'] - p('RI25')
+    c['RI02'] = np.zeros_like(c['RI01'])
+    costo_del_venduto = c['RI01'] * (ass(4) / 100)
+    c['RI05'] = costo_del_venduto + c['RI09']
+    c['RI03'] = c['RI01'] * (ass(1) / 100)
+    c['RI04'] = c['RI01'] * (ass(8) / 100)
+    valore_produzione = c['RI01'] + c['RI03'] + c['RI04']
+    c['RI06'] = valore_produzione * (ass(5) / 100)
+    c['RI08'] = valore_produzione * (ass(2) / 100)
+    costi_esterni_operativi = (c['RI05'] + c['RI06'] + c['RI08'])
+    valore_aggiunto = valore_produzione - costi_esterni_operativi + c['RI09']
+    c['RI07'] = ass(13)
+    ebitda = valore_aggiunto - c['RI07']
+    c['RI10'] = valore_produzione * (ass(12) / 100)
+    c['RI12'] = ass(22)
+    investimenti_c = ass(16)
+    investimenti_d = ass(17)
+    ammortamenti_immateriali = (p('RI20') + investimenti_c) * (ass(14) / 100)
+    ammortamenti_materiali = (p('RI21') + investimenti_d) * (ass(15) / 100)
+    c['RI11'] = ammortamenti_immateriali + ammortamenti_materiali
+    ebit = ebitda - c['RI11'] - c['RI10'] - c['RI12']
+    c['RI14'] = ass(23)
+    c['RI15'] = ass(24)
+    c['RI16'] = ass(25)
+    c['RI20'] = p('RI20') + investimenti_c - ammortamenti_immateriali
+    c['RI21'] = p('RI21') + investimenti_d - ammortamenti_materiali
+    c['RI22'] = ass(18)
+    c['RI28'] = ass(19)
+    c['RI29'] = ass(20)
+    c['RI30'] = ass(21)
+    c['RI19'] = p('RI19')
+    c['RI23'] = (valore_produzione * 1.22 * ass(6)) / 365
+    costi_fornitori = c['RI05'] + c['RI06'] + c['RI08']
+    c['RI24'] = (costi_fornitori * 1.22 * ass(7)) / 365
+    c['RI26'] = c['RI23'] * (ass(9) / 100)
+    c['RI27'] = c['RI24'] * (ass(10) / 100)
+
+    ccn = c['RI23'] - c['RI24'] + c['RI25'] + c['RI26'] - c['RI27']
+    immobilizzazioni = c['RI20'] + c['RI21'] + c['RI22']
+    capitale_investito = c['RI19'] + immobilizzazioni + ccn - c['RI28'] - c['RI29'] - c['RI30']
+    pfn_precedente = p('RI33') - p('RI31')
+
+    def voci_finanziarie(ri13):
+        # Parte della proiezione che dipende dagli oneri finanziari (RI13)
+        risultato_lordo = ebit + c['RI14'] - ri13 + c['RI16'] - c['RI15']
+        imposte = np.where(risultato_lordo > 0, risultato_lordo * ALIQUOTA_IMPOSTE, 0.0)
+        risultato_netto = risultato_lordo - imposte
+        patrimonio_netto = p('RI32') + risultato_netto
+        pfn_target = capitale_investito - patrimonio_netto
+        banche = pfn_target + p('RI31')
+        scoperto = banche < 0
+        liquidita = np.where(scoperto, p('RI31') - banche, p('RI31'))
+        banche = np.where(scoperto, 0.0, banche)
+        pfn_corrente = banche - liquidita
+        somma_pfn = pfn_precedente + pfn_corrente
+        pfn_media = np.where(somma_pfn > 0, somma_pfn / 2, 0.0)
+        voci = {'RI17': imposte, 'RI18': risultato_netto, 'RI32': patrimonio_netto, 'RI31': liquidita, 'RI33': banche}
+        return voci, pfn_media * tasso_interesse
+
+    # Punto di partenza: analitico (un solo passaggio) oppure oneri sulla PFN dell'anno precedente
+    ri13_iniziale = p('RI33') * tasso_interesse + np.zeros_like(ebit)
+    iterazioni = np.zeros(ebit.shape, dtype=np.int64)
+    if metodo == 'analitico':
+        lordo_senza_oneri = ebit + c['RI14'] + c['RI16'] - c['RI15']
+        pfn_senza_utile = pfn_precedente + (capitale_investito - p('RI32'))
+        ri13_analitico = risolvi_oneri_finanziari(lordo_senza_oneri, pfn_senza_utile, tasso_interesse)
+        risolto = np.isfinite(ri13_analitico)
+        ri13_iniziale = np.where(risolto, ri13_analitico, ri13_iniziale)
+        _, ri13_verifica = voci_finanziarie(ri13_iniziale)
+        residuo = np.abs(ri13_verifica - ri13_iniziale)
+        iterazioni += 1
+        # Dove la forma chiusa non basta si prosegue con il ciclo a punto fisso
+        attivi = ~(risolto & (residuo < tolleranza))
+    else:
+        residuo = np.full(ebit.shape, np.inf)
+        attivi = np.ones(ebit.shape, dtype=bool)
+
+    # Ciclo sul riferimento circolare oneri finanziari <-> PFN, limitato alle sole voci coinvolte
+    ri13_inizio = ri13_iniziale.copy()
+    ri13_fine = ri13_iniziale.copy()
+    iterazione = 0
+    while attivi.any():
+        iterazione += 1
+        iterazioni += attivi
+        _, ri13_calcolato = voci_finanziarie(ri13_inizio)
+        ri13_fine = np.where(attivi, ri13_calcolato, ri13_fine)
+        residuo = np.where(attivi, np.abs(ri13_calcolato - ri13_inizio), residuo)
+        fermi = attivi & ((residuo < tolleranza) | (iterazione > max_iterazioni))
+        attivi = attivi & ~fermi
+        ri13_inizio = np.where(attivi, ri13_calcolato, ri13_inizio)
+
+    voci, _ = voci_finanziarie(ri13_inizio)
+    c.update(voci)
+    c['RI13'] = ri13_fine
+
+    for codice, valore in c.items():
+        curr[..., IDX_RI[codice]] = valore
+    return curr, iterazioni, residuo
+
+
+class _RigaProiezione(Mapping):
+    """Vista {codice_ri: valore} su una riga della matrice di proiezione"""
+
+    def __init__(self, riga: np.ndarray):
+        self._riga = riga
+
+    def __getitem__(self, codice):
+        return float(self._riga[IDX_RI[codice]])
+
+    def __iter__(self):
+        return iter(CODICI_RI)
+
+    def __len__(self):
+        return N_RI
+
+
+class ProiezioniView(Mapping):
+    """Vista {anno: {codice_ri: valore}} sulla matrice (anni × RI_CODES), compatibile con dati_proiettati"""
+
+    def __init__(self, anni: List[int], matrice: np.ndarray):
+        self.anni = list(anni)
+        self.matrice = matrice
+        self._posizione = {anno: i for i, anno in enumerate(self.anni)}
+
+    def __getitem__(self, anno):
+        return _RigaProiezione(self.matrice[self._posizione[anno]])
+
+    def __iter__(self):
+        return iter(self.anni)
+
+    def __len__(self):
+        return len(self.anni)
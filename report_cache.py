@@ -0,0 +1,153 @@
+# report_cache.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Cache dei dati e dei report calcolati condivisa tra le pagine 4-7.
+# Chiave: (database, cliente, anni, versione dati). La versione (database.versione_dati,
+# basata su PRAGMA data_version) cambia a ogni commit sul database, quindi inserimenti,
+# modifiche e importazioni CSV invalidano la cache senza interventi delle pagine.
+# Passando da una pagina di report all'altra per lo stesso cliente/anni non vengono
+# eseguite query né ricalcoli. Eliminazione LRU con limite di voci e di memoria.
+# I valori restituiti sono condivisi: le pagine non devono modificarli. La dimensione di una
+# voce è misurata all'inserimento; i report formattati non vengono aggiunti dopo (ReportCalcolati.condiviso).
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Tuple
+
+import pandas as pd
+
+import database
+import financial_model
+
+VOCI_MAX = 64
+MEMORIA_MAX_MB = 256
+
+
+def _dimensione(valore) -> int:
+    """Stima in byte dell'occupazione di un valore in cache (DataFrame, dict, tuple, list)"""
+    if isinstance(valore, pd.DataFrame):
+        return int(valore.memory_usage(deep=True).sum())
+    if isinstance(valore, dict):
+        return sum(_dimensione(v) for v in valore.values())
+    if isinstance(valore, (list, tuple)):
+        return sum(_dimensione(v) for v in valore)
+    return 64
+
+
+class CacheLRU:
+    """Cache LRU sicura tra thread, con limite sul numero di voci e sulla memoria stimata"""
+
+    def __init__(self, voci_max: int = VOCI_MAX, memoria_max_mb: float = MEMORIA_MAX_MB):
+        self.voci_max = voci_max
+        self.memoria_max = int(memoria_max_mb * 1024 * 1024)
+        self._voci = OrderedDict()  # chiave -> (valore, dimensione)
+        self._memoria = 0
+        self._versioni = {}  # database -> ultima versione vista
+        self._lock = threading.Lock()
+
+    def ottieni(self, database_chiave: str, versione, chiave: Hashable, calcola: Callable):
+        """Valore in cache per (database, versione, chiave), calcolato con calcola() se assente"""
+        chiave_completa = (database_chiave, versione, chiave)
+        with self._lock:
+            if self._versioni.get(database_chiave) != versione:
+                # Nuova versione dei dati: le voci precedenti di questo database non servono più
+                self._rimuovi(lambda k: k[0] == database_chiave)
+                self._versioni[database_chiave] = versione
+            if chiave_completa in self._voci:
+                self._voci.move_to_end(chiave_completa)
+                return self._voci[chiave_completa][0]
+
+        valore = calcola()  # fuori dal lock: le altre sessioni non restano bloccate
+
+        dimensione = _dimensione(valore)
+        with self._lock:
+            if self._versioni.get(database_chiave) != versione or dimensione > self.memoria_max:
+                return valore  # dati cambiati durante il calcolo o valore troppo grande: non si memorizza
+            if chiave_completa not in self._voci:
+                self._voci[chiave_completa] = (valore, dimensione)
+                self._memoria += dimensione
+            while len(self._voci) > self.voci_max or self._memoria > self.memoria_max:
+                _, (_, dimensione_rimossa) = self._voci.popitem(last=False)
+                self._memoria -= dimensione_rimossa
+        return valore
+
+    def _rimuovi(self, condizione: Callable[[Tuple], bool]) -> None:
+        for chiave in [k for k in self._voci if condizione(k)]:
+            self._memoria -= self._voci.pop(chiave)[1]
+
+    def invalida(self, database_chiave: str = None) -> None:
+        """Svuota la cache di un database (o tutta)"""
+        with self._lock:
+            if database_chiave is None:
+                self._voci.clear()
+                self._versioni.clear()
+                self._memoria = 0
+            else:
+                self._rimuovi(lambda k: k[0] == database_chiave)
+                self._versioni.pop(database_chiave, None)
+
+    def statistiche(self) -> Dict:
+        with self._lock:
+            return {'voci': len(self._voci), 'memoria_mb': self._memoria / (1024 * 1024)}
+
+
+_CACHE = CacheLRU()
+
+
+def _ottieni(percorso_db: str, chiave: Hashable, calcola: Callable):
+    return _CACHE.ottieni(os.path.abspath(percorso_db), database.versione_dati(percorso_db), chiave, calcola)
+
+
+def _chiave_anni(years_to_display) -> Tuple[int, ...]:
+    return tuple(int(y) for y in years_to_display)
+
+
+def dati_cliente(percorso_db: str, cliente: str, years_to_display) -> pd.DataFrame:
+    """Totali per (anno, ID_RI) del cliente (financial_model.carica_totali_id_ri), dalla cache se possibile"""
+    anni = _chiave_anni(years_to_display)
+
+    def carica():
+        with database.connessione(percorso_db) as conn:
+            return financial_model.carica_totali_id_ri(conn, anni, cliente)
+
+    return _ottieni(percorso_db, ('dati', cliente, anni), carica)
+
+
+def report_cliente(percorso_db: str, cliente: str, years_to_display) -> Dict:
+    """Risultato di financial_model.calculate_all_reports (CE, SP, flussi) per cliente e anni"""
+    anni = _chiave_anni(years_to_display)
+
+    def calcola():
+        report = financial_model.calculate_all_reports(
+            dati_cliente(percorso_db, cliente, anni).copy(), list(anni),
+            financial_model.report_structure_ce, financial_model.report_structure_sp, financial_model.report_structure_ff)
+        if isinstance(report, financial_model.ReportCalcolati):
+            report.condiviso = True  # 'ce'/'sp'/'ff' formattati a ogni accesso, non aggiunti alla voce in cache
+        return report
+
+    return _ottieni(percorso_db, ('report', cliente, anni), calcola)
+
+
+def report_numerici(percorso_db: str, cliente: str, years_to_display) -> Dict:
+    """Come financial_model.calculate_reports_numeric, ricavato dai report in cache"""
+    report = report_cliente(percorso_db, cliente, years_to_display)
+    numerici = {chiave: report[f"{chiave}_export"] for chiave in ('ce', 'sp', 'ff')}
+    if 'error' in report:
+        numerici['error'] = report['error']
+    return numerici
+
+
+def flussi_coppie(percorso_db: str, cliente: str, years_to_display) -> Tuple[pd.DataFrame, List[Tuple[int, int]]]:
+    """Risultato di financial_model.calculate_flows_all_pairs per cliente e anni"""
+    anni = _chiave_anni(years_to_display)
+
+    def calcola():
+        return financial_model.calculate_flows_all_pairs(
+            dati_cliente(percorso_db, cliente, anni).copy(), list(anni),
+            financial_model.report_structure_ce, financial_model.report_structure_sp, financial_model.report_structure_ff)
+
+    return _ottieni(percorso_db, ('flussi', cliente, anni), calcola)
+
+
+def invalida(percorso_db: str = None) -> None:
+    """Invalidazione esplicita (normalmente non serve: ogni commit cambia la versione dei dati)"""
+    _CACHE.invalida(os.path.abspath(percorso_db) if percorso_db else None)
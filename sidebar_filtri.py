@@ -1,20 +1,17 @@
 # sidebar_filtri.py - Progetto Business Plan Pro - versione aggiornata
 # Sidebar con persistenza filtri e migliorata reattività 
+# MODIFICA 2026-10-17: connessioni dal pool condiviso (database.py), database utente letto a ogni esecuzione
+# MODIFICA 2026-10-17: clienti, anni e sezioni da metadati_filtri (una query, in memoria finché i dati non cambiano)
+# MODIFICA 2026-10-17: tolto DATABASE_NAME calcolato all'import (legato alla prima sessione che importava il modulo)
 
 import streamlit as st
-import sqlite3
-import pandas as pd
+import database
+import metadati_filtri
 
 # AGGIUNTO: Funzione per database utente
 def get_database_name():
     """Restituisce il database dell'utente corrente"""
-    username = st.session_state.get('username')
-    if username:
-        return f"business_plan_{username}.db"
-    return "business_plan_pro.db"
-
-# MODIFICATO: Ora usa database utente
-DATABASE_NAME = get_database_name()
+    return database.database_utente(st.session_state.get('username'))
 
 def display_sidebar_filters():
     """
@@ -36,12 +33,11 @@ def display_sidebar_filters():
     # Sezione Cliente
     st.sidebar.subheader("👤 Cliente")
     
+    metadati = None
     try:
-        # MODIFICATO: Usa DATABASE_NAME che ora punta al database utente
-        conn = sqlite3.connect(DATABASE_NAME)
-        df_clienti = pd.read_sql_query("SELECT DISTINCT cliente FROM righe ORDER BY cliente", conn)
-        clienti_list = ['Tutti'] + df_clienti['cliente'].tolist()
-        conn.close()
+        # MODIFICATO: metadati dei filtri del database dell'utente corrente (una query, poi in memoria)
+        metadati = metadati_filtri.metadati_filtri(get_database_name())
+        clienti_list = ['Tutti'] + metadati.clienti
         
         # Trova l'indice del cliente attualmente selezionato
         current_cliente_index = 0
@@ -69,25 +65,12 @@ def display_sidebar_filters():
     # Sezione Anno con migliorata reattività 
     st.sidebar.subheader("📅 Anno")
     
+    anni_disponibili = []
     try:
-        # MODIFICATO: Usa DATABASE_NAME che ora punta al database utente
-        conn = sqlite3.connect(DATABASE_NAME)
-        
-        # Query condizionale per anni in base al cliente selezionato
-        if st.session_state.selected_cliente == 'Tutti':
-            df_anni = pd.read_sql_query(
-                "SELECT DISTINCT anno FROM righe ORDER BY anno DESC", 
-                conn
-            )
-        else:
-            df_anni = pd.read_sql_query(
-                "SELECT DISTINCT anno FROM righe WHERE cliente = ? ORDER BY anno DESC", 
-                conn, 
-                params=[st.session_state.selected_cliente]
-            )
-        
-        anni_disponibili = [str(anno) for anno in df_anni['anno'].tolist()]
-        conn.close()
+        if metadati is None:
+            raise RuntimeError("metadati dei filtri non disponibili")
+        # Anni in base al cliente selezionato ('Tutti' = tutti i clienti)
+        anni_disponibili = metadati.anni(st.session_state.selected_cliente)
         
         if anni_disponibili:
             # Filtra gli anni selezionati per mantenere solo quelli disponibili
@@ -133,24 +116,10 @@ def display_sidebar_filters():
     st.sidebar.subheader("📋 Sezione")
     
     try:
-        # MODIFICATO: Usa DATABASE_NAME che ora punta al database utente
-        conn = sqlite3.connect(DATABASE_NAME)
-        
-        # Query per sezioni
-        if st.session_state.selected_cliente == 'Tutti':
-            df_sezioni = pd.read_sql_query(
-                "SELECT DISTINCT c.Sezione FROM conti c JOIN righe r ON c.id_co = r.Id_co ORDER BY c.Sezione", 
-                conn
-            )
-        else:
-            df_sezioni = pd.read_sql_query(
-                "SELECT DISTINCT c.Sezione FROM conti c JOIN righe r ON c.id_co = r.Id_co WHERE r.cliente = ? ORDER BY c.Sezione", 
-                conn, 
-                params=[st.session_state.selected_cliente]
-            )
-        
-        sezioni_list = ['Tutte'] + df_sezioni['Sezione'].tolist()
-        conn.close()
+        if metadati is None:
+            raise RuntimeError("metadati dei filtri non disponibili")
+        # Sezioni dei conti usati dal cliente selezionato
+        sezioni_list = ['Tutte'] + metadati.sezioni(st.session_state.selected_cliente)
         
         # Trova l'indice della sezione attualmente selezionata
         current_sezione_index = 0
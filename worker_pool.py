@@ -0,0 +1,393 @@
+# worker_pool.py - Progetto Business Plan Pro - versione 1.0 - 2026-10-17
+# Pool di processi locale per i calcoli pesanti: proiezioni del Business Plan (con avanzamento
+# e annullamento), lotti Monte Carlo ed export grandi (export_service, da RIGHE_MIN_POOL righe).
+# I report (calculate_all_reports, pochi ms) restano nel processo del server con la loro cache.
+# Le sessioni Streamlit sono thread dello stesso processo: un calcolo lungo eseguito nello
+# script di una sessione contende il GIL a tutte le altre. Qui i lavori girano in processi
+# separati, condivisi da tutte le sessioni, e il processo del server resta libero di
+# rispondere: la pagina invia il lavoro (invia), ne legge stato e avanzamento (stato) a ogni
+# aggiornamento e ritira il risultato (risultato) quando è concluso.
+# Il server non avvia mai processi 'spawn' (che rieseguirebbero la pagina, il suo __main__):
+# al primo lavoro lancia con subprocess il processo ospite avvio_lavori.py, che crea una sola
+# volta contesto 'spawn', dizionario condiviso e pool (PoolLavori) e li espone al server con
+# un BaseManager su localhost; le funzioni di questo modulo parlano con l'ospite tramite proxy.
+# Avanzamento e richieste di annullamento passano per un dizionario condiviso
+# (multiprocessing.Manager): il lavoro chiama progresso(), che aggiorna la percentuale e
+# solleva LavoroAnnullato se la pagina ha chiesto di fermarlo. Un lavoro in coda viene
+# annullato subito; uno già in corso si ferma alla chiamata successiva di progresso() (se
+# non ne fa, il suo risultato viene scartato).
+# Le funzioni inviate devono essere definite in un modulo importabile (non nelle pagine) e
+# argomenti e risultati devono essere serializzabili (pickle): per questo il calcolo riceve
+# un ContestoCalcolo e non legge la sessione Streamlit.
+# Se l'ospite non è disponibile (eseguibile PyInstaller, PROCESSI_MAX = 0 o errore all'avvio)
+# i lavori girano in un pool di thread del server con la stessa interfaccia.
+
+import itertools
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import BaseManager
+from typing import Callable, Dict, Optional
+
+# Processi di calcolo: un core resta al server Streamlit
+PROCESSI_MAX = max(1, min(4, (os.cpu_count() or 2) - 1))
+# Lavori conclusi conservati nel registro in attesa che la pagina ne ritiri il risultato
+LAVORI_CONCLUSI_MAX = 64
+
+IN_CODA = 'in_coda'
+IN_CORSO = 'in_corso'
+COMPLETATO = 'completato'
+ERRORE = 'errore'
+ANNULLATO = 'annullato'
+CONCLUSI = (COMPLETATO, ERRORE, ANNULLATO)
+
+
+class LavoroAnnullato(Exception):
+    """Il lavoro è stato annullato su richiesta della pagina"""
+
+
+# --- Lato lavoro (processo di calcolo o thread di riserva) ---
+
+_corrente = threading.local()  # id, avanzamento e annullati del lavoro in esecuzione nel thread
+
+
+def _esegui_lavoro(id_lavoro: int, avanzamento, annullati, funzione: Callable, args, kwargs):
+    """Eseguita nel processo di calcolo: rende disponibile progresso() alla funzione del lavoro"""
+    _corrente.lavoro = (id_lavoro, avanzamento, annullati)
+    try:
+        if annullati.get(id_lavoro):
+            raise LavoroAnnullato()
+        avanzamento[id_lavoro] = (0.0, "Avviato")
+        return funzione(*args, **kwargs)
+    finally:
+        _corrente.lavoro = None
+
+
+def progresso(frazione: float, messaggio: str = "") -> None:
+    """
+    Da chiamare dentro un lavoro nei punti in cui può fermarsi: aggiorna l'avanzamento
+    (0-1) e solleva LavoroAnnullato se è stato chiesto l'annullamento. Fuori da un lavoro
+    (chiamata diretta, script batch) non fa nulla.
+    """
+    lavoro = getattr(_corrente, 'lavoro', None)
+    if lavoro is None:
+        return
+    id_lavoro, avanzamento, annullati = lavoro
+    if annullati.get(id_lavoro):
+        raise LavoroAnnullato()
+    avanzamento[id_lavoro] = (max(0.0, min(1.0, float(frazione))), messaggio)
+
+
+# --- Registro dei lavori (processo ospite o thread di riserva nel server) ---
+
+class _Lavoro:
+    """Voce del registro: future del pool e dati per la pagina"""
+
+    def __init__(self, id_lavoro: int, descrizione: str, future: Future):
+        self.id = id_lavoro
+        self.descrizione = descrizione
+        self.future = future
+        self.avviato = time.monotonic()
+        self.concluso = None
+        self.annullato = False
+        self.ritirato = False  # la pagina ha già chiesto il risultato: si elimina alla conclusione
+
+
+class PoolLavori:
+    """Pool di processi con registro dei lavori, avanzamento e annullamento; sicuro tra thread"""
+
+    def __init__(self, processi: int = PROCESSI_MAX, in_processi: bool = True):
+        self.processi = processi
+        self._usa_processi = in_processi
+        self._esecutore = None
+        self._manager = None
+        self._avanzamento = None  # id -> (frazione, messaggio), condiviso con i processi
+        self._annullati = None    # id -> True, condiviso con i processi
+        self._lavori = OrderedDict()  # id -> _Lavoro
+        self._contatore = itertools.count(1)
+        self._lock = threading.RLock()  # rientrante: future.cancel() chiama subito _concluso
+
+    @property
+    def in_processi(self) -> bool:
+        """True se i lavori girano in processi separati (False: pool di thread di riserva)"""
+        return isinstance(self._esecutore, ProcessPoolExecutor)
+
+    def avvia(self) -> None:
+        """
+        Crea contesto 'spawn', dizionario condiviso e pool (una volta, nel processo ospite);
+        in caso di errore ripiega sui thread
+        """
+        with self._lock:
+            if self._esecutore is not None:
+                return
+            if self.processi > 0 and self._usa_processi:
+                try:
+                    contesto = multiprocessing.get_context('spawn')
+                    self._manager = contesto.Manager()
+                    self._avanzamento = self._manager.dict()
+                    self._annullati = self._manager.dict()
+                    self._esecutore = ProcessPoolExecutor(max_workers=self.processi, mp_context=contesto)
+                    return
+                except (OSError, RuntimeError) as e:
+                    print(f"⚠️ Pool di processi non disponibile, calcolo nei thread: {e}")
+                    self._chiudi_manager()
+            self._avanzamento, self._annullati = {}, {}
+            self._esecutore = ThreadPoolExecutor(max_workers=max(1, self.processi), thread_name_prefix='lavoro')
+
+    def _chiudi_manager(self) -> None:
+        if self._manager is not None:
+            try:
+                self._manager.shutdown()
+            except Exception:
+                pass
+        self._manager = None
+
+    def invia(self, funzione: Callable, *args, descrizione: str = "", **kwargs) -> int:
+        """Mette in coda funzione(*args, **kwargs) e restituisce l'id del lavoro"""
+        with self._lock:
+            self.avvia()
+            id_lavoro = next(self._contatore)
+            try:
+                future = self._sottometti(id_lavoro, funzione, args, kwargs)
+            except BrokenProcessPool:
+                # Un processo di calcolo è terminato in modo anomalo: si ricrea il pool
+                self._esecutore.shutdown(wait=False, cancel_futures=True)
+                self._esecutore = None
+                self._chiudi_manager()
+                self.avvia()
+                future = self._sottometti(id_lavoro, funzione, args, kwargs)
+            self._lavori[id_lavoro] = _Lavoro(id_lavoro, descrizione or getattr(funzione, '__name__', ''), future)
+            self._pulisci()
+        future.add_done_callback(lambda _: self._concluso(id_lavoro))
+        return id_lavoro
+
+    def _sottometti(self, id_lavoro: int, funzione: Callable, args, kwargs) -> Future:
+        return self._esecutore.submit(_esegui_lavoro, id_lavoro, self._avanzamento, self._annullati,
+                                      funzione, args, kwargs)
+
+    def _concluso(self, id_lavoro: int) -> None:
+        with self._lock:
+            lavoro = self._lavori.get(id_lavoro)
+            if lavoro is not None and lavoro.concluso is None:
+                lavoro.concluso = time.monotonic()
+                if lavoro.ritirato:
+                    self._elimina(id_lavoro)
+            self._pulisci()
+
+    def _pulisci(self) -> None:
+        """Elimina i lavori conclusi più vecchi oltre LAVORI_CONCLUSI_MAX (da chiamare con il lock)"""
+        conclusi = [id_lavoro for id_lavoro, lavoro in self._lavori.items() if lavoro.future.done()]
+        for id_lavoro in conclusi[:max(0, len(conclusi) - LAVORI_CONCLUSI_MAX)]:
+            self._elimina(id_lavoro)
+
+    def _elimina(self, id_lavoro: int) -> None:
+        self._lavori.pop(id_lavoro, None)
+        for condiviso in (self._avanzamento, self._annullati):
+            try:
+                condiviso.pop(id_lavoro, None)
+            except Exception:  # Manager già chiuso (uscita dal programma)
+                pass
+
+    def _stato_future(self, lavoro: _Lavoro) -> str:
+        if lavoro.annullato or lavoro.future.cancelled():
+            return ANNULLATO
+        if not lavoro.future.done():
+            return IN_CORSO if lavoro.future.running() else IN_CODA
+        errore = lavoro.future.exception()
+        if isinstance(errore, LavoroAnnullato):
+            return ANNULLATO
+        return ERRORE if errore is not None else COMPLETATO
+
+    def stato(self, id_lavoro: int) -> Optional[Dict]:
+        """
+        Stato del lavoro per la pagina: {'stato', 'progresso' (0-1), 'messaggio', 'errore',
+        'descrizione', 'secondi'}; None se l'id non è (più) nel registro
+        """
+        with self._lock:
+            lavoro = self._lavori.get(id_lavoro)
+        if lavoro is None:
+            return None
+        stato = self._stato_future(lavoro)
+        frazione, messaggio = self._avanzamento.get(id_lavoro, (0.0, ""))
+        if stato == COMPLETATO:
+            frazione = 1.0
+        errore = lavoro.future.exception() if stato == ERRORE else None
+        fine = lavoro.concluso or time.monotonic()
+        return {'stato': stato, 'progresso': frazione, 'messaggio': messaggio,
+                'errore': str(errore) if errore is not None else None,
+                'descrizione': lavoro.descrizione, 'secondi': fine - lavoro.avviato}
+
+    def annulla(self, id_lavoro: int) -> bool:
+        """Chiede l'annullamento; True se il lavoro non era ancora concluso"""
+        with self._lock:
+            lavoro = self._lavori.get(id_lavoro)
+            if lavoro is None or lavoro.future.done():
+                return False
+            lavoro.annullato = True
+            if not lavoro.future.cancel():
+                self._annullati[id_lavoro] = True  # in corso: si ferma al prossimo progresso()
+            return True
+
+    def risultato(self, id_lavoro: int, timeout: Optional[float] = None, rimuovi: bool = True):
+        """
+        Risultato del lavoro (attende al massimo timeout secondi). Solleva l'eccezione del
+        lavoro, LavoroAnnullato se annullato, KeyError se l'id non è nel registro.
+        Con rimuovi=True il lavoro concluso esce dal registro.
+        """
+        with self._lock:
+            lavoro = self._lavori.get(id_lavoro)
+        if lavoro is None:
+            raise KeyError(f"Lavoro {id_lavoro} non trovato")
+        try:
+            if lavoro.annullato:
+                raise LavoroAnnullato()
+            try:
+                valore = lavoro.future.result(timeout)
+            except CancelledError:
+                raise LavoroAnnullato() from None
+            if lavoro.annullato:  # annullato mentre era in corso senza punti di arresto
+                raise LavoroAnnullato()
+            return valore
+        finally:
+            if rimuovi:
+                with self._lock:
+                    lavoro.ritirato = True
+                    if lavoro.future.done():
+                        self._elimina(id_lavoro)
+
+    def lavori(self) -> Dict[int, Dict]:
+        """Stato di tutti i lavori nel registro (per diagnostica)"""
+        with self._lock:
+            ids = list(self._lavori)
+        return {id_lavoro: info for id_lavoro in ids if (info := self.stato(id_lavoro)) is not None}
+
+    def chiudi(self, attendi: bool = True) -> None:
+        """Ferma il pool (annullando i lavori in coda) e il dizionario condiviso"""
+        with self._lock:
+            esecutore, self._esecutore = self._esecutore, None
+        # fuori dal lock: alla chiusura le future concluse chiamano _concluso da altri thread
+        if esecutore is not None:
+            esecutore.shutdown(wait=attendi, cancel_futures=True)
+        with self._lock:
+            self._chiudi_manager()
+
+
+# --- Lato server (pagine): proxy del registro nel processo ospite ---
+
+METODI_POOL = ('invia', 'stato', 'annulla', 'risultato', 'lavori')
+# Attesa massima dell'indirizzo dell'ospite all'avvio (import di Python e del modulo)
+ATTESA_OSPITE_SECONDI = 30
+
+
+class GestorePool(BaseManager):
+    """Collegamento al PoolLavori del processo ospite (che registra il tipo 'pool' con il proprio registro)"""
+
+
+GestorePool.register('pool', exposed=METODI_POOL)
+
+_lock_pool = threading.Lock()
+_POOL = None     # proxy del PoolLavori nell'ospite, o PoolLavori di thread di riserva
+_OSPITE = None   # subprocess.Popen del processo ospite
+
+
+def _avvia_ospite():
+    """Lancia avvio_lavori come modulo principale di un nuovo interprete e si collega al suo registro"""
+    cartella = os.path.dirname(os.path.abspath(__file__))
+    ambiente = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [cartella, os.environ.get('PYTHONPATH')])))
+    ospite = subprocess.Popen([sys.executable, '-m', 'avvio_lavori', str(PROCESSI_MAX)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=ambiente)
+    try:
+        chiave = os.urandom(16)
+        ospite.stdin.write(chiave.hex().encode() + b'\n')
+        ospite.stdin.flush()  # stdin resta aperto: alla sua chiusura (uscita del server) l'ospite termina
+        righe = []  # "host:porta" letto in un thread, per non attendere oltre ATTESA_OSPITE_SECONDI
+        lettura = threading.Thread(target=lambda: righe.append(ospite.stdout.readline()), daemon=True)
+        lettura.start()
+        lettura.join(ATTESA_OSPITE_SECONDI)
+        indirizzo = righe[0].decode().strip() if righe else ''
+        if not indirizzo:
+            raise RuntimeError(f"processo ospite non avviato (codice di uscita {ospite.poll()})")
+        ospite.stdout.close()
+        host, porta = indirizzo.rsplit(':', 1)
+        gestore = GestorePool(address=(host, int(porta)), authkey=chiave)
+        gestore.connect()
+        return ospite, gestore.pool()
+    except Exception:
+        ospite.stdin.close()
+        ospite.kill()
+        raise
+
+
+def _pool(riavvia: bool = False):
+    """Registro dei lavori: l'ospite è avviato al primo uso (o dopo la sua terminazione)"""
+    global _POOL, _OSPITE
+    with _lock_pool:
+        if riavvia and _OSPITE is not None:
+            _OSPITE.stdin.close()  # se ancora attivo, l'ospite chiude il pool ed esce
+            _POOL = _OSPITE = None
+        if _POOL is None:
+            if PROCESSI_MAX > 0 and not getattr(sys, 'frozen', False):
+                try:
+                    _OSPITE, _POOL = _avvia_ospite()
+                except (OSError, RuntimeError, ValueError) as e:
+                    print(f"⚠️ Pool di processi non disponibile, calcolo nei thread: {e}")
+            if _POOL is None:
+                _POOL = PoolLavori(in_processi=False)
+        return _POOL
+
+
+def invia(funzione: Callable, *args, descrizione: str = "", **kwargs) -> int:
+    try:
+        return _pool().invia(funzione, *args, descrizione=descrizione, **kwargs)
+    except (ConnectionError, EOFError):
+        # ospite terminato (chiuso o in errore): se ne avvia uno nuovo
+        return _pool(riavvia=True).invia(funzione, *args, descrizione=descrizione, **kwargs)
+
+
+def stato(id_lavoro: int) -> Optional[Dict]:
+    try:
+        return _pool().stato(id_lavoro)
+    except (ConnectionError, EOFError):
+        return None  # ospite terminato: il lavoro è perso
+
+
+def annulla(id_lavoro: int) -> bool:
+    try:
+        return _pool().annulla(id_lavoro)
+    except (ConnectionError, EOFError):
+        return False
+
+
+def risultato(id_lavoro: int, timeout: Optional[float] = None, rimuovi: bool = True):
+    return _pool().risultato(id_lavoro, timeout, rimuovi)
+
+
+def in_processi() -> bool:
+    """True se i lavori girano in processi separati (False: pool di thread di riserva nel server)"""
+    return not isinstance(_pool(), PoolLavori)
+
+
+def lavori() -> Dict[int, Dict]:
+    return _pool().lavori()
+
+
+# --- Lavori delle pagine (moduli importati nel processo di calcolo, non all'avvio della pagina) ---
+
+def proiezioni_business_plan(cliente: str, anno_base: int, durata: int, assumptions, dati_storici: Dict,
+                             metodo_pfn: str = 'analitico', motore: str = 'numpy'):
+    """BusinessPlanProjections inizializzato con i dati storici e con le proiezioni calcolate"""
+    from business_plan_projections import BusinessPlanProjections
+    progresso(0.1, "Inizializzazione con i dati storici")
+    bp_projections = BusinessPlanProjections(cliente, anno_base, durata, assumptions=assumptions,
+                                             metodo_pfn=metodo_pfn, contesto=assumptions.contesto)
+    bp_projections.inizializza_con_dati_storici(dati_storici)
+    progresso(0.3, f"Proiezioni {bp_projections.anni_bp[1]}-{bp_projections.anni_bp[-1]}")
+    bp_projections.calcola_proiezioni(motore=motore)
+    progresso(1.0, "Completato")
+    return bp_projections